@@ -0,0 +1,57 @@
+"""Collision check for the booking ID allocator.
+
+Starts several processes that each import the app and use its booking_ids generator, so
+every process gets its worker id from the default allocator (the host-wide lease), as uvicorn
+workers do. Each generates IDs as fast as it can; the IDs must be unique overall and
+increasing within each process. --start-method fork covers workers forked from a parent
+that already holds a lease (gunicorn --preload).
+
+    python benchmarks/booking_ids.py --processes 8 --ids 500000
+"""
+import argparse
+import multiprocessing
+import os
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault("NEON_DB_URI", f"sqlite:///{tempfile.mkdtemp()}/bench.db")
+os.environ.setdefault("GEMINI_API_KEY", "bench")
+os.environ.pop("BOOKING_WORKER_ID", None)
+
+import main  # noqa: E402
+
+
+def generate(count: int) -> tuple[int, list[str]]:
+    return main.booking_ids.worker_id, [main.booking_ids.next_id() for _ in range(count)]
+
+
+def main_bench():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--processes", type=int, default=8)
+    parser.add_argument("--ids", type=int, default=500_000, help="IDs per process")
+    parser.add_argument("--start-method", choices=["spawn", "fork"], default="spawn")
+    args = parser.parse_args()
+
+    start = time.perf_counter()
+    # One task per process, all processes alive together, so every lease is held at once
+    with multiprocessing.get_context(args.start_method).Pool(args.processes, maxtasksperchild=1) as pool:
+        results = pool.map(generate, [args.ids] * args.processes, chunksize=1)
+    elapsed = time.perf_counter() - start
+    worker_ids = [worker_id for worker_id, _ in results]
+    batches = [batch for _, batch in results]
+
+    total = sum(len(batch) for batch in batches)
+    unique = len(set().union(*batches))
+    ordered = all(batch == sorted(batch) for batch in batches)
+    print(f"generated:   {total} IDs in {args.processes} processes ({total / elapsed:,.0f} IDs/s)")
+    print(f"worker ids:  {sorted(worker_ids)} (parent {main.booking_ids.worker_id})")
+    print(f"collisions:  {total - unique}")
+    print(f"ordered:     {ordered}")
+    print(f"sample:      {batches[0][0]} .. {batches[-1][-1]}")
+    sys.exit(0 if unique == total and ordered else 1)
+
+
+if __name__ == "__main__":
+    main_bench()
@@ -0,0 +1,63 @@
+"""Bulk import benchmark: load a synthetic schedule through import_flights.
+
+Runs with the schedule snapshot and its change poller on, as the app does by default (set
+SCHEDULE_SNAPSHOT_ENABLED=false to compare); the times include the snapshot rebuild.
+
+    python benchmarks/bulk_import.py --flights 100000 --seats 6
+"""
+import argparse
+import asyncio
+import os
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault("NEON_DB_URI", f"sqlite:///{tempfile.mkdtemp()}/bench.db")
+os.environ.setdefault("GEMINI_API_KEY", "bench")
+
+from sqlalchemy import func, select  # noqa: E402
+
+import main  # noqa: E402
+from main import AsyncSessionLocal, Flight, FlightSeat, import_flights, schedule_store, startup_event  # noqa: E402
+
+
+def synthetic_schedule(flights: int, seats: int) -> list[dict]:
+    seat_numbers = ",".join(f"{row}{letter}" for row in range(1, seats // 6 + 2) for letter in "ABCDEF").split(",")[:seats]
+    return [{
+        "flight_number": f"SY{i}",
+        "departure": f"City{i % 97} C{i % 97:02d}",
+        "arrival": f"City{(i * 7 + 1) % 97} A{(i * 7 + 1) % 97:02d}",
+        "departure_time": "2025-07-01 08:00",
+        "arrival_time": "2025-07-01 10:00",
+        "price": 100 + i % 400,
+        "available_seats": ",".join(seat_numbers),
+    } for i in range(flights)]
+
+
+async def main_bench():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--flights", type=int, default=100_000)
+    parser.add_argument("--seats", type=int, default=6)
+    args = parser.parse_args()
+
+    await startup_event()
+    rows = synthetic_schedule(args.flights, args.seats)
+    async with AsyncSessionLocal() as db:
+        for label in ("insert", "upsert"):
+            start = time.perf_counter()
+            report = await import_flights(db, rows)
+            elapsed = time.perf_counter() - start
+            print(f"{label}: {report['inserted']} inserted, {report['updated']} updated, {report['failed']} failed "
+                  f"in {elapsed:.2f}s ({args.flights / elapsed:,.0f} flights/s)")
+        flights = (await db.execute(select(func.count(Flight.id)))).scalar_one()
+        seats = (await db.execute(select(func.count(FlightSeat.id)))).scalar_one()
+    print(f"rows: {flights} flights, {seats} seats")
+    if main.SCHEDULE_SNAPSHOT_ENABLED:
+        stats = schedule_store.stats
+        print(f"snapshot: {len(schedule_store.snapshot.flights)} flights, {stats['full_rebuilds']} full rebuilds, "
+              f"{stats['flight_reloads']} flight reloads, last rebuild {stats['last_rebuild_ms']:.0f} ms")
+
+
+if __name__ == "__main__":
+    asyncio.run(main_bench())
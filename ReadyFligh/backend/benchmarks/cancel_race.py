@@ -0,0 +1,143 @@
+"""Concurrency check for cancel_booking: cancels racing each other and racing new bookings.
+
+Fills a flight, then cancels every booking --repeats times in parallel while --bookers new
+passengers try to book the freed seats. Checks that each booking is cancelled exactly
+once, that no seat is lost or sold twice, and compares cancel latency with the old
+read-then-write path (booking query, flight query, seat release, commit).
+
+    python benchmarks/cancel_race.py --seats 120 --repeats 3 --bookers 80
+"""
+import argparse
+import asyncio
+import os
+import statistics
+import sys
+import tempfile
+import time
+import uuid
+from collections import Counter
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault("NEON_DB_URI", f"sqlite:///{tempfile.mkdtemp()}/bench.db?timeout=60")
+os.environ.setdefault("GEMINI_API_KEY", "bench")
+
+from sqlalchemy import func, select  # noqa: E402
+
+from main import (  # noqa: E402
+    AsyncSessionLocal, Booking, Flight, FlightSeat, SEAT_AVAILABLE, SEAT_BOOKED, cancel_booking, release_seat, startup_event,
+)
+from seat_inventory import book_one, setup_flight  # noqa: E402
+
+
+async def booking_ids(flight_number: str) -> list[str]:
+    async with AsyncSessionLocal() as db:
+        return list((await db.execute(
+            select(Booking.booking_id).where(Booking.flight_number == flight_number, Booking.booked == True)
+        )).scalars())
+
+
+async def timed_cancel(booking_id: str) -> tuple[str, float]:
+    start = time.perf_counter()
+    async with AsyncSessionLocal() as db:
+        outcome, _ = await cancel_booking(db, booking_id)
+    return outcome, time.perf_counter() - start
+
+
+async def legacy_cancel(booking_id: str) -> float:
+    """The previous cancel_booking_tool body, kept here for the latency comparison."""
+    start = time.perf_counter()
+    async with AsyncSessionLocal() as db:
+        booking = (await db.execute(select(Booking).where(Booking.booking_id == booking_id))).scalars().first()
+        flight = (await db.execute(select(Flight).where(Flight.flight_number == booking.flight_number))).scalars().first()
+        if flight and booking.booked:
+            await release_seat(db, booking.flight_number, booking.available_seat, booking_id)
+        booking.booked = False
+        await db.commit()
+    return time.perf_counter() - start
+
+
+async def check_inventory(flight_number: str, seats: int) -> list[str]:
+    """Invariants that must hold once every task has finished; returns the violations."""
+    async with AsyncSessionLocal() as db:
+        states = dict((await db.execute(
+            select(FlightSeat.state, func.count(FlightSeat.id)).where(FlightSeat.flight_number == flight_number).group_by(FlightSeat.state)
+        )).all())
+        confirmed = (await db.execute(select(Booking.booking_id, Booking.available_seat).where(
+            Booking.flight_number == flight_number, Booking.booked == True))).all()
+        holders = dict((await db.execute(select(FlightSeat.seat_number, FlightSeat.booking_id).where(
+            FlightSeat.flight_number == flight_number, FlightSeat.state == SEAT_BOOKED))).all())
+
+    problems = []
+    if states.get(SEAT_AVAILABLE, 0) + states.get(SEAT_BOOKED, 0) != seats:
+        problems.append(f"seat rows {states} do not add up to {seats}")
+    duplicated = [seat for seat, count in Counter(seat for _, seat in confirmed).items() if count > 1]
+    if duplicated:
+        problems.append(f"seats sold twice: {duplicated}")
+    if len(confirmed) != len(holders):
+        problems.append(f"{len(confirmed)} confirmed bookings but {len(holders)} booked seats")
+    stray = [seat for booking_id, seat in confirmed if holders.get(seat) != booking_id]
+    if stray:
+        problems.append(f"bookings whose seat is not held for them: {stray[:5]}")
+    return problems
+
+
+def ms(values: list[float], q: float) -> float:
+    return sorted(values)[min(len(values) - 1, int(len(values) * q))] * 1000
+
+
+async def main_bench():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--seats", type=int, default=120)
+    parser.add_argument("--repeats", type=int, default=3, help="concurrent cancels per booking")
+    parser.add_argument("--bookers", type=int, default=80, help="new bookings racing the cancels")
+    args = parser.parse_args()
+
+    await startup_event()
+
+    # Race: every booking cancelled --repeats times while new passengers book
+    flight_number = f"CX{uuid.uuid4().hex[:6]}"
+    await setup_flight(flight_number, args.seats)
+    await asyncio.gather(*(book_one(flight_number, f"Passenger {i}") for i in range(args.seats)))
+    originals = await booking_ids(flight_number)
+
+    tasks = [timed_cancel(booking_id) for booking_id in originals for _ in range(args.repeats)]
+    tasks += [book_one(flight_number, f"Newcomer {i}") for i in range(args.bookers)]
+    start = time.perf_counter()
+    results = await asyncio.gather(*tasks)
+    elapsed = time.perf_counter() - start
+
+    cancels = results[:len(originals) * args.repeats]
+    outcomes = Counter(outcome for outcome, _ in cancels)
+    rebooked = sum(1 for seat in results[len(cancels):] if seat)
+    problems = await check_inventory(flight_number, args.seats)
+    if outcomes["cancelled"] != len(originals):
+        problems.append(f"{outcomes['cancelled']} successful cancels for {len(originals)} bookings")
+    async with AsyncSessionLocal() as db:
+        if (await cancel_booking(db, "RF-NO-SUCH-BOOKING"))[0] != "not_found":
+            problems.append("unknown booking id was not reported as not_found")
+
+    # Latency: the new single-statement cancel vs the old read-then-write path, one at a time
+    latency = {}
+    for name, cancel in (("atomic", timed_cancel), ("legacy", legacy_cancel)):
+        timing_flight = f"CT{uuid.uuid4().hex[:6]}"
+        await setup_flight(timing_flight, args.seats)
+        await asyncio.gather(*(book_one(timing_flight, f"Timing {i}") for i in range(args.seats)))
+        latency[name] = []
+        for booking_id in await booking_ids(timing_flight):
+            result = await cancel(booking_id)
+            latency[name].append(result[1] if isinstance(result, tuple) else result)
+
+    print(f"seats/repeats:   {args.seats}/{args.repeats} ({len(originals)} bookings, {args.bookers} racing bookers)")
+    print(f"cancel outcomes: {dict(outcomes)}")
+    print(f"rebooked seats:  {rebooked}")
+    print(f"race wall time:  {elapsed:.2f}s")
+    for name, values in latency.items():
+        print(f"{name + ' cancel:':16} p50 {ms(values, 0.5):.2f} ms  p95 {ms(values, 0.95):.2f} ms  mean {statistics.mean(values) * 1000:.2f} ms")
+    for problem in problems:
+        print(f"FAIL: {problem}")
+    print("inventory:       " + ("consistent" if not problems else "INCONSISTENT"))
+    sys.exit(0 if not problems else 1)
+
+
+if __name__ == "__main__":
+    asyncio.run(main_bench())
@@ -0,0 +1,79 @@
+"""Load test for /chat with a stubbed model, so no Gemini calls are made.
+
+Every agent's model is replaced with a stand-in that sleeps for --latency seconds and
+then answers. Because agent runs are awaited (not run_sync), requests/sec should grow
+with concurrency until MAX_CONCURRENT_AGENT_RUNS is reached.
+
+    python benchmarks/chat_load.py --latency 0.5 --requests 64 --concurrency 1 4 16 64
+"""
+import argparse
+import asyncio
+import os
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault("NEON_DB_URI", f"sqlite:///{tempfile.mkdtemp()}/bench.db")
+os.environ.setdefault("GEMINI_API_KEY", "bench")
+
+import httpx  # noqa: E402
+from agents import Model, ModelResponse, Usage, set_tracing_disabled  # noqa: E402
+from openai.types.responses import ResponseOutputMessage, ResponseOutputText  # noqa: E402
+
+import main  # noqa: E402
+
+
+class StubModel(Model):
+    """Answers every turn with a fixed message after a fixed delay."""
+
+    def __init__(self, latency: float):
+        self.latency = latency
+
+    async def get_response(self, system_instructions, input, model_settings, tools, output_schema,
+                           handoffs, tracing, *, previous_response_id=None, conversation_id=None, prompt=None):
+        await asyncio.sleep(self.latency)
+        message = ResponseOutputMessage(
+            id="msg_stub", type="message", role="assistant", status="completed",
+            content=[ResponseOutputText(type="output_text", text="Stubbed answer ✈️", annotations=[])],
+        )
+        return ModelResponse(output=[message], usage=Usage(), response_id=None)
+
+    def stream_response(self, *args, **kwargs):
+        raise NotImplementedError
+
+
+async def run_level(client: httpx.AsyncClient, concurrency: int, total: int) -> float:
+    gate = asyncio.Semaphore(concurrency)
+
+    async def one(i: int):
+        async with gate:
+            response = await client.post("/chat", json={"message": f"book me a flight #{i}", "user_type": "customer"})
+            response.raise_for_status()
+
+    start = time.perf_counter()
+    await asyncio.gather(*(one(i) for i in range(total)))
+    return total / (time.perf_counter() - start)
+
+
+async def main_bench():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--latency", type=float, default=0.5, help="stub model latency in seconds")
+    parser.add_argument("--requests", type=int, default=64, help="requests per concurrency level")
+    parser.add_argument("--concurrency", type=int, nargs="+", default=[1, 4, 16, 64])
+    args = parser.parse_args()
+
+    set_tracing_disabled(True)
+    for agent in (main.faq_agent, main.customer_agent, main.staff_agent, main.frontline_agent):
+        agent.model.model = StubModel(args.latency)  # keep the metrics wrapper in the measured path
+
+    transport = httpx.ASGITransport(app=main.app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench", timeout=None) as client:
+        print(f"limiter: {main.MAX_CONCURRENT_AGENT_RUNS} concurrent runs, model latency {args.latency}s")
+        for concurrency in args.concurrency:
+            rps = await run_level(client, concurrency, args.requests)
+            print(f"concurrency {concurrency:>4}: {rps:8.1f} req/s")
+
+
+if __name__ == "__main__":
+    asyncio.run(main_bench())
@@ -0,0 +1,100 @@
+"""Group booking benchmark: one book_group transaction vs one booking per passenger.
+
+Books --groups families of --size passengers on a partly sold flight, first the old way (a
+separate session, seat claim and commit per passenger, as book_flight_tool does) and
+then with book_group. Also checks that concurrent groups are all-or-nothing and that
+no seat is sold twice.
+
+    python benchmarks/group_booking.py --groups 50 --size 6
+"""
+import argparse
+import asyncio
+import os
+import random
+import sys
+import tempfile
+import time
+import uuid
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault("NEON_DB_URI", f"sqlite:///{tempfile.mkdtemp()}/bench.db?timeout=60")
+os.environ.setdefault("GEMINI_API_KEY", "bench")
+
+from sqlalchemy import func, select, update  # noqa: E402
+
+from main import (  # noqa: E402
+    AsyncSessionLocal, Booking, FlightSeat, GroupBookingError, SEAT_BOOKED, book_group, split_seat, startup_event,
+)
+from seat_inventory import book_one, setup_flight  # noqa: E402
+
+
+async def prefill(flight_number: str, seat_numbers: list[str], fraction: float, seed: int):
+    """Mark a random share of seats as sold so the seat map is fragmented like a real flight."""
+    taken = random.Random(seed).sample(seat_numbers, int(len(seat_numbers) * fraction))
+    async with AsyncSessionLocal() as db:
+        await db.execute(update(FlightSeat).where(
+            FlightSeat.flight_number == flight_number, FlightSeat.seat_number.in_(taken)
+        ).values(state=SEAT_BOOKED, booking_id="PREFILLED"))
+        await db.commit()
+
+
+def adjacent(seats: list[str]) -> bool:
+    parsed = sorted(split_seat(seat) for seat in seats)
+    return len({row for row, _ in parsed}) == 1 and all(
+        ord(b[1]) - ord(a[1]) == 1 for a, b in zip(parsed, parsed[1:]))
+
+
+async def per_passenger(flight_number: str, size: int) -> list[str]:
+    return [await book_one(flight_number, f"Passenger {i}") for i in range(size)]
+
+
+async def grouped(flight_number: str, size: int) -> list[str]:
+    async with AsyncSessionLocal() as db:
+        try:
+            _, bookings = await book_group(db, flight_number, [f"Passenger {i}" for i in range(size)])
+        except GroupBookingError:
+            return []
+        return [booking.available_seat for booking in bookings]
+
+
+async def run_sequential(book, flight_number: str, groups: int, size: int):
+    start = time.perf_counter()
+    results = [await book(flight_number, size) for _ in range(groups)]
+    return (time.perf_counter() - start) / groups, results
+
+
+async def main_bench():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--groups", type=int, default=50)
+    parser.add_argument("--size", type=int, default=6)
+    parser.add_argument("--fill", type=float, default=0.3, help="share of seats sold before the run")
+    args = parser.parse_args()
+
+    await startup_event()
+    seats_needed = args.groups * args.size
+    for label, book in (("per passenger", per_passenger), ("book_group", grouped)):
+        flight_number = f"BN{uuid.uuid4().hex[:6]}"
+        seat_numbers = await setup_flight(flight_number, int(seats_needed / (1 - args.fill)) + args.size)
+        await prefill(flight_number, seat_numbers, args.fill, seed=7)
+        latency, results = await run_sequential(book, flight_number, args.groups, args.size)
+        together = sum(adjacent(seats) for seats in results if all(seats))
+        print(f"{label:>14}: {latency * 1000:7.2f} ms/group, {together}/{args.groups} groups seated together")
+
+    # Concurrent groups competing for fewer seats than requested
+    flight_number = f"BN{uuid.uuid4().hex[:6]}"
+    await setup_flight(flight_number, seats_needed // 2)
+    results = await asyncio.gather(*(grouped(flight_number, args.size) for _ in range(args.groups)))
+    sold = [seat for seats in results for seat in seats]
+    async with AsyncSessionLocal() as db:
+        booked = (await db.execute(select(func.count(FlightSeat.id)).where(
+            FlightSeat.flight_number == flight_number, FlightSeat.state == SEAT_BOOKED))).scalar_one()
+        bookings = (await db.execute(select(func.count(Booking.id)).where(Booking.flight_number == flight_number))).scalar_one()
+    partial = sum(1 for seats in results if 0 < len(seats) < args.size)
+    print(f"concurrent:     {sum(1 for seats in results if seats)}/{args.groups} groups booked, "
+          f"{partial} partial, {len(sold) - len(set(sold))} double-sold, {bookings} bookings / {booked} booked seats")
+    ok = partial == 0 and len(sold) == len(set(sold)) == bookings == booked
+    sys.exit(0 if ok else 1)
+
+
+if __name__ == "__main__":
+    asyncio.run(main_bench())
@@ -0,0 +1,101 @@
+"""Route search benchmark: indexed alias/route lookup vs the old ILIKE '%x%' scan.
+
+Loads a synthetic schedule (1M flights by default) and times both ways of answering
+flight_schedule_tool's departure/arrival filters. Point NEON_DB_URI at Postgres to
+benchmark there; by default a throwaway SQLite file is used.
+
+    python benchmarks/route_search.py --flights 1000000 --queries 20
+"""
+import argparse
+import asyncio
+import os
+import random
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault("NEON_DB_URI", f"sqlite:///{tempfile.mkdtemp()}/bench.db")
+os.environ.setdefault("GEMINI_API_KEY", "bench")
+
+from sqlalchemy import func, select  # noqa: E402
+
+from main import (  # noqa: E402
+    AirportAlias, AsyncSessionLocal, Base, Flight, FlightRoute, SessionLocal, alias_index, async_engine, engine,
+    place_aliases, place_code, resolve_place,
+)
+
+CITIES = [f"City{chr(65 + i // 26)}{chr(65 + i % 26)}" for i in range(300)]
+AIRPORTS = [f"{city} {city[-2:]}{chr(65 + i % 26)}" for i, city in enumerate(CITIES)]
+BATCH = 20_000
+
+
+def load_schedule(flights: int):
+    Base.metadata.create_all(bind=engine)
+    rng = random.Random(7)
+    with SessionLocal() as db:
+        aliases = {(alias, place_code(airport)) for airport in AIRPORTS for alias in place_aliases(airport)}
+        db.execute(AirportAlias.__table__.insert(), [{"alias": a, "code": c} for a, c in aliases])
+        for start in range(0, flights, BATCH):
+            rows, routes = [], []
+            for flight_id in range(start + 1, min(start + BATCH, flights) + 1):
+                departure, arrival = rng.sample(AIRPORTS, 2)
+                rows.append({"id": flight_id, "flight_number": f"SY{flight_id}", "departure": departure,
+                             "arrival": arrival, "departure_time": "2025-06-08 10:00", "arrival_time": "2025-06-08 12:00",
+                             "available_seats": "", "price": 100.0, "status": "scheduled"})
+                routes.append({"flight_id": flight_id, "departure_code": place_code(departure),
+                               "arrival_code": place_code(arrival)})
+            db.execute(Flight.__table__.insert(), rows)
+            db.execute(FlightRoute.__table__.insert(), routes)
+        db.commit()
+    for alias, code in aliases:
+        alias_index.add(alias, code)
+
+
+async def ilike_search(db, departure: str, arrival: str) -> list[int]:
+    query = select(Flight.id).where(Flight.departure.ilike(f"%{departure}%"), Flight.arrival.ilike(f"%{arrival}%"))
+    return list((await db.execute(query)).scalars())
+
+
+async def indexed_search(db, departure: str, arrival: str) -> list[int]:
+    query = (select(Flight.id).join(FlightRoute, FlightRoute.flight_id == Flight.id)
+             .where(FlightRoute.departure_code.in_(await resolve_place(db, departure)),
+                    FlightRoute.arrival_code.in_(await resolve_place(db, arrival))))
+    return list((await db.execute(query)).scalars())
+
+
+async def time_queries(search, pairs) -> tuple[float, list[list[int]]]:
+    results = []
+    async with AsyncSessionLocal() as db:
+        start = time.perf_counter()
+        for departure, arrival in pairs:
+            results.append(sorted(await search(db, departure, arrival)))
+        return (time.perf_counter() - start) / len(pairs), results
+
+
+async def main_bench():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--flights", type=int, default=1_000_000)
+    parser.add_argument("--queries", type=int, default=20)
+    args = parser.parse_args()
+
+    start = time.perf_counter()
+    load_schedule(args.flights)
+    print(f"loaded {args.flights} flights in {time.perf_counter() - start:.1f}s ({engine.url.get_backend_name()})")
+
+    rng = random.Random(11)
+    pairs = [tuple(city.lower() for city in rng.sample(CITIES, 2)) for _ in range(args.queries)]
+    ilike_time, ilike_results = await time_queries(ilike_search, pairs)
+    indexed_time, indexed_results = await time_queries(indexed_search, pairs)
+
+    async with AsyncSessionLocal() as db:
+        total = (await db.execute(select(func.count(Flight.id)))).scalar_one()
+    print(f"flights in table:   {total}")
+    print(f"ILIKE '%x%' scan:   {ilike_time * 1000:9.2f} ms/query")
+    print(f"indexed route:      {indexed_time * 1000:9.2f} ms/query ({ilike_time / indexed_time:.0f}x faster)")
+    print(f"same results:       {ilike_results == indexed_results}")
+    await async_engine.dispose()
+
+
+if __name__ == "__main__":
+    asyncio.run(main_bench())
@@ -0,0 +1,216 @@
+"""Schedule snapshot benchmark: flight_schedule_tool and /flights from memory vs the database.
+
+Loads a synthetic schedule, then answers the same route searches and /flights pages with
+the in-memory snapshot and with the database queries it replaces, checking the answers
+match. Then books, cancels, adds and updates flights through the real code paths and checks
+that the snapshot follows every change without a full rebuild, including changes committed
+by another worker (picked up from schedule_changes, skipping this worker's own), times
+bulk changes from another worker (merged, or a full rebuild past the threshold), and
+measures how long a full rebuild holds up the event loop.
+
+    python benchmarks/schedule_snapshot.py --flights 100000 --queries 200
+"""
+import argparse
+import asyncio
+import dataclasses
+import json
+import os
+import random
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault("NEON_DB_URI", f"sqlite:///{tempfile.mkdtemp()}/bench.db?timeout=60")
+os.environ.setdefault("GEMINI_API_KEY", "bench")
+
+from agents.tool_context import ToolContext  # noqa: E402
+from sqlalchemy import update  # noqa: E402
+
+import main  # noqa: E402
+from main import (  # noqa: E402
+    AirlineAgentContext, AsyncSessionLocal, Flight, ScheduleChange, add_flight_tool, book_flight_tool, cancel_booking, claim_seat,
+    flight_schedule_tool, get_flights, schedule_store, seed_seats, startup_event, update_flight_tool,
+)
+from route_search import CITIES, load_schedule  # noqa: E402
+
+
+async def call_tool(tool, **arguments) -> str:
+    payload = json.dumps(arguments)
+    context = ToolContext(context=AirlineAgentContext(user_type="staff"), tool_name=tool.name,
+                          tool_call_id="bench", tool_arguments=payload)
+    return await tool.on_invoke_tool(context, payload)
+
+
+async def timed(enabled: bool, calls) -> tuple[float, list]:
+    """Run the calls with the snapshot switched on or off; mean seconds per call and the results."""
+    main.SCHEDULE_SNAPSHOT_ENABLED = enabled
+    results = []
+    start = time.perf_counter()
+    for call in calls:
+        results.append(await call())
+    elapsed = (time.perf_counter() - start) / len(calls)
+    main.SCHEDULE_SNAPSHOT_ENABLED = True
+    return elapsed, results
+
+
+async def flights_page(after_id: int | None) -> dict:
+    async with AsyncSessionLocal() as db:
+        return await get_flights(after_id=after_id, limit=100, stream=False, db=db)
+
+
+async def log_other_worker_changes(db, flight_numbers: list[str]):
+    # Straight into the table: record_schedule_change would mark them as this worker's own
+    await db.execute(ScheduleChange.__table__.insert(), [{"flight_number": number} for number in flight_numbers])
+    await db.commit()
+
+
+async def other_worker_bookings(flight_numbers: list[str]):
+    """Book one seat per flight the way another worker would: committed and logged, but not
+    applied to this worker's snapshot."""
+    async with AsyncSessionLocal() as db:
+        for number in flight_numbers:
+            await claim_seat(db, number, f"OTHER-{number}")
+        await log_other_worker_changes(db, flight_numbers)
+
+
+async def other_worker_repricing(flight_numbers: list[str]):
+    async with AsyncSessionLocal() as db:
+        await db.execute(update(Flight).where(Flight.flight_number.in_(flight_numbers)).values(price=Flight.price + 1))
+        await log_other_worker_changes(db, flight_numbers)
+
+
+async def loop_stall(work) -> tuple[float, float]:
+    """Run work while a ticker measures the longest gap between event loop turns; (elapsed, max gap) in seconds."""
+    gaps, done = [0.0], False
+
+    async def tick():
+        last = time.perf_counter()
+        while not done:
+            await asyncio.sleep(0.001)
+            now = time.perf_counter()
+            gaps.append(now - last)
+            last = now
+
+    ticker = asyncio.create_task(tick())
+    start = time.perf_counter()
+    await work()
+    elapsed = time.perf_counter() - start
+    done = True
+    await ticker
+    return elapsed, max(gaps)
+
+
+async def snapshot_matches_database() -> bool:
+    async with AsyncSessionLocal() as db:
+        fresh = {flight.flight_number: flight for flight in await schedule_store.load_flights(db)}
+    current = {flight.flight_number: flight for flight in schedule_store.snapshot.flights.values()}
+    return fresh.keys() == current.keys() and all(
+        same_flight(fresh[number], current[number]) for number in fresh
+    )
+
+
+def same_flight(a, b) -> bool:
+    # Released seats go to the end of the in-memory list, so compare seats as sets
+    return (a.id, a.departure, a.arrival, a.departure_time, a.price, a.status, a.departure_code, a.arrival_code,
+            set(a.available_seats)) == (b.id, b.departure, b.arrival, b.departure_time, b.price, b.status,
+                                        b.departure_code, b.arrival_code, set(b.available_seats))
+
+
+async def main_bench():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--flights", type=int, default=100_000)
+    parser.add_argument("--queries", type=int, default=200)
+    args = parser.parse_args()
+
+    load_schedule(args.flights)
+    async with AsyncSessionLocal() as db:
+        for number in range(1, 51):
+            await seed_seats(db, f"SY{number}", [f"{row}{letter}" for row in range(1, 31) for letter in "ABCDEF"])
+        await db.commit()
+    start = time.perf_counter()
+    await startup_event()
+    print(f"flights:              {len(schedule_store.snapshot.flights)} (startup incl. snapshot {time.perf_counter() - start:.2f}s, "
+          f"rebuild {schedule_store.stats['last_rebuild_ms']:.0f} ms)")
+
+    rng = random.Random(5)
+    pairs = [tuple(city.lower() for city in rng.sample(CITIES, 2)) for _ in range(args.queries)]
+    searches = [lambda d=d, a=a: call_tool(flight_schedule_tool, departure=d, arrival=a) for d, a in pairs]
+    searches += [lambda d=d: call_tool(flight_schedule_tool, departure=d) for d, _ in pairs[:20]]
+    database_time, database_replies = await timed(False, searches)
+    snapshot_time, snapshot_replies = await timed(True, searches)
+    print(f"schedule tool (db):   {database_time * 1000:8.3f} ms/call")
+    print(f"schedule tool (mem):  {snapshot_time * 1000:8.3f} ms/call ({database_time / snapshot_time:.0f}x faster)")
+    print(f"same replies:         {database_replies == snapshot_replies}")
+
+    cursors = [None] + [rng.randrange(args.flights) for _ in range(args.queries - 1)]
+    pages = [lambda after_id=after_id: flights_page(after_id) for after_id in cursors]
+    database_time, database_pages = await timed(False, pages)
+    snapshot_time, snapshot_pages = await timed(True, pages)
+    print(f"/flights page (db):   {database_time * 1000:8.3f} ms/page")
+    print(f"/flights page (mem):  {snapshot_time * 1000:8.3f} ms/page ({database_time / snapshot_time:.0f}x faster)")
+    print(f"same pages:           {database_pages == snapshot_pages}")
+
+    # Writes go to the database and are applied to the snapshot without a full rebuild
+    rebuilds = schedule_store.stats["full_rebuilds"]
+    version = schedule_store.snapshot.version
+    start = time.perf_counter()
+    replies = [await call_tool(book_flight_tool, flight_number="SY1", passenger_name=f"Passenger {i}") for i in range(10)]
+    confirmations = [line.split("**Confirmation Number:** ")[1].strip() for reply in replies for line in reply.splitlines()
+                     if "Confirmation Number" in line]
+    for booking_id in confirmations[:4]:
+        async with AsyncSessionLocal() as db:
+            await cancel_booking(db, booking_id)
+    await call_tool(add_flight_tool, flight_number="NEW1", departure="Snapshot Town SNT", arrival=f"{CITIES[0]} {CITIES[0][-2:]}A",
+                    departure_time="2025-07-01 09:00", arrival_time="2025-07-01 11:00", price=120.0, available_seats="1A,1B,1C")
+    await call_tool(update_flight_tool, flight_number="SY2", field="price", new_value="250")
+    writes_ms = (time.perf_counter() - start) * 1000
+    seats_left = len(schedule_store.snapshot.flights[schedule_store.snapshot.ids_by_number["SY1"]].available_seats)
+    print(f"writes applied:       {schedule_store.snapshot.version - version} snapshot versions in {writes_ms:.0f} ms, "
+          f"{schedule_store.stats['full_rebuilds'] - rebuilds} full rebuilds")
+    print(f"SY1 seats in memory:  {seats_left} (expected {180 - 10 + 4})")
+    print(f"new flight found:     {'NEW1' in await call_tool(flight_schedule_tool, departure='snapshot town')}")
+    consistent = await snapshot_matches_database()
+    print(f"snapshot == database: {consistent}")
+
+    # Another worker's bookings reach this snapshot through the change log, flight by flight
+    await schedule_store.apply_changes()
+    await other_worker_bookings([f"SY{number}" for number in range(3, 13)])
+    rebuilds = schedule_store.stats["full_rebuilds"]
+    poll_time, poll_stall = await loop_stall(schedule_store.apply_changes)
+    polled_ok = await snapshot_matches_database() and schedule_store.stats["full_rebuilds"] == rebuilds
+    print(f"change poll:          {poll_time * 1000:.1f} ms for 10 flights changed elsewhere, "
+          f"longest loop stall {poll_stall * 1000:.1f} ms, snapshot == database: {polled_ok}")
+
+    # Own writes are already in the snapshot: the poll skips them
+    reloads = schedule_store.stats["flight_reloads"]
+    await call_tool(update_flight_tool, flight_number="SY2", field="price", new_value="260")
+    await schedule_store.apply_changes()
+    own_skipped = schedule_store.stats["flight_reloads"] == reloads + 1
+    print(f"own change skipped:   {own_skipped}")
+
+    # Bulk changes elsewhere: merged in one pass, or a full rebuild above the threshold
+    for count in (2000, 8000, 16000, 32000):
+        await other_worker_repricing([f"SY{number}" for number in range(1, count + 1)])
+        rebuilds = schedule_store.stats["full_rebuilds"]
+        poll_time, poll_stall = await loop_stall(schedule_store.apply_changes)
+        bulk_ok = await snapshot_matches_database()
+        polled_ok &= bulk_ok
+        how = "full rebuild" if schedule_store.stats["full_rebuilds"] > rebuilds else "merged"
+        print(f"{count:5} changed flights: {poll_time * 1000:6.0f} ms ({how}), longest loop stall {poll_stall * 1000:.0f} ms, "
+              f"snapshot == database: {bulk_ok}")
+    changed = [dataclasses.replace(flight, price=flight.price + 1) for flight in list(schedule_store.snapshot.flights.values())[:16000]]
+    start = time.perf_counter()
+    schedule_store.snapshot.with_flights(changed)
+    print(f"with_flights(16000):  {(time.perf_counter() - start) * 1000:.0f} ms")
+
+    rebuild_time, rebuild_stall = await loop_stall(schedule_store.rebuild)
+    print(f"full rebuild:         {rebuild_time * 1000:.0f} ms, longest loop stall {rebuild_stall * 1000:.0f} ms")
+
+    ok = (database_replies == snapshot_replies and database_pages == snapshot_pages and consistent and seats_left == 174
+          and polled_ok and own_skipped)
+    sys.exit(0 if ok else 1)
+
+
+if __name__ == "__main__":
+    asyncio.run(main_bench())
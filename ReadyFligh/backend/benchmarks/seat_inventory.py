@@ -0,0 +1,87 @@
+"""Concurrency benchmark for the flight_seats inventory.
+
+Runs many parallel bookers against one flight and checks that no seat is sold twice.
+Point NEON_DB_URI at a Postgres database to exercise FOR UPDATE SKIP LOCKED; by default
+a throwaway SQLite file is used.
+
+    python benchmarks/seat_inventory.py --bookers 200 --seats 150
+"""
+import argparse
+import asyncio
+import os
+import sys
+import tempfile
+import time
+import uuid
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault("NEON_DB_URI", f"sqlite:///{tempfile.mkdtemp()}/bench.db?timeout=60")
+os.environ.setdefault("GEMINI_API_KEY", "bench")
+
+from main import AsyncSessionLocal, Base, Booking, Flight, FlightSeat, async_engine, claim_seat, seed_seats, SEAT_BOOKED  # noqa: E402
+from sqlalchemy import func, select  # noqa: E402
+
+
+async def setup_flight(flight_number: str, seats: int) -> list[str]:
+    seat_numbers = [f"{row}{letter}" for row in range(1, seats // 6 + 2) for letter in "ABCDEF"][:seats]
+    async with AsyncSessionLocal() as db:
+        db.add(Flight(flight_number=flight_number, departure="Bench City", arrival="Load Town",
+                      departure_time="2025-01-01 10:00", arrival_time="2025-01-01 12:00",
+                      available_seats="", price=100.0, status="scheduled"))
+        await seed_seats(db, flight_number, seat_numbers)
+        await db.commit()
+    return seat_numbers
+
+
+async def book_one(flight_number: str, passenger: str) -> str | None:
+    """Same steps as book_flight_tool: look up the flight, claim a seat, insert the booking."""
+    async with AsyncSessionLocal() as db:
+        flight = (await db.execute(select(Flight).where(Flight.flight_number == flight_number))).scalars().first()
+        booking_id = f"RF{uuid.uuid4().hex[:10]}"
+        seat = await claim_seat(db, flight_number, booking_id)
+        if not seat:
+            await db.rollback()
+            return None
+        db.add(Booking(booking_id=booking_id, flight_number=flight_number, passenger_name=passenger,
+                       departure=flight.departure, arrival=flight.arrival,
+                       departure_time=flight.departure_time, arrival_time=flight.arrival_time,
+                       available_seat=seat, price=flight.price, booked=True))
+        await db.commit()
+        return seat
+
+
+async def main_bench():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--bookers", type=int, default=200)
+    parser.add_argument("--seats", type=int, default=150)
+    args = parser.parse_args()
+
+    async with async_engine.begin() as conn:
+        await conn.run_sync(Base.metadata.create_all)
+    flight_number = f"BN{uuid.uuid4().hex[:6]}"
+    await setup_flight(flight_number, args.seats)
+
+    start = time.perf_counter()
+    seats = await asyncio.gather(*(book_one(flight_number, f"Passenger {i}") for i in range(args.bookers)))
+    elapsed = time.perf_counter() - start
+
+    sold = [seat for seat in seats if seat]
+    async with AsyncSessionLocal() as db:
+        booking_rows = (await db.execute(select(func.count(Booking.id)).where(Booking.flight_number == flight_number))).scalar_one()
+        booked_rows = (await db.execute(select(func.count(FlightSeat.id)).where(
+            FlightSeat.flight_number == flight_number, FlightSeat.state == SEAT_BOOKED))).scalar_one()
+
+    double_sold = len(sold) - len(set(sold))
+    print(f"database:        {async_engine.url.get_backend_name()}")
+    print(f"bookers/seats:   {args.bookers}/{args.seats}")
+    print(f"confirmed:       {len(sold)} (expected {min(args.bookers, args.seats)})")
+    print(f"double-sold:     {double_sold}")
+    print(f"bookings/seats:  {booking_rows}/{booked_rows} rows")
+    print(f"throughput:      {args.bookers / elapsed:.1f} bookings/s ({elapsed:.2f}s)")
+
+    ok = double_sold == 0 and len(sold) == min(args.bookers, args.seats) == booking_rows == booked_rows
+    sys.exit(0 if ok else 1)
+
+
+if __name__ == "__main__":
+    asyncio.run(main_bench())
@@ -0,0 +1,42 @@
+"""Bulk import a flight schedule into the ReadyFlight database.
+
+    python import_flights.py schedule.csv
+    python import_flights.py schedule.json --batch-size 5000
+
+CSV files need a header row with flight_number, departure, arrival, departure_time,
+arrival_time, price, available_seats (comma-separated, quoted) and optionally status.
+JSON files hold a list of objects with the same keys (available_seats may be a list).
+Existing flights are updated; per-row errors are printed at the end.
+"""
+import argparse
+import asyncio
+import json
+import os
+
+from main import AsyncSessionLocal, IMPORT_BATCH_SIZE, import_flights, parse_schedule, startup_event
+
+
+async def run(path: str, fmt: str, batch_size: int):
+    with open(path, encoding="utf-8-sig") as f:
+        rows = parse_schedule(f.read(), fmt)
+    await startup_event()
+    async with AsyncSessionLocal() as db:
+        report = await import_flights(db, rows, batch_size)
+    errors = report.pop("errors")
+    print(json.dumps(report, indent=2))
+    for error in errors:
+        print(f"row {error['row']} ({error['flight_number']}): {error['error']}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Bulk import a flight schedule (CSV or JSON).")
+    parser.add_argument("path")
+    parser.add_argument("--format", choices=["csv", "json"], help="defaults to the file extension")
+    parser.add_argument("--batch-size", type=int, default=IMPORT_BATCH_SIZE)
+    args = parser.parse_args()
+    fmt = args.format or os.path.splitext(args.path)[1].lstrip(".").lower()
+    asyncio.run(run(args.path, fmt, args.batch_size))
+
+
+if __name__ == "__main__":
+    main()
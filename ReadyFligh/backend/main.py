@@ -1,17 +1,33 @@
-from fastapi import FastAPI, Depends, HTTPException, status
+from fastapi import FastAPI, Depends, HTTPException, status, Query, Request
+from fastapi.responses import StreamingResponse, PlainTextResponse
+from fastapi.encoders import jsonable_encoder
 from fastapi.middleware.cors import CORSMiddleware
-from pydantic import BaseModel
-import uuid, os, random
+from pydantic import BaseModel, Field
+import uuid, os, asyncio, base64, json, re, time, hashlib, bisect, heapq, queue, threading, tempfile, csv, io, functools, contextvars, dataclasses, contextlib, sqlite3, textwrap
+from collections import OrderedDict, deque
 from openai import AsyncOpenAI
-from agents import Agent, Runner, RunContextWrapper, function_tool, handoff, OpenAIChatCompletionsModel, handoffs
+from openai.types.responses import ResponseTextDeltaEvent
+from agents import Agent, Runner, RunContextWrapper, function_tool, handoff, OpenAIChatCompletionsModel, handoffs, Model, FunctionTool, TracingProcessor, set_trace_processors, trace, custom_span
+from agents.tracing import get_current_trace
 from agents.extensions.handoff_prompt import RECOMMENDED_PROMPT_PREFIX
-from sqlalchemy import create_engine, Column, Integer, String, Boolean, DateTime, Float
+from sqlalchemy import create_engine, Column, Integer, String, Boolean, DateTime, Float, ForeignKey, Index, UniqueConstraint, select, update, delete, func, text, case, event
 from sqlalchemy.ext.declarative import declarative_base
-from sqlalchemy.orm import sessionmaker
+from sqlalchemy.orm import Session, sessionmaker
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker, create_async_engine
+from sqlalchemy.engine import make_url
+from sqlalchemy.pool import AsyncAdaptedQueuePool
+from sqlalchemy import exc as sa_exc
+from sqlalchemy.dialects import postgresql, sqlite
 from dotenv import load_dotenv
 import datetime
 import uvicorn
 
+try:
+    import fcntl  # booking worker id leases; not available on Windows
+except ImportError:
+    fcntl = None
+    import msvcrt
+
 load_dotenv()
 
 app = FastAPI()
@@ -29,7 +45,7 @@ Base = declarative_base()
 class Flight(Base):
     __tablename__ = 'flights'
     id = Column(Integer, primary_key=True, index=True)
-    flight_number = Column(String(10), index=True, nullable=False)
+    flight_number = Column(String(10), nullable=False)
     departure = Column(String(50), nullable=False)
     arrival = Column(String(50), nullable=False)
     departure_time = Column(String(50), nullable=False)
@@ -37,11 +53,12 @@ class Flight(Base):
     available_seats = Column(String(255), nullable=False)
     price = Column(Float, nullable=False)
     status = Column(String(20), nullable=False)
+    __table_args__ = (Index('uq_flights_flight_number', 'flight_number', unique=True),)
 
 class Booking(Base):
     __tablename__ = 'bookings'
     id = Column(Integer, primary_key=True, index=True)
-    booking_id = Column(String(20), index=True, nullable=False)
+    booking_id = Column(String(20), nullable=False)
     flight_number = Column(String(10), index=True, nullable=False)
     passenger_name = Column(String(100), nullable=False)
     departure = Column(String(50), nullable=False)
@@ -52,24 +69,952 @@ class Booking(Base):
     price = Column(Float, nullable=False)
     booked = Column(Boolean, nullable=False)
     created_at = Column(DateTime, default=datetime.datetime.utcnow)
+    __table_args__ = (Index('uq_bookings_booking_id', 'booking_id', unique=True),)
+
+SEAT_AVAILABLE = "available"
+SEAT_BOOKED = "booked"
+
+class FlightSeat(Base):
+    """One row per seat. Seats are claimed with a conditional UPDATE so concurrent
+    bookings never sell the same seat twice (Flight.available_seats is legacy)."""
+    __tablename__ = 'flight_seats'
+    id = Column(Integer, primary_key=True, index=True)
+    flight_number = Column(String(10), nullable=False)
+    seat_number = Column(String(10), nullable=False)
+    state = Column(String(20), nullable=False, default=SEAT_AVAILABLE)
+    booking_id = Column(String(20), nullable=True)
+    __table_args__ = (
+        UniqueConstraint('flight_number', 'seat_number', name='uq_flight_seat'),
+        Index('ix_flight_seats_claim', 'flight_number', 'state', 'id'),
+    )
+
+class AirportAlias(Base):
+    """Normalized names a traveller may use for an airport/city (\"new york\", \"jfk\") and its route code."""
+    __tablename__ = 'airport_aliases'
+    id = Column(Integer, primary_key=True, index=True)
+    alias = Column(String(100), index=True, nullable=False)
+    code = Column(String(50), nullable=False)
+    __table_args__ = (UniqueConstraint('alias', 'code', name='uq_airport_alias'),)
+
+class FlightRoute(Base):
+    """Route codes for each flight, indexed so schedule searches never scan the flights table."""
+    __tablename__ = 'flight_routes'
+    flight_id = Column(Integer, ForeignKey('flights.id'), primary_key=True)
+    departure_code = Column(String(50), nullable=False)
+    arrival_code = Column(String(50), nullable=False)
+    __table_args__ = (
+        Index('ix_flight_routes_route', 'departure_code', 'arrival_code', 'flight_id'),
+        Index('ix_flight_routes_arrival', 'arrival_code', 'flight_id'),
+    )
+
+SCHEDULE_REBUILD_MARKER = "*"  # schedule_changes flight_number that asks every worker for a full rebuild
+
+class ScheduleChange(Base):
+    """One row per committed change to a flight or its seats, written in the same transaction.
+    Workers poll it past the last id they applied and re-read only those flights. A bulk import
+    writes a single SCHEDULE_REBUILD_MARKER row instead."""
+    __tablename__ = 'schedule_changes'
+    id = Column(Integer, primary_key=True)
+    flight_number = Column(String(10), nullable=False)
+    changed_at = Column(DateTime, default=datetime.datetime.utcnow, index=True)
 
 DATABASE_URL = os.getenv("NEON_DB_URI")
-engine = create_engine(DATABASE_URL)
+
+def get_async_database_url(database_url: str):
+    """Map a sync database URL onto its asyncio driver (asyncpg / aiosqlite)."""
+    url = make_url(database_url)
+    backend = url.get_backend_name()
+    if backend == "postgresql":
+        query = dict(url.query)
+        # asyncpg spells sslmode as ssl and does not understand libpq-only options
+        if "sslmode" in query:
+            query["ssl"] = query.pop("sslmode")
+        query.pop("channel_binding", None)
+        return url.set(drivername="postgresql+asyncpg", query=query)
+    if backend == "sqlite":
+        return url.set(drivername="sqlite+aiosqlite")
+    return url
+
+# ================================================================== Connection Pool
+
+DB_POOL_SIZE = int(os.getenv("DB_POOL_SIZE", "5"))
+DB_MAX_OVERFLOW = int(os.getenv("DB_MAX_OVERFLOW", "10"))
+DB_POOL_TIMEOUT = float(os.getenv("DB_POOL_TIMEOUT", "30"))
+# Serverless Postgres (Neon) closes idle connections, so check them before use and recycle them early
+DB_POOL_PRE_PING = os.getenv("DB_POOL_PRE_PING", "true").lower() == "true"
+DB_POOL_RECYCLE = int(os.getenv("DB_POOL_RECYCLE", "300"))
+DB_POOL_WARM_CONNECTIONS = int(os.getenv("DB_POOL_WARM_CONNECTIONS", str(DB_POOL_SIZE)))
+
+class LatencyHistogram:
+    """Fixed-bucket histogram of durations in seconds."""
+    BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+    def __init__(self, buckets: tuple[float, ...] = BUCKETS):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, seconds: float):
+        self.counts[bisect.bisect_left(self.buckets, seconds)] += 1
+        self.sum += seconds
+        self.count += 1
+
+    def snapshot(self) -> dict:
+        cumulative, running = {}, 0
+        for bound, count in zip(self.buckets + (float("inf"),), self.counts):
+            running += count
+            cumulative["+Inf" if bound == float("inf") else str(bound)] = running
+        return {"buckets": cumulative, "sum": self.sum, "count": self.count}
+
+pool_wait_histogram = LatencyHistogram()
+pool_stats = {"timeouts": 0}
+
+class InstrumentedAsyncPool(AsyncAdaptedQueuePool):
+    """Queue pool that records how long each checkout waited for a connection."""
+
+    def _do_get(self):
+        start = time.perf_counter()
+        try:
+            return super()._do_get()
+        except sa_exc.TimeoutError:
+            pool_stats["timeouts"] += 1
+            raise
+        finally:
+            pool_wait_histogram.observe(time.perf_counter() - start)
+
+def pool_options(database_url) -> dict:
+    url = make_url(database_url)
+    if url.get_backend_name() == "sqlite" and url.database in (None, "", ":memory:"):
+        return {}  # in-memory SQLite uses a single static connection
+    return {
+        "pool_size": DB_POOL_SIZE,
+        "max_overflow": DB_MAX_OVERFLOW,
+        "pool_timeout": DB_POOL_TIMEOUT,
+        "pool_pre_ping": DB_POOL_PRE_PING,
+        "pool_recycle": DB_POOL_RECYCLE,
+    }
+
+# The sync engine is kept for scripts; the API and agent tools use the async one
+engine = create_engine(DATABASE_URL, **pool_options(DATABASE_URL))
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
 
-def get_db():
-    db = SessionLocal()
-    try:
+async_pool_options = pool_options(DATABASE_URL)
+if async_pool_options:
+    async_pool_options["poolclass"] = InstrumentedAsyncPool
+async_engine = create_async_engine(get_async_database_url(DATABASE_URL), **async_pool_options)
+AsyncSessionLocal = async_sessionmaker(async_engine, autoflush=False, expire_on_commit=False)
+
+async def get_db():
+    async with AsyncSessionLocal() as db:
         yield db
-    finally:
-        db.close()
+
+async def warm_pool(connections: int):
+    """Open connections up front so the first requests after startup do not pay connect + TLS time."""
+    async def touch():
+        async with async_engine.connect() as conn:
+            await conn.execute(text("SELECT 1"))
+
+    await asyncio.gather(*(touch() for _ in range(connections)))
+
+# ================================================================== Metrics
+
+# Which agent the current tool call (and any SQL it runs) belongs to; "api" outside agent runs
+current_agent = contextvars.ContextVar("current_agent", default="api")
+
+class MetricsRegistry:
+    """Labelled counters and latency histograms, rendered in Prometheus text format."""
+
+    def __init__(self):
+        self.help = {}
+        self.kinds = {}
+        self.series = {}
+        self.lock = threading.Lock()
+
+    def counter(self, name: str, help_text: str):
+        self.help[name], self.kinds[name], self.series[name] = help_text, "counter", {}
+
+    def histogram(self, name: str, help_text: str):
+        self.help[name], self.kinds[name], self.series[name] = help_text, "histogram", {}
+
+    def inc(self, name: str, amount: float = 1, **labels):
+        key = tuple(sorted(labels.items()))
+        with self.lock:
+            self.series[name][key] = self.series[name].get(key, 0) + amount
+
+    def observe(self, name: str, seconds: float, **labels):
+        key = tuple(sorted(labels.items()))
+        with self.lock:
+            histogram = self.series[name].get(key)
+            if histogram is None:
+                histogram = self.series[name][key] = LatencyHistogram()
+            histogram.observe(seconds)
+
+    @staticmethod
+    def format_labels(labels, **extra) -> str:
+        pairs = list(labels) + list(extra.items())
+        if not pairs:
+            return ""
+        escape = lambda value: str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+        return "{" + ",".join(f'{key}="{escape(value)}"' for key, value in pairs) + "}"
+
+    def render(self) -> str:
+        lines = []
+        with self.lock:
+            for name, series in self.series.items():
+                lines.append(f"# HELP {name} {self.help[name]}")
+                lines.append(f"# TYPE {name} {self.kinds[name]}")
+                for labels, value in series.items():
+                    if self.kinds[name] == "counter":
+                        lines.append(f"{name}{self.format_labels(labels)} {value}")
+                        continue
+                    snapshot = value.snapshot()
+                    for bound, count in snapshot["buckets"].items():
+                        lines.append(f"{name}_bucket{self.format_labels(labels, le=bound)} {count}")
+                    lines.append(f"{name}_sum{self.format_labels(labels)} {snapshot['sum']}")
+                    lines.append(f"{name}_count{self.format_labels(labels)} {snapshot['count']}")
+        return "\n".join(lines) + "\n"
+
+metrics = MetricsRegistry()
+metrics.counter("readyflight_tool_calls_total", "Tool invocations by agent, tool and outcome (ok, failed reply, error)")
+metrics.histogram("readyflight_tool_duration_seconds", "Tool latency by agent and tool")
+metrics.counter("readyflight_llm_calls_total", "Model calls by agent, model and outcome")
+metrics.histogram("readyflight_llm_duration_seconds", "Model call latency by agent and model")
+metrics.counter("readyflight_llm_tokens_total", "Tokens used by agent, model and direction (input/output)")
+metrics.counter("readyflight_db_queries_total", "SQL statements by agent, operation and outcome")
+metrics.histogram("readyflight_db_query_duration_seconds", "SQL statement latency by agent and operation")
+metrics.counter("readyflight_http_requests_total", "HTTP requests by method, route and status code")
+metrics.histogram("readyflight_http_request_duration_seconds", "HTTP request latency by method and route")
+
+def query_operation(statement: str) -> str:
+    words = statement.split(None, 1)
+    return words[0].upper() if words else "UNKNOWN"
+
+def start_sql_span(statement: str):
+    """A child span of the current tool call, when the query runs inside a traced /chat request."""
+    if get_current_trace() is None:
+        return None
+    span = custom_span("sql", {"operation": query_operation(statement), "statement": statement[:500]})
+    span.start()
+    return span
+
+def before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    conn.info.setdefault("query_start", []).append((time.perf_counter(), start_sql_span(statement)))
+
+def after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    start, span = conn.info["query_start"].pop()
+    elapsed = time.perf_counter() - start
+    if span:
+        span.finish()
+    labels = {"agent": current_agent.get(), "operation": query_operation(statement)}
+    metrics.observe("readyflight_db_query_duration_seconds", elapsed, **labels)
+    metrics.inc("readyflight_db_queries_total", status="ok", **labels)
+
+def handle_db_error(exception_context):
+    starts = exception_context.connection.info.get("query_start") if exception_context.connection else None
+    if starts:
+        _, span = starts.pop()
+        if span:
+            span.set_error({"message": str(exception_context.original_exception), "data": None})
+            span.finish()
+    metrics.inc("readyflight_db_queries_total", agent=current_agent.get(),
+                operation=query_operation(exception_context.statement or ""), status="error")
+
+for instrumented_engine in (engine, async_engine.sync_engine):
+    event.listen(instrumented_engine, "before_cursor_execute", before_cursor_execute)
+    event.listen(instrumented_engine, "after_cursor_execute", after_cursor_execute)
+    event.listen(instrumented_engine, "handle_error", handle_db_error)
+
+def record_llm_usage(agent_name: str, model_name: str, usage):
+    if usage is None:
+        return
+    metrics.inc("readyflight_llm_tokens_total", usage.input_tokens or 0, agent=agent_name, model=model_name, direction="input")
+    metrics.inc("readyflight_llm_tokens_total", usage.output_tokens or 0, agent=agent_name, model=model_name, direction="output")
+
+class InstrumentedModel(Model):
+    """Wraps an agent's model to record call latency, errors and token usage."""
+
+    def __init__(self, model: Model, agent_name: str):
+        self.model = model
+        self.agent_name = agent_name
+        self.model_name = str(getattr(model, "model", type(model).__name__))
+
+    def record(self, start: float, status: str):
+        labels = {"agent": self.agent_name, "model": self.model_name}
+        metrics.observe("readyflight_llm_duration_seconds", time.perf_counter() - start, **labels)
+        metrics.inc("readyflight_llm_calls_total", status=status, **labels)
+
+    async def get_response(self, *args, **kwargs):
+        start, status = time.perf_counter(), "error"
+        try:
+            response = await self.model.get_response(*args, **kwargs)
+            record_llm_usage(self.agent_name, self.model_name, response.usage)
+            status = "ok"
+            return response
+        finally:
+            self.record(start, status)
+
+    async def stream_response(self, *args, **kwargs):
+        start, status = time.perf_counter(), "error"
+        try:
+            async for event in self.model.stream_response(*args, **kwargs):
+                if getattr(event, "type", None) == "response.completed":
+                    record_llm_usage(self.agent_name, self.model_name, event.response.usage)
+                yield event
+            status = "ok"
+        finally:
+            self.record(start, status)
+
+def instrument_tool(tool: FunctionTool, agent_name: str) -> FunctionTool:
+    invoke = tool.on_invoke_tool
+
+    async def on_invoke_tool(ctx, input):
+        token = current_agent.set(agent_name)
+        start, status = time.perf_counter(), "error"
+        try:
+            result = await invoke(ctx, input)
+            # Tools report problems as "❌ ..." replies; the SDK turns exceptions into "An error occurred ..."
+            status = "failed" if str(result).startswith(("❌", "An error occurred")) else "ok"
+            return result
+        finally:
+            labels = {"agent": agent_name, "tool": tool.name}
+            metrics.observe("readyflight_tool_duration_seconds", time.perf_counter() - start, **labels)
+            metrics.inc("readyflight_tool_calls_total", status=status, **labels)
+            current_agent.reset(token)
+
+    return dataclasses.replace(tool, on_invoke_tool=on_invoke_tool)
+
+def instrument_agent(agent: Agent, agent_name: str):
+    """Record metrics for every model call and tool call the agent makes."""
+    agent.model = InstrumentedModel(agent.model, agent_name)
+    agent.tools = [instrument_tool(tool, agent_name) if isinstance(tool, FunctionTool) else tool for tool in agent.tools]
+
+# ================================================================== Tracing
+
+TRACE_BUFFER_SIZE = int(os.getenv("TRACE_BUFFER_SIZE", "200"))
+TRACE_EXPORT_PATH = os.getenv("TRACE_EXPORT_PATH")  # append finished traces here as JSONL when set
+TRACE_INCLUDE_CONTENT = os.getenv("TRACE_INCLUDE_CONTENT", "false").lower() == "true"
+TRACE_MAX_OPEN = 1000
+TRACE_EXPORT_QUEUE_SIZE = 1000  # finished traces waiting for the export thread
+
+def span_duration_ms(span: dict) -> float | None:
+    if not span.get("started_at") or not span.get("ended_at"):
+        return None
+    started = datetime.datetime.fromisoformat(span["started_at"])
+    ended = datetime.datetime.fromisoformat(span["ended_at"])
+    return round((ended - started).total_seconds() * 1000, 3)
+
+class LocalTraceExporter(TracingProcessor):
+    """Keeps the last TRACE_BUFFER_SIZE finished traces in memory (served by /debug/traces)
+    and optionally appends each one as a JSON line to TRACE_EXPORT_PATH. Nothing leaves the host.
+    The file is written by a background thread, so a request never waits on the disk; if it
+    falls TRACE_EXPORT_QUEUE_SIZE traces behind, further ones are only kept in memory."""
+
+    def __init__(self, buffer_size: int, export_path: str | None):
+        self.finished = deque(maxlen=buffer_size)
+        self.open = OrderedDict()
+        self.export_path = export_path
+        self.lock = threading.Lock()
+        self.dropped = 0
+        self.pending = queue.Queue(maxsize=TRACE_EXPORT_QUEUE_SIZE) if export_path else None
+        self.writer = threading.Thread(target=self.write_loop, name="trace-export", daemon=True) if export_path else None
+        if self.writer:
+            self.writer.start()
+
+    def write_loop(self):
+        with open(self.export_path, "a", encoding="utf-8") as f:
+            while True:
+                record = self.pending.get()
+                if record is not None:
+                    f.write(json.dumps(record, default=str) + "\n")
+                if record is None or self.pending.empty():
+                    f.flush()
+                self.pending.task_done()
+                if record is None:
+                    return
+
+    def on_trace_start(self, trace):
+        with self.lock:
+            self.open[trace.trace_id] = []
+            while len(self.open) > TRACE_MAX_OPEN:  # traces that never ended
+                self.open.popitem(last=False)
+
+    def on_span_start(self, span):
+        pass
+
+    def on_span_end(self, span):
+        exported = span.export()
+        if not exported:
+            return
+        exported["duration_ms"] = span_duration_ms(exported)
+        data = exported["span_data"]
+        if data.get("type") == "generation" and not TRACE_INCLUDE_CONTENT:
+            data.pop("input", None)
+            data.pop("output", None)
+        with self.lock:
+            spans = self.open.get(span.trace_id)
+            if spans is not None:
+                spans.append(exported)
+
+    def on_trace_end(self, trace):
+        with self.lock:
+            spans = self.open.pop(trace.trace_id, [])
+        record = {**(trace.export() or {}), "spans": sorted(spans, key=lambda span: span["started_at"] or "")}
+        roots = [span for span in spans if span["parent_id"] is None]
+        record["duration_ms"] = sum(span["duration_ms"] or 0 for span in roots)
+        usage = [span["span_data"].get("usage") or {} for span in spans]
+        record["input_tokens"] = sum(item.get("input_tokens") or 0 for item in usage)
+        record["output_tokens"] = sum(item.get("output_tokens") or 0 for item in usage)
+        with self.lock:
+            self.finished.append(record)
+        if self.pending is not None:
+            try:
+                self.pending.put_nowait(record)
+            except queue.Full:
+                self.dropped += 1
+
+    def recent(self, limit: int) -> list[dict]:
+        with self.lock:
+            return list(self.finished)[-limit:][::-1]
+
+    def get(self, trace_id: str) -> dict | None:
+        with self.lock:
+            return next((record for record in self.finished if record.get("id") == trace_id), None)
+
+    def shutdown(self):
+        if self.writer and self.writer.is_alive():
+            self.pending.put(None)
+            self.writer.join(timeout=5)
+
+    def force_flush(self):
+        if self.writer and self.writer.is_alive():
+            self.pending.join()
+
+trace_exporter = LocalTraceExporter(TRACE_BUFFER_SIZE, TRACE_EXPORT_PATH)
+# Replace the SDK's default exporter, which uploads to OpenAI's tracing backend
+set_trace_processors([trace_exporter])
+
+# ================================================================== Booking IDs
+
+class BookingIdGenerator:
+    """Snowflake-style booking IDs that need no database round-trip.
+    Layout: 41 bits of milliseconds since 2024-01-01, 10 bits of worker id, 12 bits of
+    per-millisecond sequence, written as 13 Crockford base32 characters after the prefix
+    (e.g. RF0E4T1M7Q2K0G5). IDs sort by creation time and never collide between workers
+    with different worker ids."""
+    EPOCH_MS = 1704067200000
+    WORKER_BITS = 10
+    SEQUENCE_BITS = 12
+    ALPHABET = "0123456789ABCDEFGHJKMNPQRSTVWXYZ"
+
+    def __init__(self, worker_id: int, prefix: str = "RF"):
+        if not 0 <= worker_id < 1 << self.WORKER_BITS:
+            raise ValueError(f"worker_id must be between 0 and {(1 << self.WORKER_BITS) - 1}")
+        self.worker_id = worker_id
+        self.prefix = prefix
+        self.lock = threading.Lock()
+        self.last_ms = -1
+        self.sequence = 0
+
+    def next_id(self) -> str:
+        with self.lock:
+            now_ms = int(time.time() * 1000) - self.EPOCH_MS
+            if now_ms > self.last_ms:
+                self.last_ms, self.sequence = now_ms, 0
+            else:
+                # Same millisecond, or the clock stepped back: keep counting from the last timestamp
+                self.sequence += 1
+                if self.sequence >> self.SEQUENCE_BITS:
+                    self.last_ms, self.sequence = self.last_ms + 1, 0
+            value = (self.last_ms << (self.WORKER_BITS + self.SEQUENCE_BITS)) | (self.worker_id << self.SEQUENCE_BITS) | self.sequence
+        chars = []
+        for _ in range(13):
+            value, digit = divmod(value, 32)
+            chars.append(self.ALPHABET[digit])
+        return self.prefix + "".join(reversed(chars))
+
+BOOKING_WORKER_LOCK_PATH = os.getenv("BOOKING_WORKER_LOCK_PATH", os.path.join(tempfile.gettempdir(), "readyflight-booking-workers.lock"))
+
+def lease_booking_worker_id(path: str) -> int:
+    """Lock one byte of a host-wide lock file and use its offset as the worker id. The OS drops
+    the lock when the process exits, so two live processes on one host never share an id."""
+    size = 1 << BookingIdGenerator.WORKER_BITS
+    fd = os.open(path, os.O_RDWR | os.O_CREAT, 0o666)
+    start = os.getpid() % size
+    for worker_id in [(start + offset) % size for offset in range(size)]:
+        try:
+            if fcntl:
+                fcntl.lockf(fd, fcntl.LOCK_EX | fcntl.LOCK_NB, 1, worker_id)
+            else:
+                os.lseek(fd, worker_id, os.SEEK_SET)
+                msvcrt.locking(fd, msvcrt.LK_NBLCK, 1)
+        except OSError:
+            continue
+        return worker_id  # fd stays open for the life of the process: closing it would release the lock
+    os.close(fd)
+    raise RuntimeError(f"All {size} booking worker ids on this host are in use; set BOOKING_WORKER_ID")
+
+def default_booking_worker_id() -> int:
+    """BOOKING_WORKER_ID if set (set a distinct one per process when running several hosts, since
+    leases are per host), else a worker id leased from BOOKING_WORKER_LOCK_PATH."""
+    worker_id = os.getenv("BOOKING_WORKER_ID")
+    if worker_id is not None:
+        return int(worker_id)
+    return lease_booking_worker_id(BOOKING_WORKER_LOCK_PATH)
+
+booking_ids = BookingIdGenerator(default_booking_worker_id())
+if hasattr(os, "register_at_fork"):
+    # Forked workers (e.g. gunicorn --preload) do not inherit the parent's lock: lease their own id
+    os.register_at_fork(after_in_child=lambda: setattr(booking_ids, "worker_id", default_booking_worker_id()))
+
+# ================================================================== Seat Inventory
+
+def parse_seats(available_seats: str) -> list[str]:
+    return [seat.strip() for seat in (available_seats or "").split(",") if seat.strip()]
+
+async def seed_seats(db: AsyncSession, flight_number: str, seats: list[str]):
+    """Insert one available seat row per seat number."""
+    if seats:
+        await db.execute(FlightSeat.__table__.insert(), [
+            {"flight_number": flight_number, "seat_number": seat, "state": SEAT_AVAILABLE, "booking_id": None}
+            for seat in seats
+        ])
+
+async def record_schedule_change(db: AsyncSession, flight_numbers):
+    """Log changed flights in the caller's transaction, for other workers' schedule snapshots.
+    This worker updates its own snapshot directly, so the ids are kept for its poll to skip."""
+    rows = [{"flight_number": flight_number} for flight_number in dict.fromkeys(flight_numbers)]
+    if rows:
+        table = ScheduleChange.__table__
+        ids = (await db.execute(table.insert().returning(table.c.id), rows)).scalars().all()
+        db.info.setdefault("schedule_change_ids", []).extend(ids)
+
+async def claim_seat(db: AsyncSession, flight_number: str, booking_id: str, preferred_seat: str = None) -> str | None:
+    """Atomically claim a seat for a booking, returning the seat number or None if sold out.
+    The candidate row is picked with FOR UPDATE SKIP LOCKED (Postgres), and the UPDATE
+    re-checks the state, so two transactions can never claim the same seat.
+    The claim is part of the caller's transaction and is released on rollback."""
+    async def attempt(seat_number=None):
+        candidate = select(FlightSeat.id).where(
+            FlightSeat.flight_number == flight_number,
+            FlightSeat.state == SEAT_AVAILABLE,
+        )
+        if seat_number:
+            candidate = candidate.where(FlightSeat.seat_number == seat_number)
+        candidate = candidate.order_by(FlightSeat.id).limit(1).with_for_update(skip_locked=True).scalar_subquery()
+        stmt = (
+            update(FlightSeat)
+            .where(FlightSeat.id == candidate, FlightSeat.state == SEAT_AVAILABLE)
+            .values(state=SEAT_BOOKED, booking_id=booking_id)
+            .returning(FlightSeat.seat_number)
+        )
+        return (await db.execute(stmt)).scalar_one_or_none()
+
+    seat = await attempt(preferred_seat) if preferred_seat else None
+    return seat or await attempt()
+
+async def release_seat(db: AsyncSession, flight_number: str, seat_number: str, booking_id: str) -> bool:
+    """Return a booked seat to the pool. Only the booking that holds the seat can release it."""
+    stmt = (
+        update(FlightSeat)
+        .where(
+            FlightSeat.flight_number == flight_number,
+            FlightSeat.seat_number == seat_number,
+            FlightSeat.booking_id == booking_id,
+        )
+        .values(state=SEAT_AVAILABLE, booking_id=None)
+    )
+    if (await db.execute(stmt)).rowcount:
+        return True
+    # Bookings made before the seat table existed have no seat row yet
+    exists = (await db.execute(select(FlightSeat.id).where(
+        FlightSeat.flight_number == flight_number, FlightSeat.seat_number == seat_number
+    ))).first()
+    if exists:
+        return False
+    await seed_seats(db, flight_number, [seat_number])
+    return True
+
+async def cancel_booking(db: AsyncSession, booking_id: str) -> tuple[str, tuple | None]:
+    """Cancel a booking and release its seat in one transaction.
+    The conditional UPDATE ... RETURNING flips booked only while it is still True, so of any
+    number of concurrent or repeated cancels exactly one gets the row and frees the seat.
+    Returns ("cancelled" | "already_cancelled" | "not_found", (flight_number, seat) or None)."""
+    stmt = (
+        update(Booking)
+        .where(Booking.booking_id == booking_id, Booking.booked == True)
+        .values(booked=False)
+        .returning(Booking.flight_number, Booking.available_seat)
+    )
+    row = (await db.execute(stmt)).first()
+    if row:
+        await release_seat(db, row.flight_number, row.available_seat, booking_id)
+        await record_schedule_change(db, [row.flight_number])
+        await db.commit()
+        schedule_store.seats_changed(row.flight_number, released=[row.available_seat])
+        await bump_schedule_version()
+        return "cancelled", tuple(row)
+    await db.rollback()
+    # Only misses pay for a second lookup, to tell a repeated cancel from a wrong number
+    row = (await db.execute(
+        select(Booking.flight_number, Booking.available_seat).where(Booking.booking_id == booking_id)
+    )).first()
+    return ("already_cancelled", tuple(row)) if row else ("not_found", None)
+
+async def available_seats_by_flight(db: AsyncSession, flight_numbers: list[str]) -> dict[str, list[str]]:
+    """Available seat numbers for a batch of flights in one query."""
+    seats = {flight_number: [] for flight_number in flight_numbers}
+    if flight_numbers:
+        rows = await db.execute(
+            select(FlightSeat.flight_number, FlightSeat.seat_number)
+            .where(FlightSeat.flight_number.in_(flight_numbers), FlightSeat.state == SEAT_AVAILABLE)
+            .order_by(FlightSeat.id)
+        )
+        for flight_number, seat_number in rows:
+            seats[flight_number].append(seat_number)
+    return seats
+
+def flight_occupancy_query():
+    """Flights with their available and booked seat counts, aggregated in a single query."""
+    available = (
+        select(FlightSeat.flight_number, func.count(FlightSeat.id).label("available"))
+        .where(FlightSeat.state == SEAT_AVAILABLE)
+        .group_by(FlightSeat.flight_number)
+        .subquery()
+    )
+    booked = (
+        select(Booking.flight_number, func.count(Booking.id).label("booked"))
+        .where(Booking.booked == True)
+        .group_by(Booking.flight_number)
+        .subquery()
+    )
+    return (
+        select(Flight, func.coalesce(available.c.available, 0), func.coalesce(booked.c.booked, 0))
+        .outerjoin(available, available.c.flight_number == Flight.flight_number)
+        .outerjoin(booked, booked.c.flight_number == Flight.flight_number)
+        .order_by(Flight.id)
+    )
+
+def create_missing_indexes(sync_conn):
+    """create_all skips tables that already exist, so add indexes introduced since then."""
+    for table in Base.metadata.sorted_tables:
+        for index in table.indexes:
+            try:
+                with sync_conn.begin_nested():
+                    index.create(sync_conn, checkfirst=True)
+            except Exception as e:
+                # e.g. duplicate legacy booking ids block the unique index; keep serving
+                print(f"⚠️ Could not create index {index.name}: {str(e)}")
+
+async def migrate_legacy_seats(db: AsyncSession):
+    """Move seats from the legacy comma-joined Flight.available_seats column into flight_seats."""
+    flights = (await db.execute(select(Flight).where(Flight.available_seats != ""))).scalars().all()
+    for flight in flights:
+        has_rows = (await db.execute(select(FlightSeat.id).where(FlightSeat.flight_number == flight.flight_number))).first()
+        if not has_rows:
+            await seed_seats(db, flight.flight_number, parse_seats(flight.available_seats))
+        flight.available_seats = ""
+    await db.commit()
+
+# ================================================================== Booking Listing
+
+BOOKING_PAGE_SIZE = 20
+MAX_BOOKING_PAGE_SIZE = 50
+
+def encode_cursor(last_id: int) -> str:
+    return base64.urlsafe_b64encode(f"b:{last_id}".encode()).decode().rstrip("=")
+
+def decode_cursor(cursor: str) -> int:
+    """Turn a continuation token back into the last booking id seen. Raises ValueError if invalid."""
+    try:
+        raw = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4)).decode()
+        prefix, last_id = raw.split(":", 1)
+        if prefix != "b":
+            raise ValueError
+        return int(last_id)
+    except Exception:
+        raise ValueError(f"Invalid page token: {cursor}")
+
+def parse_date(value: str | None) -> datetime.datetime | None:
+    return datetime.datetime.fromisoformat(value) if value else None
+
+def booking_page_query(limit: int, after_id: int = None, flight_number: str = None, status: str = None,
+                       created_from: datetime.datetime = None, created_to: datetime.datetime = None):
+    """Bookings joined to their flight's route, keyset-paginated on Booking.id.
+    Fetches one extra row so callers can tell whether another page exists."""
+    query = (
+        select(Booking, Flight.departure, Flight.arrival)
+        .outerjoin(Flight, Flight.flight_number == Booking.flight_number)
+        .order_by(Booking.id)
+        .limit(limit + 1)
+    )
+    if after_id is not None:
+        query = query.where(Booking.id > after_id)
+    if flight_number:
+        query = query.where(Booking.flight_number == flight_number)
+    if status:
+        query = query.where(Booking.booked == (status.lower() == "confirmed"))
+    if created_from:
+        query = query.where(Booking.created_at >= created_from)
+    if created_to:
+        query = query.where(Booking.created_at < created_to)
+    return query
+
+# ================================================================== Group Booking
+
+MAX_GROUP_SIZE = int(os.getenv("MAX_GROUP_SIZE", "9"))
+GROUP_CLAIM_ATTEMPTS = 3
+
+class GroupBookingError(Exception):
+    """A group booking that could not be made; the message is safe to show to the customer."""
+
+class GroupSeatsTakenError(GroupBookingError):
+    """Other bookings kept taking the picked seats, but the flight still has room: worth retrying."""
+
+def split_seat(seat_number: str) -> tuple[int, str] | None:
+    match = re.fullmatch(r"(\d+)([A-Za-z])", seat_number.strip())
+    return (int(match.group(1)), match.group(2).upper()) if match else None
+
+def pick_group_seats(seat_numbers: list[str], count: int) -> list[str]:
+    """Choose seats for a group, preferring adjacent ones: a run of consecutive letters in one
+    row, else the fewest consecutive rows, else the first free seats in inventory order."""
+    rows: dict[int, list[str]] = {}
+    for seat in seat_numbers:
+        parsed = split_seat(seat)
+        if parsed:
+            rows.setdefault(parsed[0], []).append(seat)
+    for row in sorted(rows):
+        seats = sorted(rows[row], key=lambda seat: split_seat(seat)[1])
+        run = seats[:1]
+        for previous, seat in zip(seats, seats[1:]):
+            run = run + [seat] if ord(split_seat(seat)[1]) - ord(split_seat(previous)[1]) == 1 else [seat]
+            if len(run) >= count:
+                break
+        if len(run) >= count:
+            return run[:count]
+
+    best = None
+    row_numbers = sorted(rows)
+    for start in range(len(row_numbers)):
+        block = []
+        for index in range(start, len(row_numbers)):
+            if index > start and row_numbers[index] != row_numbers[index - 1] + 1:
+                break
+            block += sorted(rows[row_numbers[index]], key=lambda seat: split_seat(seat)[1])
+            if len(block) >= count:
+                if best is None or index - start < best[0]:
+                    best = (index - start, block[:count])
+                break
+    return best[1] if best else seat_numbers[:count]
+
+async def book_group(db: AsyncSession, flight_number: str, passenger_names: list[str]) -> tuple[Flight, list[Booking]]:
+    """Book seats for every passenger on one flight in a single transaction: either all
+    bookings are committed or none are. Seats are picked optimistically and claimed with one
+    conditional UPDATE; if another booking took one of them first, the pick is retried against
+    fresh availability. Raises GroupSeatsTakenError if every attempt lost a race but the seats
+    are still there, so the group is not told the flight is full."""
+    names = [name.strip() for name in passenger_names if name and name.strip()]
+    if not names:
+        raise GroupBookingError("Please give me at least one passenger name.")
+    if len(names) > MAX_GROUP_SIZE:
+        raise GroupBookingError(f"Group bookings are limited to {MAX_GROUP_SIZE} passengers.")
+
+    flight = (await db.execute(select(Flight).where(Flight.flight_number == flight_number))).scalars().first()
+    if not flight:
+        raise GroupBookingError(f"Sorry, flight {flight_number} was not found. Please check the flight number and try again.")
+    # Detach so a retry's rollback doesn't expire the fields copied into each booking
+    db.expunge(flight)
+
+    for _ in range(GROUP_CLAIM_ATTEMPTS):
+        available = (await db.execute(
+            select(FlightSeat.id, FlightSeat.seat_number)
+            .where(FlightSeat.flight_number == flight_number, FlightSeat.state == SEAT_AVAILABLE)
+            .order_by(FlightSeat.id)
+        )).all()
+        if len(available) < len(names):
+            await db.rollback()
+            raise GroupBookingError(f"Sorry, flight {flight_number} does not have {len(names)} seats left for your group.")
+        seat_ids = dict((seat_number, seat_id) for seat_id, seat_number in available)
+        seats = pick_group_seats([seat_number for _, seat_number in available], len(names))
+        assigned = {seat_ids[seat]: booking_ids.next_id() for seat in seats}
+        claimed = (await db.execute(
+            update(FlightSeat)
+            .where(FlightSeat.id.in_(assigned), FlightSeat.state == SEAT_AVAILABLE)
+            .values(state=SEAT_BOOKED, booking_id=case(assigned, value=FlightSeat.id))
+            .returning(FlightSeat.id)
+        )).scalars().all()
+        if len(claimed) == len(seats):
+            bookings = [Booking(
+                booking_id=assigned[seat_ids[seat]],
+                flight_number=flight_number,
+                passenger_name=name,
+                departure=flight.departure,
+                arrival=flight.arrival,
+                departure_time=flight.departure_time,
+                arrival_time=flight.arrival_time,
+                available_seat=seat,
+                price=flight.price,
+                booked=True
+            ) for name, seat in zip(names, seats)]
+            db.add_all(bookings)
+            await record_schedule_change(db, [flight_number])
+            await db.commit()
+            schedule_store.seats_changed(flight_number, taken=seats)
+            await bump_schedule_version()
+            return flight, bookings
+        # Lost a race for at least one seat: undo the partial claim and pick again
+        await db.rollback()
+
+    left = (await db.execute(
+        select(func.count(FlightSeat.id)).where(FlightSeat.flight_number == flight_number, FlightSeat.state == SEAT_AVAILABLE)
+    )).scalar_one()
+    await db.rollback()
+    if left >= len(names):
+        raise GroupSeatsTakenError(f"Seats on flight {flight_number} were taken by other bookings while we were seating your group. "
+                                   "Please try again.")
+    raise GroupBookingError(f"Sorry, flight {flight_number} does not have {len(names)} seats left for your group.")
+
+# ================================================================== Route Search
+
+SCHEDULE_RESULT_LIMIT = 20
+FUZZY_MATCH_THRESHOLD = 0.4
+
+@functools.lru_cache(maxsize=8192)
+def normalize_place(place: str) -> str:
+    return " ".join(re.sub(r"[^0-9a-z]+", " ", (place or "").lower()).split())
+
+@functools.lru_cache(maxsize=8192)
+def place_code(place: str) -> str:
+    """Route code for a departure/arrival string: its IATA code ("New York JFK" -> "JFK") or its normalized name."""
+    tokens = (place or "").split()
+    if tokens and re.fullmatch(r"[A-Z]{3}", tokens[-1]):
+        return tokens[-1]
+    return normalize_place(place)
+
+@functools.lru_cache(maxsize=8192)
+def place_aliases(place: str) -> frozenset[str]:
+    """Every normalized spelling that should resolve to this place: full name, code and city."""
+    full = normalize_place(place)
+    code = place_code(place)
+    aliases = {full, code.lower()}
+    if code != full and full.endswith(" " + code.lower()):
+        aliases.add(full[: -len(code) - 1])
+    return frozenset(alias for alias in aliases if alias)
+
+def trigrams(term: str) -> set[str]:
+    padded = f"  {term} "
+    return {padded[i:i + 3] for i in range(len(padded) - 2)}
+
+class AliasIndex:
+    """In-process token and trigram index over airport_aliases, used only when the exact and
+    prefix lookups (which run on the indexed alias column) find nothing."""
+
+    def __init__(self):
+        self.codes_by_token: dict[str, set[str]] = {}
+        self.aliases_by_trigram: dict[str, set[str]] = {}
+        self.codes_by_alias: dict[str, set[str]] = {}
+
+    def add(self, alias: str, code: str):
+        self.codes_by_alias.setdefault(alias, set()).add(code)
+        for token in alias.split():
+            self.codes_by_token.setdefault(token, set()).add(code)
+        for gram in trigrams(alias):
+            self.aliases_by_trigram.setdefault(gram, set()).add(alias)
+
+    def token_match(self, term: str) -> set[str]:
+        """Codes whose aliases contain every token of the term."""
+        codes = None
+        for token in term.split():
+            matches = self.codes_by_token.get(token, set())
+            codes = matches if codes is None else codes & matches
+        return codes or set()
+
+    def fuzzy_match(self, term: str) -> set[str]:
+        """Codes of the aliases most similar to the term (trigram Jaccard), for typos like "chicgo"."""
+        grams = trigrams(term)
+        overlap: dict[str, int] = {}
+        for gram in grams:
+            for alias in self.aliases_by_trigram.get(gram, ()):
+                overlap[alias] = overlap.get(alias, 0) + 1
+        best, best_score = set(), FUZZY_MATCH_THRESHOLD
+        for alias, shared in overlap.items():
+            score = shared / len(grams | trigrams(alias))
+            if score > best_score:
+                best, best_score = set(self.codes_by_alias[alias]), score
+            elif score == best_score and best:
+                best |= self.codes_by_alias[alias]
+        return best
+
+alias_index = AliasIndex()
+
+async def register_route(db: AsyncSession, flight: Flight) -> set[tuple[str, str]]:
+    """Store the flight's route codes and any aliases of its airports that are new. Returns the
+    new (alias, code) pairs for the caller to add to alias_index once the transaction commits."""
+    departure_code, arrival_code = place_code(flight.departure), place_code(flight.arrival)
+    route = await db.get(FlightRoute, flight.id)
+    if route:
+        route.departure_code, route.arrival_code = departure_code, arrival_code
+    else:
+        db.add(FlightRoute(flight_id=flight.id, departure_code=departure_code, arrival_code=arrival_code))
+
+    wanted = {(alias, place_code(place)) for place in (flight.departure, flight.arrival) for alias in place_aliases(place)}
+    existing = set((await db.execute(
+        select(AirportAlias.alias, AirportAlias.code).where(AirportAlias.alias.in_({alias for alias, _ in wanted}))
+    )).all())
+    for alias, code in wanted - existing:
+        db.add(AirportAlias(alias=alias, code=code))
+    return wanted - existing
+
+async def resolve_place(db: AsyncSession, place: str) -> set[str]:
+    """Route codes matching a user-typed place: exact alias, then alias prefix (both B-tree
+    lookups on airport_aliases.alias), then token and trigram matches from the alias index."""
+    term = normalize_place(place)
+    if not term:
+        return set()
+    codes = set((await db.execute(select(AirportAlias.code).where(AirportAlias.alias == term))).scalars())
+    if not codes:
+        # Range scan instead of LIKE 'term%' so any B-tree index can serve it regardless of collation
+        codes = set((await db.execute(
+            select(AirportAlias.code).where(AirportAlias.alias >= term, AirportAlias.alias < term + "\uffff")
+        )).scalars())
+    return codes or alias_index.token_match(term) or alias_index.fuzzy_match(term)
+
+async def migrate_routes(db: AsyncSession):
+    """Backfill flight_routes for flights added before route search existed and load the alias index."""
+    missing = (await db.execute(
+        select(Flight).outerjoin(FlightRoute, FlightRoute.flight_id == Flight.id).where(FlightRoute.flight_id == None)
+    )).scalars().all()
+    for flight in missing:
+        await register_route(db, flight)
+        await db.flush()
+    await db.commit()
+    for alias, code in await db.execute(select(AirportAlias.alias, AirportAlias.code)):
+        alias_index.add(alias, code)
+
+async def available_seat_counts(db: AsyncSession, flight_numbers: list[str]) -> dict[str, int]:
+    rows = await db.execute(
+        select(FlightSeat.flight_number, func.count(FlightSeat.id))
+        .where(FlightSeat.flight_number.in_(flight_numbers), FlightSeat.state == SEAT_AVAILABLE)
+        .group_by(FlightSeat.flight_number)
+    )
+    return dict(rows.all())
 
 @app.on_event("startup")
 async def startup_event():
     try:
-        Base.metadata.create_all(bind=engine)
-        with SessionLocal() as db:
-            db.execute("SELECT 1")
+        async with async_engine.begin() as conn:
+            await conn.run_sync(Base.metadata.create_all)
+            await conn.run_sync(create_missing_indexes)
+        async with AsyncSessionLocal() as db:
+            await db.execute(text("SELECT 1"))
+            await migrate_legacy_seats(db)
+            await migrate_routes(db)
+        await warm_pool(min(DB_POOL_WARM_CONNECTIONS, DB_POOL_SIZE))
+        if SCHEDULE_SNAPSHOT_ENABLED:
+            global schedule_refresh_task
+            await schedule_store.rebuild()
+            if schedule_refresh_task is None:
+                schedule_refresh_task = asyncio.create_task(schedule_store.refresh_loop())
         print("✅ Database initialized successfully")
     except Exception as e:
         print(f"❌ Database initialization failed: {str(e)}")
@@ -82,15 +1027,63 @@ class AirlineAgentContext(BaseModel):
     flight_number: str | None = None
     user_type: str
 
+CHAT_MESSAGE_MAX_CHARS = int(os.getenv("CHAT_MESSAGE_MAX_CHARS", "4000"))
+
 class ChatMessage(BaseModel):
-    message: str | None = None
+    message: str = Field(max_length=CHAT_MESSAGE_MAX_CHARS)
     user_type: str
+    fast_path: bool = True  # set False to always run the agent
+    session_id: str | None = None  # from a previous response, to continue that conversation
+
+class GroupBookingRequest(BaseModel):
+    flight_number: str
+    passenger_names: list[str]
 
 class ChatResponse(BaseModel):
     response: str
     agent_type: str
     session_id: str
 
+# Agent runs are awaited on the event loop; cap how many run at once and how long each may take
+MAX_CONCURRENT_AGENT_RUNS = int(os.getenv("MAX_CONCURRENT_AGENT_RUNS", "32"))
+AGENT_RUN_TIMEOUT_SECONDS = float(os.getenv("AGENT_RUN_TIMEOUT_SECONDS", "60"))
+agent_run_limiter = asyncio.Semaphore(MAX_CONCURRENT_AGENT_RUNS)
+
+async def run_agent(agent, message: str | list[dict], context):
+    """Run an agent without blocking the event loop, bounded by the limiter and the deadline.
+    Time spent waiting for a free slot counts against the deadline."""
+    async def limited_run():
+        async with agent_run_limiter:
+            return await Runner.run(agent, input=message, context=context)
+
+    return await asyncio.wait_for(limited_run(), timeout=AGENT_RUN_TIMEOUT_SECONDS)
+
+async def with_deadline(events, deadline: float):
+    """Re-yield an async iterator, raising asyncio.TimeoutError once the loop clock passes the deadline."""
+    loop = asyncio.get_running_loop()
+    iterator = events.__aiter__()
+    while True:
+        try:
+            yield await asyncio.wait_for(iterator.__anext__(), timeout=max(0, deadline - loop.time()))
+        except StopAsyncIteration:
+            return
+
+@contextlib.asynccontextmanager
+async def stream_agent(agent, message: str | list[dict], context):
+    """Streaming counterpart of run_agent: holds a limiter slot for the whole run, applies the
+    same deadline to the run's events and cancels the run if the client goes away early."""
+    deadline = asyncio.get_running_loop().time() + AGENT_RUN_TIMEOUT_SECONDS
+    await asyncio.wait_for(agent_run_limiter.acquire(), timeout=AGENT_RUN_TIMEOUT_SECONDS)
+    try:
+        result = Runner.run_streamed(agent, input=message, context=context)
+        try:
+            yield result, with_deadline(result.stream_events(), deadline)
+        finally:
+            if not result.is_complete:
+                result.cancel()
+    finally:
+        agent_run_limiter.release()
+
 # Load the API key from environment variables
 def get_gemini_api_key():
     try:
@@ -106,8 +1099,679 @@ openai_client = AsyncOpenAI(
     base_url="https://generativelanguage.googleapis.com/v1beta/openai/"
 )
 
+# ================================================================== Response Cache
+
+RESPONSE_CACHE_ENABLED = os.getenv("RESPONSE_CACHE_ENABLED", "true").lower() == "true"
+RESPONSE_CACHE_TTL_SECONDS = int(os.getenv("RESPONSE_CACHE_TTL_SECONDS", "600"))
+RESPONSE_CACHE_MAX_ENTRIES = int(os.getenv("RESPONSE_CACHE_MAX_ENTRIES", "1000"))
+RESPONSE_CACHE_URL = os.getenv("RESPONSE_CACHE_URL")  # e.g. redis://localhost:6379/0 to share across workers
+SCHEDULE_VERSION_KEY = "readyflight:schedule_version"
+
+class InMemoryCacheBackend:
+    """Per-process cache with TTL expiry and LRU eviction."""
+
+    def __init__(self, max_entries: int):
+        self.max_entries = max_entries
+        self.entries: OrderedDict[str, tuple[float, str]] = OrderedDict()
+        # Counters live outside the LRU so a version stamp is never evicted
+        self.counters: dict[str, int] = {}
+
+    async def get(self, key: str) -> str | None:
+        entry = self.entries.get(key)
+        if entry is None:
+            return None
+        expires_at, value = entry
+        if expires_at < time.monotonic():
+            del self.entries[key]
+            return None
+        self.entries.move_to_end(key)
+        return value
+
+    async def set(self, key: str, value: str, ttl: int):
+        self.entries[key] = (time.monotonic() + ttl, value)
+        self.entries.move_to_end(key)
+        while len(self.entries) > self.max_entries:
+            self.entries.popitem(last=False)
+
+    async def get_counter(self, key: str) -> int:
+        return self.counters.get(key, 0)
+
+    async def incr(self, key: str) -> int:
+        self.counters[key] = self.counters.get(key, 0) + 1
+        return self.counters[key]
+
+class RedisCacheBackend:
+    """Cache shared by every worker. Expiry uses Redis TTLs; eviction follows the server's maxmemory-policy."""
+
+    def __init__(self, url: str):
+        import redis.asyncio as redis  # optional dependency, only needed for a shared cache
+        self.client = redis.from_url(url, decode_responses=True)
+
+    async def get(self, key: str) -> str | None:
+        return await self.client.get(key)
+
+    async def set(self, key: str, value: str, ttl: int):
+        await self.client.set(key, value, ex=ttl)
+
+    async def get_counter(self, key: str) -> int:
+        return int(await self.client.get(key) or 0)
+
+    async def incr(self, key: str) -> int:
+        return await self.client.incr(key)
+
+response_cache = RedisCacheBackend(RESPONSE_CACHE_URL) if RESPONSE_CACHE_URL else InMemoryCacheBackend(RESPONSE_CACHE_MAX_ENTRIES)
+response_cache_stats = {"hits": 0, "misses": 0, "invalidations": 0}
+
+def normalize_question(message: str) -> str:
+    return " ".join(re.sub(r"[^0-9a-z]+", " ", (message or "").lower()).split())
+
+async def response_cache_key(agent_name: str, message: str) -> str:
+    """Cache key from the agent, the normalized question and the current schedule version,
+    so a schedule change makes every older answer unreachable."""
+    version = await response_cache.get_counter(SCHEDULE_VERSION_KEY)
+    digest = hashlib.sha256(normalize_question(message).encode()).hexdigest()
+    return f"readyflight:answer:{agent_name}:{version}:{digest}"
+
+async def bump_schedule_version():
+    """Invalidate cached answers after the schedule or its seat inventory changes:
+    schedule replies quote available seat counts, so bookings and cancellations count too."""
+    await response_cache.incr(SCHEDULE_VERSION_KEY)
+    response_cache_stats["invalidations"] += 1
+
+# ================================================================== Schedule Snapshot
+
+SCHEDULE_SNAPSHOT_ENABLED = os.getenv("SCHEDULE_SNAPSHOT_ENABLED", "true").lower() == "true"
+SCHEDULE_SNAPSHOT_POLL_SECONDS = float(os.getenv("SCHEDULE_SNAPSHOT_POLL_SECONDS", "2"))
+SCHEDULE_SNAPSHOT_REBUILD_SECONDS = float(os.getenv("SCHEDULE_SNAPSHOT_REBUILD_SECONDS", "3600"))  # full reload safety net
+SCHEDULE_CHANGE_OVERLAP = int(os.getenv("SCHEDULE_CHANGE_OVERLAP", "1000"))
+SCHEDULE_CHANGE_RETENTION_SECONDS = int(os.getenv("SCHEDULE_CHANGE_RETENTION_SECONDS", "86400"))
+SCHEDULE_CHANGE_REBUILD_THRESHOLD = int(os.getenv("SCHEDULE_CHANGE_REBUILD_THRESHOLD", "10000"))  # changed flights per poll
+SCHEDULE_LOAD_CHUNK = 2000  # rows processed between event loop turns during a load
+
+@dataclasses.dataclass(frozen=True)
+class ScheduledFlight:
+    """Read-only copy of a flight with its route codes and available seats."""
+    id: int
+    flight_number: str
+    departure: str
+    arrival: str
+    departure_time: str
+    arrival_time: str
+    price: float
+    status: str
+    departure_code: str
+    arrival_code: str
+    available_seats: tuple[str, ...]
+
+def merge_index(index: dict[str, tuple[int, ...]], removed: dict[str, set[int]], added: dict[str, list[int]]) -> dict:
+    """A copy of index with the ids removed and added: one dict copy, one sorted merge per touched code."""
+    if not removed and not added:
+        return index
+    index = dict(index)
+    for code in removed.keys() | added.keys():
+        kept = index.get(code, ())
+        if code in removed:
+            kept = [flight_id for flight_id in kept if flight_id not in removed[code]]
+        ids = tuple(heapq.merge(kept, sorted(set(added.get(code, ())).difference(kept))))
+        if ids:
+            index[code] = ids
+        else:
+            index.pop(code, None)
+    return index
+
+@dataclasses.dataclass(frozen=True)
+class ScheduleSnapshot:
+    """Immutable view of the schedule for customer reads. Readers hold a reference for as long
+    as they like; writers derive a new snapshot (sharing everything they did not touch) and
+    swap it in, so no reader ever sees a half-applied change. The dicts are never mutated."""
+    version: int
+    schedule_version: int  # response cache schedule version this snapshot reflects
+    built_at: float  # monotonic time of the last full rebuild
+    flights: dict[int, ScheduledFlight]
+    ids: tuple[int, ...]  # sorted flight ids, for keyset pages
+    ids_by_number: dict[str, int]
+    by_departure: dict[str, tuple[int, ...]]  # route code -> sorted flight ids
+    by_arrival: dict[str, tuple[int, ...]]
+    codes_by_alias: dict[str, frozenset[str]]
+    aliases: tuple[str, ...]  # sorted, for prefix lookups
+
+    @classmethod
+    def build(cls, flights: list[ScheduledFlight], aliases, version: int, schedule_version: int) -> "ScheduleSnapshot":
+        by_departure, by_arrival, codes_by_alias = {}, {}, {}
+        flights = sorted(flights, key=lambda flight: flight.id)
+        for flight in flights:
+            by_departure.setdefault(flight.departure_code, []).append(flight.id)
+            by_arrival.setdefault(flight.arrival_code, []).append(flight.id)
+        for alias, code in aliases:
+            codes_by_alias.setdefault(alias, set()).add(code)
+        return cls(
+            version=version,
+            schedule_version=schedule_version,
+            built_at=time.monotonic(),
+            flights={flight.id: flight for flight in flights},
+            ids=tuple(flight.id for flight in flights),
+            ids_by_number={flight.flight_number: flight.id for flight in flights},
+            by_departure={code: tuple(ids) for code, ids in by_departure.items()},
+            by_arrival={code: tuple(ids) for code, ids in by_arrival.items()},
+            codes_by_alias={alias: frozenset(codes) for alias, codes in codes_by_alias.items()},
+            aliases=tuple(sorted(codes_by_alias)),
+        )
+
+    def with_flights(self, changed: list[ScheduledFlight], aliases=(), schedule_version: int = None) -> "ScheduleSnapshot":
+        """A new snapshot with these flights added or replaced. The index changes of all of them
+        are collected first and merged once; everything they do not touch is shared with this snapshot."""
+        flights, new_ids, numbers = dict(self.flights), [], {}
+        index_changes = {"departure_code": ({}, {}), "arrival_code": ({}, {})}  # field -> (removed, added) by code
+        for flight in {flight.id: flight for flight in changed}.values():
+            old = self.flights.get(flight.id)
+            if old is None:
+                new_ids.append(flight.id)
+            if old is None or old.flight_number != flight.flight_number:
+                numbers[flight.flight_number] = flight.id
+            for field, (removed, added) in index_changes.items():
+                code = getattr(flight, field)
+                if old is None or getattr(old, field) != code:
+                    if old is not None:
+                        removed.setdefault(getattr(old, field), set()).add(flight.id)
+                    added.setdefault(code, []).append(flight.id)
+            flights[flight.id] = flight
+        ids = tuple(heapq.merge(self.ids, sorted(new_ids))) if new_ids else self.ids
+        ids_by_number = {**self.ids_by_number, **numbers} if numbers else self.ids_by_number
+        by_departure = merge_index(self.by_departure, *index_changes["departure_code"])
+        by_arrival = merge_index(self.by_arrival, *index_changes["arrival_code"])
+
+        codes_by_alias, sorted_aliases = self.codes_by_alias, self.aliases
+        new_aliases = [(alias, code) for alias, code in aliases if code not in codes_by_alias.get(alias, ())]
+        if new_aliases:
+            codes_by_alias = dict(codes_by_alias)
+            for alias, code in new_aliases:
+                codes_by_alias[alias] = codes_by_alias.get(alias, frozenset()) | {code}
+            if len(codes_by_alias) != len(sorted_aliases):
+                sorted_aliases = tuple(sorted(codes_by_alias))
+
+        return dataclasses.replace(
+            self, version=self.version + 1, flights=flights, ids=ids, ids_by_number=ids_by_number,
+            by_departure=by_departure, by_arrival=by_arrival, codes_by_alias=codes_by_alias, aliases=sorted_aliases,
+            schedule_version=self.schedule_version if schedule_version is None else schedule_version,
+        )
+
+    def resolve_place(self, place: str) -> set[str]:
+        """Same lookup order as resolve_place(), against the snapshot instead of airport_aliases."""
+        term = normalize_place(place)
+        if not term:
+            return set()
+        codes = set(self.codes_by_alias.get(term, ()))
+        if not codes:
+            for position in range(bisect.bisect_left(self.aliases, term), len(self.aliases)):
+                if not self.aliases[position].startswith(term):
+                    break
+                codes |= self.codes_by_alias[self.aliases[position]]
+        return codes or alias_index.token_match(term) or alias_index.fuzzy_match(term)
+
+    def search(self, departure_codes: set[str] | None, arrival_codes: set[str] | None, limit: int) -> list[ScheduledFlight]:
+        """Flights on matching routes in flight id order, like the flight_routes query."""
+        candidates = None
+        for index, codes in ((self.by_departure, departure_codes), (self.by_arrival, arrival_codes)):
+            if codes is not None:
+                ids = {flight_id for code in codes for flight_id in index.get(code, ())}
+                candidates = ids if candidates is None else candidates & ids
+        ids = self.ids if candidates is None else sorted(candidates)
+        return [self.flights[flight_id] for flight_id in ids[:limit]]
+
+    def page(self, after_id: int | None, limit: int) -> list[ScheduledFlight]:
+        start = bisect.bisect_right(self.ids, after_id) if after_id is not None else 0
+        return [self.flights[flight_id] for flight_id in self.ids[start:start + limit]]
+
+class ScheduleStore:
+    """Holds the current ScheduleSnapshot and keeps it up to date: seat changes from this worker's
+    bookings and cancellations are applied in memory, flights changed by staff tools are re-read,
+    and a background task re-reads only the flights that schedule_changes says other workers
+    changed. Full rebuilds (startup, imports, and a rare safety net) build in a worker thread."""
+
+    def __init__(self):
+        self.snapshot: ScheduleSnapshot | None = None
+        self.dirty: set[str] | None = None  # flights changed while a full rebuild is loading
+        self.lock = asyncio.Lock()  # one full rebuild or change poll at a time
+        self.change_cursor = 0  # highest schedule_changes id applied
+        self.applied_changes: set[int] = set()  # applied ids within SCHEDULE_CHANGE_OVERLAP below the cursor
+        self.own_changes: set[int] = set()  # ids this worker committed, already in its snapshot
+        self.stats = {"full_rebuilds": 0, "flight_reloads": 0, "seat_updates": 0, "change_polls": 0, "changes_applied": 0,
+                      "refresh_errors": 0, "last_rebuild_ms": 0.0}
+
+    def current(self) -> ScheduleSnapshot | None:
+        return self.snapshot if SCHEDULE_SNAPSHOT_ENABLED else None
+
+    async def load_flights(self, db: AsyncSession, flight_numbers: list[str] = None) -> list[ScheduledFlight]:
+        # Plain columns, not ORM entities: a full rebuild reads every flight
+        query = (
+            select(Flight.id, Flight.flight_number, Flight.departure, Flight.arrival, Flight.departure_time,
+                   Flight.arrival_time, Flight.price, Flight.status, FlightRoute.departure_code, FlightRoute.arrival_code)
+            .outerjoin(FlightRoute, FlightRoute.flight_id == Flight.id)
+            .order_by(Flight.id)
+        )
+        seats_query = (
+            select(FlightSeat.flight_number, FlightSeat.seat_number)
+            .where(FlightSeat.state == SEAT_AVAILABLE)
+            .order_by(FlightSeat.id)
+        )
+        if flight_numbers is not None:
+            query = query.where(Flight.flight_number.in_(flight_numbers))
+            seats_query = seats_query.where(FlightSeat.flight_number.in_(flight_numbers))
+        # Streamed in chunks, yielding between them, so a full load never holds the event loop for long
+        seats: dict[str, list[str]] = {}
+        async for rows in (await db.stream(seats_query)).partitions(SCHEDULE_LOAD_CHUNK):
+            for flight_number, seat_number in rows:
+                seats.setdefault(flight_number, []).append(seat_number)
+            await asyncio.sleep(0)
+        flights = []
+        async for rows in (await db.stream(query)).partitions(SCHEDULE_LOAD_CHUNK):
+            flights += [
+                ScheduledFlight(
+                    id=row.id, flight_number=row.flight_number, departure=row.departure, arrival=row.arrival,
+                    departure_time=row.departure_time, arrival_time=row.arrival_time, price=row.price, status=row.status,
+                    departure_code=row.departure_code or place_code(row.departure),
+                    arrival_code=row.arrival_code or place_code(row.arrival),
+                    available_seats=tuple(seats.get(row.flight_number, ())),
+                )
+                for row in rows
+            ]
+            await asyncio.sleep(0)
+        return flights
+
+    async def rebuild(self):
+        """Load the whole schedule into a new snapshot: rows are streamed in chunks, indexes built in a worker thread."""
+        async with self.lock:
+            start = time.perf_counter()
+            self.dirty = set()
+            try:
+                schedule_version = await response_cache.get_counter(SCHEDULE_VERSION_KEY)
+                async with AsyncSessionLocal() as db:
+                    # Changes logged so far are in the load; later ones are picked up by the next poll
+                    cursor = (await db.execute(select(func.max(ScheduleChange.id)))).scalar() or 0
+                    applied = set((await db.execute(
+                        select(ScheduleChange.id).where(ScheduleChange.id > cursor - SCHEDULE_CHANGE_OVERLAP)
+                    )).scalars())
+                    flights = await self.load_flights(db)
+                    aliases = (await db.execute(select(AirportAlias.alias, AirportAlias.code))).all()
+                    version = (self.snapshot.version + 1) if self.snapshot else 1
+                    snapshot = await asyncio.to_thread(ScheduleSnapshot.build, flights, aliases, version, schedule_version)
+                    # Changes committed while we were loading may be missing: re-read those flights
+                    while self.dirty:
+                        changed, self.dirty = self.dirty, set()
+                        snapshot = snapshot.with_flights(await self.load_flights(db, list(changed)))
+            finally:
+                self.dirty = None
+            self.snapshot = snapshot
+            self.change_cursor, self.applied_changes = cursor, applied
+            self.own_changes = {change_id for change_id in self.own_changes if change_id > cursor}
+            self.stats["full_rebuilds"] += 1
+            self.stats["last_rebuild_ms"] = round((time.perf_counter() - start) * 1000, 2)
+
+    async def reload_flights(self, db: AsyncSession, flight_numbers: list[str]):
+        """Re-read flights that were just committed and swap them into the snapshot."""
+        if self.dirty is not None:
+            self.dirty.update(flight_numbers)
+        if self.snapshot is None:
+            return
+        flights = await self.load_flights(db, flight_numbers)
+        aliases = {(alias, place_code(place)) for flight in flights for place in (flight.departure, flight.arrival)
+                   for alias in place_aliases(place)}
+        schedule_version = await response_cache.get_counter(SCHEDULE_VERSION_KEY)
+        self.snapshot = self.snapshot.with_flights(flights, aliases, schedule_version)
+        self.stats["flight_reloads"] += 1
+
+    def seats_changed(self, flight_number: str, taken=(), released=()):
+        """Apply a committed booking or cancellation to the snapshot without a database read."""
+        if self.dirty is not None:
+            self.dirty.add(flight_number)
+        snapshot = self.snapshot
+        flight_id = snapshot.ids_by_number.get(flight_number) if snapshot else None
+        if flight_id is None:
+            return
+        flight = snapshot.flights[flight_id]
+        taken = set(taken)
+        seats = tuple(seat for seat in flight.available_seats if seat not in taken)
+        seats += tuple(seat for seat in dict.fromkeys(released) if seat not in seats)
+        self.snapshot = snapshot.with_flights([dataclasses.replace(flight, available_seats=seats)])
+        self.stats["seat_updates"] += 1
+
+    def changes_committed(self, change_ids: list[int]):
+        self.own_changes.update(change_ids)
+
+    async def apply_changes(self):
+        """Re-read the flights other workers logged in schedule_changes since the last poll. Ids
+        are assigned before commit, so a slow transaction can commit below the cursor: re-check
+        the last SCHEDULE_CHANGE_OVERLAP ids and skip the ones already applied. A rebuild marker
+        (bulk imports) or more than SCHEDULE_CHANGE_REBUILD_THRESHOLD changed flights means a full rebuild."""
+        async with self.lock:
+            if self.snapshot is None:
+                return
+            async with AsyncSessionLocal() as db:
+                rows = (await db.execute(
+                    select(ScheduleChange.id, ScheduleChange.flight_number)
+                    .where(ScheduleChange.id > self.change_cursor - SCHEDULE_CHANGE_OVERLAP)
+                    .order_by(ScheduleChange.id)
+                )).all()
+                changes = [(change_id, flight_number) for change_id, flight_number in rows if change_id not in self.applied_changes]
+                self.stats["change_polls"] += 1
+                if not changes:
+                    return
+                changed = list(dict.fromkeys(flight_number for change_id, flight_number in changes if change_id not in self.own_changes))
+                rebuild = SCHEDULE_REBUILD_MARKER in changed or len(changed) > SCHEDULE_CHANGE_REBUILD_THRESHOLD
+                if changed and isinstance(response_cache, InMemoryCacheBackend):
+                    # Another worker's bump only reached its own cache
+                    await bump_schedule_version()
+                if changed and not rebuild:
+                    await self.reload_flights(db, changed)
+            self.change_cursor = max(self.change_cursor, changes[-1][0])
+            self.applied_changes = {change_id for change_id in self.applied_changes.union(change_id for change_id, _ in changes)
+                                    if change_id > self.change_cursor - SCHEDULE_CHANGE_OVERLAP}
+            self.own_changes = {change_id for change_id in self.own_changes if change_id > self.change_cursor - SCHEDULE_CHANGE_OVERLAP}
+            self.stats["changes_applied"] += len(changes)
+        if rebuild:
+            await self.rebuild()
+
+    async def prune_changes(self):
+        cutoff = datetime.datetime.utcnow() - datetime.timedelta(seconds=SCHEDULE_CHANGE_RETENTION_SECONDS)
+        async with AsyncSessionLocal() as db:
+            await db.execute(delete(ScheduleChange).where(ScheduleChange.changed_at < cutoff))
+            await db.commit()
+
+    async def refresh_loop(self):
+        """Pick up other workers' changes every SCHEDULE_SNAPSHOT_POLL_SECONDS from schedule_changes.
+        Every SCHEDULE_SNAPSHOT_REBUILD_SECONDS, rebuild fully as a safety net and prune old changes."""
+        while True:
+            await asyncio.sleep(SCHEDULE_SNAPSHOT_POLL_SECONDS)
+            try:
+                snapshot = self.snapshot
+                if snapshot is None or time.monotonic() - snapshot.built_at >= SCHEDULE_SNAPSHOT_REBUILD_SECONDS:
+                    await self.prune_changes()
+                    await self.rebuild()
+                else:
+                    await self.apply_changes()
+            except Exception as e:
+                self.stats["refresh_errors"] += 1
+                print(f"⚠️ Schedule snapshot refresh failed: {str(e)}")
+
+schedule_store = ScheduleStore()
+schedule_refresh_task: asyncio.Task | None = None
+
+def schedule_changes_committed(session: Session):
+    change_ids = session.info.pop("schedule_change_ids", None)
+    if change_ids:
+        schedule_store.changes_committed(change_ids)
+
+def schedule_changes_rolled_back(session: Session):
+    session.info.pop("schedule_change_ids", None)
+
+event.listen(Session, "after_commit", schedule_changes_committed)
+event.listen(Session, "after_rollback", schedule_changes_rolled_back)
+
+# ================================================================== Sessions
+
+SESSION_BACKEND = os.getenv("SESSION_BACKEND", "memory")  # "memory", or "sqlite" to keep sessions across restarts
+SESSION_SQLITE_PATH = os.getenv("SESSION_SQLITE_PATH", "sessions.db")
+SESSION_TTL_SECONDS = int(os.getenv("SESSION_TTL_SECONDS", "1800"))
+SESSION_MAX_ENTRIES = int(os.getenv("SESSION_MAX_ENTRIES", "10000"))
+SESSION_HISTORY_TOKENS = int(os.getenv("SESSION_HISTORY_TOKENS", "1500"))
+SESSION_SUMMARY_MAX_CHARS = int(os.getenv("SESSION_SUMMARY_MAX_CHARS", "1200"))
+
+class InMemorySessionBackend:
+    """Per-process sessions with sliding TTL expiry and LRU eviction."""
+
+    def __init__(self, max_entries: int):
+        self.max_entries = max_entries
+        self.entries: OrderedDict[str, tuple[float, str]] = OrderedDict()
+
+    async def get(self, session_id: str) -> dict | None:
+        entry = self.entries.get(session_id)
+        if entry is None:
+            return None
+        expires_at, data = entry
+        if expires_at < time.monotonic():
+            del self.entries[session_id]
+            return None
+        self.entries.move_to_end(session_id)
+        return json.loads(data)
+
+    async def set(self, session_id: str, session: dict, ttl: int):
+        self.entries[session_id] = (time.monotonic() + ttl, json.dumps(session))
+        self.entries.move_to_end(session_id)
+        while len(self.entries) > self.max_entries:
+            self.entries.popitem(last=False)
+
+class SQLiteSessionBackend:
+    """Sessions in a local SQLite file: they survive restarts and are shared by workers on one host.
+    Queries run in a worker thread so the event loop never waits on disk."""
+    SWEEP_EVERY = 100  # writes between deletes of expired rows
+
+    def __init__(self, path: str):
+        self.conn = sqlite3.connect(path, timeout=10, check_same_thread=False)
+        self.lock = threading.Lock()
+        self.writes = 0
+        with self.lock, self.conn:
+            self.conn.execute("PRAGMA journal_mode=WAL")
+            self.conn.execute("CREATE TABLE IF NOT EXISTS chat_sessions (session_id TEXT PRIMARY KEY, data TEXT NOT NULL, expires_at REAL NOT NULL)")
+            self.conn.execute("CREATE INDEX IF NOT EXISTS ix_chat_sessions_expires_at ON chat_sessions (expires_at)")
+
+    def _get(self, session_id: str) -> dict | None:
+        with self.lock:
+            row = self.conn.execute(
+                "SELECT data FROM chat_sessions WHERE session_id = ? AND expires_at > ?", (session_id, time.time())
+            ).fetchone()
+        return json.loads(row[0]) if row else None
+
+    def _set(self, session_id: str, session: dict, ttl: int):
+        now = time.time()
+        with self.lock, self.conn:
+            self.conn.execute(
+                "INSERT INTO chat_sessions (session_id, data, expires_at) VALUES (?, ?, ?) "
+                "ON CONFLICT (session_id) DO UPDATE SET data = excluded.data, expires_at = excluded.expires_at",
+                (session_id, json.dumps(session), now + ttl)
+            )
+            self.writes += 1
+            if self.writes % self.SWEEP_EVERY == 0:
+                self.conn.execute("DELETE FROM chat_sessions WHERE expires_at <= ?", (now,))
+
+    async def get(self, session_id: str) -> dict | None:
+        return await asyncio.to_thread(self._get, session_id)
+
+    async def set(self, session_id: str, session: dict, ttl: int):
+        await asyncio.to_thread(self._set, session_id, session, ttl)
+
+session_store = SQLiteSessionBackend(SESSION_SQLITE_PATH) if SESSION_BACKEND == "sqlite" else InMemorySessionBackend(SESSION_MAX_ENTRIES)
+
+def estimate_tokens(text: str) -> int:
+    return len(text) // 4 + 4  # ~4 characters per token, plus per-message overhead
+
+async def load_session(chat_message: ChatMessage) -> tuple[str, dict]:
+    """The caller's session, or a new one if it is unknown, expired or belongs to another user type."""
+    if chat_message.session_id:
+        session = await session_store.get(chat_message.session_id)
+        if session is not None and session["context"]["user_type"] == chat_message.user_type:
+            return chat_message.session_id, session
+    context = AirlineAgentContext(user_type=chat_message.user_type)
+    return str(uuid.uuid4()), {"context": context.model_dump(), "summary": "", "turns": []}
+
+def session_agent_input(session: dict, message: str) -> str | list[dict]:
+    """The new message preceded by the remembered conversation: a summary of older turns and
+    known booking details, then the recent turns that fit in SESSION_HISTORY_TOKENS."""
+    if not session["turns"] and not session["summary"]:
+        return message
+    context = session["context"]
+    details = ", ".join(f"{field.replace('_', ' ')} {context[field]}" for field in
+                        ("passenger_name", "confirmation_number", "flight_number", "seat_number") if context.get(field))
+    notes = [note for note in (
+        f"Earlier in this conversation:\n{session['summary']}" if session["summary"] else "",
+        f"Known details: {details}." if details else "",
+    ) if note]
+    items = [{"role": "system", "content": "\n".join(notes)}] if notes else []
+    return items + session["turns"] + [{"role": "user", "content": message}]
+
+async def save_turn(session_id: str, session: dict, message: str, reply: str, context: AirlineAgentContext):
+    """Append the exchange, fold turns that no longer fit the token budget into the summary, and store."""
+    session["context"] = context.model_dump()
+    session["turns"] += [
+        {"role": "user", "content": message},
+        {"role": "assistant", "content": reply[:SESSION_HISTORY_TOKENS * 4]},
+    ]
+    while len(session["turns"]) > 2 and sum(estimate_tokens(turn["content"]) for turn in session["turns"]) > SESSION_HISTORY_TOKENS:
+        asked, answered = session["turns"][:2]
+        del session["turns"][:2]
+        line = f"- User: {textwrap.shorten(asked['content'], 120)} | Assistant: {textwrap.shorten(answered['content'], 160)}"
+        lines = (session["summary"].splitlines() if session["summary"] else []) + [line]
+        while len(lines) > 1 and sum(len(item) + 1 for item in lines) > SESSION_SUMMARY_MAX_CHARS:
+            lines.pop(0)
+        session["summary"] = "\n".join(lines)
+    await session_store.set(session_id, session, SESSION_TTL_SECONDS)
+
+# ================================================================== Bulk Import
+
+IMPORT_BATCH_SIZE = int(os.getenv("IMPORT_BATCH_SIZE", "2000"))
+MAX_REPORTED_IMPORT_ERRORS = 1000
+FLIGHT_TEXT_FIELDS = {"flight_number": 10, "departure": 50, "arrival": 50, "departure_time": 50, "arrival_time": 50}
+
+def upsert(table):
+    """INSERT that supports ON CONFLICT clauses on the configured database."""
+    insert = postgresql.insert if async_engine.dialect.name == "postgresql" else sqlite.insert
+    return insert(table)
+
+def parse_schedule(content: str, fmt: str) -> list[dict]:
+    """Rows from a CSV (header row required) or JSON (a list, or {"flights": [...]}) schedule."""
+    if fmt == "csv":
+        return list(csv.DictReader(io.StringIO(content)))
+    if fmt == "json":
+        try:
+            data = json.loads(content)
+        except json.JSONDecodeError as e:
+            raise ValueError(f"Invalid JSON: {str(e)}")
+        rows = data.get("flights") if isinstance(data, dict) else data
+        if not isinstance(rows, list):
+            raise ValueError("JSON schedule must be a list of flights or an object with a 'flights' list")
+        return rows
+    raise ValueError(f"Unsupported format '{fmt}', use csv or json")
+
+def validate_flight_row(row) -> dict:
+    """Cleaned flight values from one schedule row. Raises ValueError describing the first problem."""
+    if not isinstance(row, dict):
+        raise ValueError("row must be an object")
+    flight = {}
+    for field, max_length in FLIGHT_TEXT_FIELDS.items():
+        value = str(row.get(field) or "").strip()
+        if not value:
+            raise ValueError(f"missing {field}")
+        if len(value) > max_length:
+            raise ValueError(f"{field} longer than {max_length} characters")
+        flight[field] = value
+    try:
+        flight["price"] = float(row.get("price"))
+    except (TypeError, ValueError):
+        raise ValueError("price must be a number")
+    seats = row.get("available_seats") or ""
+    seats = parse_seats(seats) if isinstance(seats, str) else [str(seat).strip() for seat in seats]
+    if any(len(seat) > 10 for seat in seats):
+        raise ValueError("seat numbers must be at most 10 characters")
+    flight["seats"] = list(dict.fromkeys(seats))
+    flight["status"] = str(row.get("status") or "scheduled").strip()
+    return flight
+
+async def import_flight_batch(db: AsyncSession, batch: list[dict]) -> int:
+    """Upsert one batch of flights with their seats, routes and aliases in multi-row statements.
+    Returns how many of the flights already existed."""
+    numbers = [flight["flight_number"] for flight in batch]
+    existing = set((await db.execute(select(Flight.flight_number).where(Flight.flight_number.in_(numbers)))).scalars())
+
+    stmt = upsert(Flight.__table__)
+    stmt = stmt.on_conflict_do_update(
+        index_elements=["flight_number"],
+        set_={field: stmt.excluded[field] for field in ("departure", "arrival", "departure_time", "arrival_time", "price", "status")},
+    ).returning(Flight.id, Flight.flight_number)
+    flight_ids = dict((number, flight_id) for flight_id, number in (await db.execute(stmt, [
+        {**{field: flight[field] for field in FLIGHT_TEXT_FIELDS}, "price": flight["price"],
+         "status": flight["status"], "available_seats": ""}
+        for flight in batch
+    ])).all())
+
+    # New seats are added; seats that already exist (and may be booked) are left alone
+    seats = [{"flight_number": flight["flight_number"], "seat_number": seat, "state": SEAT_AVAILABLE, "booking_id": None}
+             for flight in batch for seat in flight["seats"]]
+    if seats:
+        await db.execute(upsert(FlightSeat.__table__).on_conflict_do_nothing(index_elements=["flight_number", "seat_number"]), seats)
+
+    routes = upsert(FlightRoute.__table__)
+    await db.execute(routes.on_conflict_do_update(
+        index_elements=["flight_id"],
+        set_={"departure_code": routes.excluded.departure_code, "arrival_code": routes.excluded.arrival_code},
+    ), [
+        {"flight_id": flight_ids[flight["flight_number"]], "departure_code": place_code(flight["departure"]),
+         "arrival_code": place_code(flight["arrival"])}
+        for flight in batch
+    ])
+
+    aliases = {(alias, place_code(place)) for flight in batch for place in (flight["departure"], flight["arrival"])
+               for alias in place_aliases(place)}
+    await db.execute(upsert(AirportAlias.__table__).on_conflict_do_nothing(index_elements=["alias", "code"]),
+                     [{"alias": alias, "code": code} for alias, code in aliases])
+    await db.commit()
+    for alias, code in aliases:
+        alias_index.add(alias, code)
+    return len(existing)
+
+async def import_flights(db: AsyncSession, rows: list, batch_size: int = IMPORT_BATCH_SIZE) -> dict:
+    """Validate and upsert a schedule in batches. Invalid rows are reported and skipped; when a
+    flight number appears more than once the last row wins. A failing batch is rolled back alone."""
+    report = {"received": len(rows), "inserted": 0, "updated": 0, "duplicates": 0, "failed": 0, "errors": []}
+
+    def fail(row_number: int, flight_number, error: str):
+        report["failed"] += 1
+        if len(report["errors"]) < MAX_REPORTED_IMPORT_ERRORS:
+            report["errors"].append({"row": row_number, "flight_number": flight_number, "error": error})
+
+    valid: dict[str, tuple[int, dict]] = {}
+    for row_number, row in enumerate(rows, start=1):
+        try:
+            flight = validate_flight_row(row)
+        except ValueError as e:
+            fail(row_number, row.get("flight_number") if isinstance(row, dict) else None, str(e))
+            continue
+        if flight["flight_number"] in valid:
+            report["duplicates"] += 1
+        valid[flight["flight_number"]] = (row_number, flight)
+
+    items = list(valid.values())
+    for start in range(0, len(items), batch_size):
+        batch = items[start:start + batch_size]
+        try:
+            updated = await import_flight_batch(db, [flight for _, flight in batch])
+        except Exception as e:
+            await db.rollback()
+            for row_number, flight in batch:
+                fail(row_number, flight["flight_number"], f"batch failed: {str(e).splitlines()[0]}")
+            continue
+        report["updated"] += updated
+        report["inserted"] += len(batch) - updated
+
+    if report["inserted"] or report["updated"]:
+        # Large imports touch most of the schedule, so every worker reloads all of it instead of flight by flight
+        await record_schedule_change(db, [SCHEDULE_REBUILD_MARKER])
+        await db.commit()
+        await bump_schedule_version()
+        await schedule_store.rebuild()
+    return report
+
 # ================================================================== faq agent tools
 
+# Canned answers for basic_info_tool and the /chat FAQ fast path: topic -> (keywords, answer)
+FAQ_TOPICS = {
+    "baggage": (["bag", "baggage", "luggage"], "📦 Baggage Policy: One free carry-on bag under 22x14x9 inches and 50 lbs. Checked baggage starts at $25 for first bag. No liquids over 3.4oz in carry-on."),
+    "wifi": (["wifi", "internet", "connection"], "📶 Free Wi-Fi available on all ReadyFlight aircraft! Connect to 'ReadyFlight-WiFi' network. Streaming and video calls supported at cruising altitude."),
+    "meals": (["meal", "food", "drink", "beverage"], "🍽️ Complimentary snacks and beverages on all flights. Premium meal service available for purchase on flights over 3 hours. Vegetarian, vegan, and special dietary options available with advance notice."),
+    "airport": (["airport", "terminal", "location"], "🏢 ReadyFlight Hub: Skyport International Airport, Terminal 4. We also operate from major airports nationwide. Check-in counters open 3 hours before departure."),
+    "check_in": (["check", "checkin", "boarding"], "✅ Online check-in opens 24 hours before departure. Mobile boarding passes available. Arrive 2 hours early for domestic, 3 hours for international flights."),
+    "cancellation": (["cancel", "refund", "change"], "🔄 Free cancellation up to 24 hours before departure. Flight changes allowed with fare difference. Refunds processed within 5-7 business days."),
+}
+FAQ_FALLBACK = "I don't have specific information about that topic. For more detailed assistance, I can connect you with our customer service team or you can visit our website."
+
 @function_tool()
 async def basic_info_tool(question: str) -> str:
     """Provides airport & airline info, baggage policies, WiFi, and general information.
@@ -119,25 +1783,26 @@ async def basic_info_tool(question: str) -> str:
     
     q = question.lower()
     
-    if any(word in q for word in ["bag", "baggage", "luggage"]):
-        return "📦 Baggage Policy: One free carry-on bag under 22x14x9 inches and 50 lbs. Checked baggage starts at $25 for first bag. No liquids over 3.4oz in carry-on."
-    
-    if any(word in q for word in ["wifi", "internet", "connection"]):
-        return "📶 Free Wi-Fi available on all ReadyFlight aircraft! Connect to 'ReadyFlight-WiFi' network. Streaming and video calls supported at cruising altitude."
-    
-    if any(word in q for word in ["meal", "food", "drink", "beverage"]):
-        return "🍽️ Complimentary snacks and beverages on all flights. Premium meal service available for purchase on flights over 3 hours. Vegetarian, vegan, and special dietary options available with advance notice."
-    
-    if any(word in q for word in ["airport", "terminal", "location"]):
-        return "🏢 ReadyFlight Hub: Skyport International Airport, Terminal 4. We also operate from major airports nationwide. Check-in counters open 3 hours before departure."
-    
-    if any(word in q for word in ["check", "checkin", "boarding"]):
-        return "✅ Online check-in opens 24 hours before departure. Mobile boarding passes available. Arrive 2 hours early for domestic, 3 hours for international flights." 
+    for keywords, answer in FAQ_TOPICS.values():
+        if any(word in q for word in keywords):
+            return answer
     
-    if any(word in q for word in ["cancel", "refund", "change"]):
-        return "🔄 Free cancellation up to 24 hours before departure. Flight changes allowed with fare difference. Refunds processed within 5-7 business days."
-    
-    return "I don't have specific information about that topic. For more detailed assistance, I can connect you with our customer service team or you can visit our website."
+    return FAQ_FALLBACK
+
+def format_schedule(results: list, seat_counts: dict[str, int]) -> str:
+    """Schedule reply for up to SCHEDULE_RESULT_LIMIT flights; one more result means the list was cut."""
+    response = "✈️ **Available Flights:**\n\n"
+    for flight in results[:SCHEDULE_RESULT_LIMIT]:
+        response += f"**Flight {flight.flight_number}**\n"
+        response += f"🛫 {flight.departure} → 🛬 {flight.arrival}\n"
+        response += f"⏰ Departure: {flight.departure_time}\n"
+        response += f"⏰ Arrival: {flight.arrival_time}\n"
+        response += f"💰 Price: ${flight.price}\n"
+        response += f"💺 Available seats: {seat_counts.get(flight.flight_number, 0)}\n\n"
+
+    if len(results) > SCHEDULE_RESULT_LIMIT:
+        response += f"Showing the first {SCHEDULE_RESULT_LIMIT} flights. Ask for a specific route to narrow the list."
+    return response
 
 @function_tool()
 async def flight_schedule_tool(departure: str = None, arrival: str = None) -> str:
@@ -148,29 +1813,39 @@ async def flight_schedule_tool(departure: str = None, arrival: str = None) -> st
     Returns:
         str: Flight schedule information
     """
-    with SessionLocal() as db:
-        query = db.query(Flight)
+    no_results = "No flights found matching your criteria. Please check our website for the most up-to-date schedule."
+    snapshot = schedule_store.current()
+    if snapshot:
+        # Served from memory: the database only sees writes and booking transactions
+        departure_codes = snapshot.resolve_place(departure) if departure else None
+        arrival_codes = snapshot.resolve_place(arrival) if arrival else None
+        if departure_codes == set() or arrival_codes == set():
+            return no_results
+        results = snapshot.search(departure_codes, arrival_codes, SCHEDULE_RESULT_LIMIT + 1)
+        seat_counts = {flight.flight_number: len(flight.available_seats) for flight in results}
+        return format_schedule(results, seat_counts) if results else no_results
+
+    async with AsyncSessionLocal() as db:
+        query = select(Flight).join(FlightRoute, FlightRoute.flight_id == Flight.id)
         
         if departure:
-            query = query.filter(Flight.departure.ilike(f"%{departure}%"))
+            departure_codes = await resolve_place(db, departure)
+            if not departure_codes:
+                return no_results
+            query = query.where(FlightRoute.departure_code.in_(departure_codes))
         if arrival:
-            query = query.filter(Flight.arrival.ilike(f"%{arrival}%"))
+            arrival_codes = await resolve_place(db, arrival)
+            if not arrival_codes:
+                return no_results
+            query = query.where(FlightRoute.arrival_code.in_(arrival_codes))
         
-        results = query.all()
+        results = (await db.execute(query.order_by(Flight.id).limit(SCHEDULE_RESULT_LIMIT + 1))).scalars().all()
         
         if not results:
-            return "No flights found matching your criteria. Please check our website for the most up-to-date schedule."
-        
-        response = "✈️ **Available Flights:**\n\n"
-        for flight in results:
-            response += f"**Flight {flight.flight_number}**\n"
-            response += f"🛫 {flight.departure} → 🛬 {flight.arrival}\n"
-            response += f"⏰ Departure: {flight.departure_time}\n"
-            response += f"⏰ Arrival: {flight.arrival_time}\n"
-            response += f"💰 Price: ${flight.price}\n"
-            response += f"💺 Available seats: {len(flight.available_seats.split(','))}\n\n"
+            return no_results
         
-        return response
+        seat_counts = await available_seat_counts(db, [flight.flight_number for flight in results[:SCHEDULE_RESULT_LIMIT]])
+        return format_schedule(results, seat_counts)
 
 # ================================================================== FAQ Agent
 faq_agent = Agent(
@@ -209,23 +1884,18 @@ async def book_flight_tool(context: RunContextWrapper[AirlineAgentContext], flig
         str: Booking confirmation or error message
     """
     
-    with SessionLocal() as db:
-        flight = db.query(Flight).filter(Flight.flight_number == flight_number).first()
+    async with AsyncSessionLocal() as db:
+        flight = (await db.execute(select(Flight).where(Flight.flight_number == flight_number))).scalars().first()
         if not flight:
             return f"❌ Sorry, flight {flight_number} was not found. Please check the flight number and try again."
 
-        available_seats = flight.available_seats.split(",")
-        if not available_seats or available_seats == ['']:
+        # Generate booking and claim a seat in the same transaction
+        booking_id = booking_ids.next_id()
+        selected_seat = await claim_seat(db, flight_number, booking_id, preferred_seat)
+        if not selected_seat:
+            await db.rollback()
             return f"😔 Sorry, flight {flight_number} is fully booked. Would you like me to check other flights?"
 
-        # Select seat
-        if preferred_seat and preferred_seat in available_seats:
-            selected_seat = preferred_seat
-        else:
-            selected_seat = available_seats[0]  # Assign first available seat
-
-        # Generate booking
-        booking_id = f"RF{random.randint(10000, 99999)}"
         booking = Booking(
             booking_id=booking_id,
             flight_number=flight_number,
@@ -239,13 +1909,12 @@ async def book_flight_tool(context: RunContextWrapper[AirlineAgentContext], flig
             booked=True
         )
 
-        # Update flight's available seats
-        available_seats.remove(selected_seat)
-        flight.available_seats = ",".join(available_seats)
-
         # Save to database
         db.add(booking)
-        db.commit()
+        await record_schedule_change(db, [flight_number])
+        await db.commit()
+        schedule_store.seats_changed(flight_number, taken=[selected_seat])
+        await bump_schedule_version()
 
         context.context.passenger_name = passenger_name
         context.context.confirmation_number = booking_id
@@ -262,15 +1931,48 @@ async def book_flight_tool(context: RunContextWrapper[AirlineAgentContext], flig
         💰 **Price:** ${flight.price}
         Your booking is confirmed! Please arrive at the airport 2 hours before departure. Have a great flight! 🛫"""
 
+@function_tool
+async def book_group_tool(context: RunContextWrapper[AirlineAgentContext], flight_number: str, passenger_names: list[str]) -> str:
+    """Book one flight for a group of passengers at once, seated together where possible.
+    Either every passenger is booked or nobody is.
+    Args:
+        context: The conversation context
+        flight_number (str): Flight number to book
+        passenger_names (list[str]): Names of all passengers in the group
+    Returns:
+        str: All booking confirmations or an error message
+    """
+    
+    async with AsyncSessionLocal() as db:
+        try:
+            flight, bookings = await book_group(db, flight_number, passenger_names)
+        except GroupBookingError as e:
+            return f"❌ {str(e)}"
+
+    context.context.passenger_name = bookings[0].passenger_name
+    context.context.confirmation_number = bookings[0].booking_id
+    context.context.seat_number = bookings[0].available_seat
+    context.context.flight_number = flight_number
+
+    response = f"""🎉 **Group Booked Successfully!**
+        ✈️ **Flight:** {flight_number}
+        🛫 **Route:** {flight.departure} → {flight.arrival}
+        ⏰ **Departure:** {flight.departure_time}
+        💰 **Price:** ${flight.price} per passenger\n"""
+    for booking in bookings:
+        response += f"        ✅ {booking.passenger_name}: seat {booking.available_seat}, confirmation {booking.booking_id}\n"
+    response += "        Your group is confirmed! Please arrive at the airport 2 hours before departure. Have a great flight! 🛫"
+    return response
+
 @function_tool
 async def check_booking_tool(context: RunContextWrapper[AirlineAgentContext], booking_id: str) -> str:
     """Check booking status and details."""
-    with SessionLocal() as db:
-        booking = db.query(Booking).filter(Booking.booking_id == booking_id).first()
+    async with AsyncSessionLocal() as db:
+        booking = (await db.execute(select(Booking).where(Booking.booking_id == booking_id))).scalars().first()
         if not booking:
             return f"❌ Booking {booking_id} not found. Please check your confirmation number and try again."
 
-        flight = db.query(Flight).filter(Flight.flight_number == booking.flight_number).first()
+        flight = (await db.execute(select(Flight).where(Flight.flight_number == booking.flight_number))).scalars().first()
 
         context.context.confirmation_number = booking_id
         context.context.passenger_name = booking.passenger_name
@@ -291,26 +1993,21 @@ async def check_booking_tool(context: RunContextWrapper[AirlineAgentContext], bo
 @function_tool
 async def cancel_booking_tool(context: RunContextWrapper[AirlineAgentContext], booking_id: str) -> str:
     """Cancel a flight booking."""
-    with SessionLocal() as db:
-        booking = db.query(Booking).filter(Booking.booking_id == booking_id).first()
-        if not booking:
-            return f"❌ Booking {booking_id} not found. Please check your confirmation number."
-
-        flight = db.query(Flight).filter(Flight.flight_number == booking.flight_number).first()
-
-        # Return seat to available pool
-        if flight:
-            available_seats = flight.available_seats.split(",")
-            available_seats.append(booking.available_seat)
-            flight.available_seats = ",".join(available_seats)
+    async with AsyncSessionLocal() as db:
+        outcome, booking = await cancel_booking(db, booking_id)
 
-        # Update booking status
-        booking.booked = False
-        db.commit()
+    if outcome == "not_found":
+        return f"❌ Booking {booking_id} not found. Please check your confirmation number."
+    flight_number, seat = booking
+    if outcome == "already_cancelled":
+        return f"""ℹ️ **Booking Already Cancelled**
+        ❌ Booking {booking_id} on flight {flight_number} was cancelled earlier
+        💰 Any refund is already on its way (5-7 business days)
+        Is there anything else I can help you with? 😊"""
 
-        return f"""✅ **Booking Cancelled Successfully**
+    return f"""✅ **Booking Cancelled Successfully**
         ❌ Booking {booking_id} has been cancelled
-        💺 Seat {booking.available_seat} on flight {booking.flight_number} is now available
+        💺 Seat {seat} on flight {flight_number} is now available
         💰 Refund will be processed within 5-7 business days
         Sorry to see you cancel your trip! We hope to serve you again soon. 😊"""
 
@@ -330,14 +2027,14 @@ customer_agent = Agent[AirlineAgentContext](
     - Always ask for necessary information politely
     Guidelines:
     1. For flight searches, ask for departure and arrival cities
-    2. For bookings, you need flight number and passenger name
+    2. For bookings, you need flight number and passenger name; for several passengers on the same flight use book_group_tool once with all their names
     3. For booking checks/cancellations, ask for confirmation number
     4. Always be encouraging and positive
     5. Use the tools provided for all operations
     If you can't help with something, offer to transfer to staff or FAQ agent.
     """,
     model=OpenAIChatCompletionsModel(model="gemini-2.0-flash", openai_client=openai_client),
-    tools=[flight_schedule_tool, book_flight_tool, check_booking_tool, cancel_booking_tool],
+    tools=[flight_schedule_tool, book_flight_tool, book_group_tool, check_booking_tool, cancel_booking_tool],
 )
 
 # ================================================================== Staff Agent Tools
@@ -358,13 +2055,13 @@ async def add_flight_tool(context: RunContextWrapper[AirlineAgentContext], fligh
         str: Success or error message
     """
     
-    with SessionLocal() as db:
-        existing_flight = db.query(Flight).filter(Flight.flight_number == flight_number).first()
+    async with AsyncSessionLocal() as db:
+        existing_flight = (await db.execute(select(Flight).where(Flight.flight_number == flight_number))).scalars().first()
         if existing_flight:
             return f"❌ Flight {flight_number} already exists in the system."
 
         # Parse seats
-        seats_list = [seat.strip() for seat in available_seats.split(',')]
+        seats_list = list(dict.fromkeys(parse_seats(available_seats)))
 
         flight_data = Flight(
             flight_number=flight_number,
@@ -372,13 +2069,27 @@ async def add_flight_tool(context: RunContextWrapper[AirlineAgentContext], fligh
             arrival=arrival,
             departure_time=departure_time,
             arrival_time=arrival_time,
-            available_seats=",".join(seats_list),
+            available_seats="",
             price=price,
             status="scheduled"
         )
 
         db.add(flight_data)
-        db.commit()
+        try:
+            # The SELECT above is only a fast path: the unique index settles two concurrent adds
+            await db.flush()
+        except sa_exc.IntegrityError:
+            await db.rollback()
+            return f"❌ Flight {flight_number} already exists in the system."
+        await seed_seats(db, flight_number, seats_list)
+        await db.flush()
+        aliases = await register_route(db, flight_data)
+        await record_schedule_change(db, [flight_number])
+        await db.commit()
+        for alias, code in aliases:
+            alias_index.add(alias, code)
+        await bump_schedule_version()
+        await schedule_store.reload_flights(db, [flight_number])
 
         return f"""✅ **Flight Added Successfully!**
         ✈️ **Flight {flight_number}**
@@ -390,23 +2101,29 @@ async def add_flight_tool(context: RunContextWrapper[AirlineAgentContext], fligh
         📊 Status: Scheduled
         Flight is now live in the system! 🎉"""
 
+EDITABLE_FLIGHT_FIELDS = ("departure", "arrival", "departure_time", "arrival_time", "price", "status", "available_seats")
+
 @function_tool  
 async def update_flight_tool(context: RunContextWrapper[AirlineAgentContext], flight_number: str, field: str, new_value: str) -> str:
     """Update flight information (Staff only).
     Args:
         context: The conversation context
         flight_number (str): Flight number to update
-        field (str): Field to update (departure_time, arrival_time, price, status, etc.)
-        new_value (str): New value for the field
+        field (str): Field to update (departure, arrival, departure_time, arrival_time, price, status, available_seats)
+        new_value (str): New value for the field (comma-separated seat numbers for available_seats)
     Returns:
         str: Update confirmation
     """
     
-    with SessionLocal() as db:
-        flight = db.query(Flight).filter(Flight.flight_number == flight_number).first()
+    async with AsyncSessionLocal() as db:
+        flight = (await db.execute(select(Flight).where(Flight.flight_number == flight_number))).scalars().first()
         if not flight:
             return f"❌ Flight {flight_number} not found in system."
         
+        # Flight numbers key the seat and booking rows, so they cannot be renamed here
+        if field not in EDITABLE_FLIGHT_FIELDS:
+            return f"❌ Field '{field}' cannot be updated. Available fields: {', '.join(EDITABLE_FLIGHT_FIELDS)}"
+        
         # Handle different field types
         if field == "price":
             try:
@@ -414,14 +2131,30 @@ async def update_flight_tool(context: RunContextWrapper[AirlineAgentContext], fl
             except:
                 return "❌ Price must be a valid number."
         
-        # Store old value for response
-        old_value = getattr(flight, field, None)
-        if old_value is None:
-            return f"❌ Field '{field}' not found. Available fields: departure, arrival, departure_time, arrival_time, price, status"
-        
-        # Update the field
-        setattr(flight, field, new_value)
-        db.commit()
+        aliases = set()
+        if field == "available_seats":
+            # Seats live in flight_seats: replace the free ones, booked seats stay with their bookings
+            seat_rows = (await db.execute(
+                select(FlightSeat.seat_number, FlightSeat.state).where(FlightSeat.flight_number == flight_number).order_by(FlightSeat.id)
+            )).all()
+            booked = {seat for seat, state in seat_rows if state == SEAT_BOOKED}
+            old_value = ",".join(seat for seat, state in seat_rows if state == SEAT_AVAILABLE)
+            new_seats = [seat for seat in dict.fromkeys(parse_seats(new_value)) if seat not in booked]
+            await db.execute(delete(FlightSeat).where(FlightSeat.flight_number == flight_number, FlightSeat.state == SEAT_AVAILABLE))
+            await seed_seats(db, flight_number, new_seats)
+            new_value = ",".join(new_seats)
+        else:
+            # Store old value for response, then update the field
+            old_value = getattr(flight, field)
+            setattr(flight, field, new_value)
+            if field in ("departure", "arrival"):
+                aliases = await register_route(db, flight)
+        await record_schedule_change(db, [flight_number])
+        await db.commit()
+        for alias, code in aliases:
+            alias_index.add(alias, code)
+        await bump_schedule_version()
+        await schedule_store.reload_flights(db, [flight_number])
         
         return f"""✅ **Flight Updated Successfully!**
         ✈️ **Flight {flight_number}**
@@ -431,35 +2164,55 @@ async def update_flight_tool(context: RunContextWrapper[AirlineAgentContext], fl
         Update is now live in the system! 🎉"""
 
 @function_tool
-async def view_all_bookings_tool(context: RunContextWrapper[AirlineAgentContext]) -> str:
-    """View all current bookings in the system (Staff only).
+async def view_all_bookings_tool(context: RunContextWrapper[AirlineAgentContext], flight_number: str = None, status: str = None, date_from: str = None, date_to: str = None, page_token: str = None, page_size: int = BOOKING_PAGE_SIZE) -> str:
+    """View bookings in the system one page at a time (Staff only).
     Args:
         context: The conversation context
+        flight_number (str, optional): Only show bookings on this flight
+        status (str, optional): "confirmed" or "cancelled"
+        date_from (str, optional): Only bookings created on/after this ISO date (YYYY-MM-DD)
+        date_to (str, optional): Only bookings created before this ISO date (YYYY-MM-DD)
+        page_token (str, optional): Continuation token from the previous page
+        page_size (int, optional): Bookings per page (max 50)
     Returns:
-        str: List of all bookings
+        str: One page of bookings and a continuation token if more exist
     """
     
-    with SessionLocal() as db:
-        bookings = db.query(Booking).all()
-        if not bookings:
-            return "📋 No bookings found in the system."
+    try:
+        after_id = decode_cursor(page_token) if page_token else None
+        created_from, created_to = parse_date(date_from), parse_date(date_to)
+    except ValueError as e:
+        return f"❌ {str(e)}"
+    if status and status.lower() not in ("confirmed", "cancelled"):
+        return "❌ Status must be 'confirmed' or 'cancelled'."
+    page_size = max(1, min(page_size, MAX_BOOKING_PAGE_SIZE))
+
+    async with AsyncSessionLocal() as db:
+        rows = (await db.execute(booking_page_query(
+            page_size, after_id, flight_number, status, created_from, created_to
+        ))).all()
+        if not rows:
+            return "📋 No bookings found in the system." if not page_token else "📋 No more bookings."
         
-        response = "📊 **All Current Bookings:**\n\n"
+        has_more = len(rows) > page_size
+        rows = rows[:page_size]
+        response = "📊 **Current Bookings:**\n\n"
         
-        for booking in bookings:
-            flight = db.query(Flight).filter(Flight.flight_number == booking.flight_number).first()
+        for booking, departure, arrival in rows:
             response += f"🎫 **{booking.booking_id}**\n"
             response += f"   👤 Passenger: {booking.passenger_name}\n"
             response += f"   ✈️ Flight: {booking.flight_number}\n"
-            if flight:
-                response += f"   🛫 Route: {flight.departure} → {flight.arrival}\n"
+            if departure:
+                response += f"   🛫 Route: {departure} → {arrival}\n"
             else:
                 response += f"   🛫 Route: N/A\n"
             response += f"   💺 Seat: {booking.available_seat}\n"
             response += f"   📊 Status: {'Confirmed' if booking.booked else 'Cancelled'}\n"
             response += f"   💰 Price: ${booking.price}\n\n"
         
-        response += f"**Total Bookings:** {len(bookings)}"
+        response += f"**Bookings on this page:** {len(rows)}"
+        if has_more:
+            response += f"\n**More bookings available.** Next page token: `{encode_cursor(rows[-1][0].id)}`"
         return response
 
 @function_tool
@@ -471,21 +2224,19 @@ async def flight_status_overview_tool(context: RunContextWrapper[AirlineAgentCon
         str: Flight status overview
     """
     
-    with SessionLocal() as db:
-        flights = db.query(Flight).all()
-        if not flights:
+    async with AsyncSessionLocal() as db:
+        # One round-trip for every flight's counts instead of a count query per flight
+        rows = (await db.execute(flight_occupancy_query())).all()
+        if not rows:
             return "✈️ No flights in the system."
         
         response = "✈️ **Flight Status Overview:**\n\n"
         
-        total_flights = len(flights)
+        total_flights = len(rows)
         total_seats = 0
         booked_seats = 0
         
-        for flight in flights:
-            available_count = len(flight.available_seats.split(",")) if flight.available_seats else 0
-            flight_bookings = db.query(Booking).filter(Booking.flight_number == flight.flight_number, Booking.booked == True).count()
-
+        for flight, available_count, flight_bookings in rows:
             total_seats += available_count + flight_bookings
             booked_seats += flight_bookings
             
@@ -519,7 +2270,8 @@ staff_agent = Agent[AirlineAgentContext](
     Capabilities:
     1. Add new flights to the system
     2. Update existing flight information
-    3. View all bookings across the system
+    3. View bookings across the system, filtered by flight, status or date and one page at a time
+       (pass the returned page token to view_all_bookings_tool to fetch the next page)
     4. Monitor flight status and capacity
     Guidelines:
     - Always verify flight numbers and data accuracy
@@ -565,38 +2317,126 @@ frontline_agent = Agent[AirlineAgentContext](
     ]
 )
 
+for agent, agent_name in ((faq_agent, "faq_agent"), (customer_agent, "customer_agent"),
+                          (staff_agent, "staff_agent"), (frontline_agent, "frontline_agent")):
+    instrument_agent(agent, agent_name)
+
+# ================================================================== FAQ Fast Path
+
+FAQ_FAST_PATH_ENABLED = os.getenv("FAQ_FAST_PATH_ENABLED", "true").lower() == "true"
+FAQ_FAST_PATH_THRESHOLD = float(os.getenv("FAQ_FAST_PATH_THRESHOLD", "0.75"))
+# Words that mean the user wants something looked up or done, which only the agents can do
+FAQ_ACTION_WORDS = {"book", "booking", "reserve", "reservation", "my", "seat", "ticket", "flights", "schedule", "timing"}
+# Verbs that ask for something to be done to a booking; they only count as FAQ questions next to a policy cue
+FAQ_ACTION_VERBS = re.compile(r"\b(?:cancel|refund|change|upgrade)\w*\b|\bcheck[\s-]?in\b")
+FAQ_POLICY_CUES = {"policy", "policies", "rule", "rules", "fee", "fees", "allowed", "allow", "how", "when"}
+# Flight numbers (rf001) and confirmation codes in BookingIdGenerator's format (rf0e4t1m7q2k0g5), lowercased
+FAQ_IDENTIFIER = re.compile(rf"\b(?:[a-z]{{2}}\d{{3,}}|{booking_ids.prefix.lower()}[{BookingIdGenerator.ALPHABET.lower()}]{{13}})\b")
+
+faq_fast_path_stats = {"checked": 0, "hits": 0, "misses": 0, "skipped": 0}
+
+def match_faq(message: str) -> tuple[str, float] | None:
+    """Best canned FAQ answer for a message and the confidence of the match (0-1), or None.
+    Confidence drops when other topics or action words appear in the message. Messages naming
+    a flight or booking, or asking for a cancellation, refund, change, upgrade or check-in
+    rather than about its policy, get no match: only the agents can act on them."""
+    text = (message or "").lower()
+    words = re.findall(r"[a-z0-9]+", text)
+    if FAQ_IDENTIFIER.search(text) or (FAQ_ACTION_VERBS.search(text) and not FAQ_POLICY_CUES.intersection(words)):
+        return None
+    hits = {
+        topic: sum(1 for word in words if any(word in (keyword, keyword + "s", keyword + "es") for keyword in keywords))
+        for topic, (keywords, _) in FAQ_TOPICS.items()
+    }
+    topic = max(hits, key=hits.get)
+    if not hits[topic]:
+        return None
+    noise = (sum(hits.values()) - hits[topic]
+             + sum(1 for word in words if word in FAQ_ACTION_WORDS))
+    return FAQ_TOPICS[topic][1], hits[topic] / (hits[topic] + noise)
+
+def faq_fast_path(chat_message: ChatMessage) -> str | None:
+    """Canned answer when the message confidently matches a basic_info_tool topic, so /chat can skip the LLM."""
+    if not FAQ_FAST_PATH_ENABLED or not chat_message.fast_path or chat_message.user_type == "staff":
+        faq_fast_path_stats["skipped"] += 1
+        return None
+    faq_fast_path_stats["checked"] += 1
+    match = match_faq(chat_message.message)
+    if match and match[1] >= FAQ_FAST_PATH_THRESHOLD:
+        faq_fast_path_stats["hits"] += 1
+        return match[0]
+    faq_fast_path_stats["misses"] += 1
+    return None
+
 # ================================================================== API Endpoints
 
+def pick_initial_agent(chat_message: ChatMessage):
+    """Determine initial agent based on user type and message content"""
+    message_lower = chat_message.message.lower()
+    if chat_message.user_type == "staff":
+        return staff_agent, "Staff Control"
+    if any(word in message_lower for word in ["policy", "baggage", "wifi", "meal", "airport", "schedule", "timing"]):
+        return faq_agent, "FAQ Agent"
+    return customer_agent, "Sky Assistant"
+
 @app.post("/chat", response_model=ChatResponse)
 async def chat_endpoint(chat_message: ChatMessage):
+    # One trace per request; the SDK nests agent, model, handoff and tool spans under it, SQL spans under tools
+    with trace("ReadyFlight chat", metadata={"user_type": chat_message.user_type}):
+        with custom_span("chat", {"user_type": chat_message.user_type, "message_chars": len(chat_message.message)}) as span:
+            response = await answer_chat(chat_message)
+            span.span_data.data["agent_type"] = response.agent_type
+            return response
+
+async def answer_chat(chat_message: ChatMessage) -> ChatResponse:
     try:
-        # Create context based on user type
-        context = AirlineAgentContext(user_type=chat_message.user_type)
+        # Continue the caller's conversation (context and recent turns), or start a new one
+        session_id, session = await load_session(chat_message)
+        context = AirlineAgentContext(**session["context"])
+
+        # Answer common FAQ questions directly, without an LLM round-trip
+        faq_answer = faq_fast_path(chat_message)
+        if faq_answer:
+            await save_turn(session_id, session, chat_message.message, faq_answer, context)
+            return ChatResponse(
+                response=faq_answer,
+                agent_type="FAQ Agent",
+                session_id=session_id
+            )
+
+        initial_agent, agent_name = pick_initial_agent(chat_message)
         
-        # Determine initial agent based on user type and message content
-        message_lower = chat_message.message.lower()
+        # FAQ answers depend only on the question and the schedule, so identical questions can share one run.
+        # Follow-ups are left out: their meaning depends on the earlier turns.
+        cache_key = None
+        if initial_agent is faq_agent and RESPONSE_CACHE_ENABLED and not session["turns"]:
+            cache_key = await response_cache_key(agent_name, chat_message.message)
+            cached = await response_cache.get(cache_key)
+            if cached is not None:
+                response_cache_stats["hits"] += 1
+                await save_turn(session_id, session, chat_message.message, cached, context)
+                return ChatResponse(
+                    response=cached,
+                    agent_type=agent_name,
+                    session_id=session_id
+                )
+            response_cache_stats["misses"] += 1
         
-        if chat_message.user_type == "staff":
-            initial_agent = staff_agent
-            agent_name = "Staff Control"
-        elif any(word in message_lower for word in ["policy", "baggage", "wifi", "meal", "airport", "schedule", "timing"]):
-            initial_agent = faq_agent  
-            agent_name = "FAQ Agent"
-        else:
-            initial_agent = customer_agent
-            agent_name = "Sky Assistant"
-        
-        # Run the agent with the message
-        result = Runner.run_sync(
-            initial_agent,
-            input=chat_message.message,
-        )
+        # Run the agent with the message and the remembered conversation
+        try:
+            result = await run_agent(initial_agent, session_agent_input(session, chat_message.message), context)
+        except asyncio.TimeoutError:
+            return ChatResponse(
+                response="⏳ Sorry, that took longer than expected. Please try again in a moment.",
+                agent_type="System",
+                session_id=session_id
+            )
         
         # Extract the final response
         response_text = result.final_output or "I'm sorry, I couldn't process your request right now."
-        
-        # Generate session ID
-        session_id = str(uuid.uuid4())
+        if cache_key and result.final_output:
+            await response_cache.set(cache_key, response_text, RESPONSE_CACHE_TTL_SECONDS)
+        await save_turn(session_id, session, chat_message.message, response_text, context)
         
         return ChatResponse(
             response=response_text,
@@ -610,49 +2450,311 @@ async def chat_endpoint(chat_message: ChatMessage):
         return ChatResponse(
             response=error_response,
             agent_type="System",
-            session_id=str(uuid.uuid4())
+            session_id=chat_message.session_id or str(uuid.uuid4())
         )
 
+def sse_event(event: str, data: dict) -> str:
+    return f"event: {event}\ndata: {json.dumps(data, default=str)}\n\n"
+
+def raw_item_field(raw_item, field: str):
+    return raw_item.get(field) if isinstance(raw_item, dict) else getattr(raw_item, field, None)
+
+def instant_reply_events(agent_name: str, response_text: str, session_id: str):
+    """The whole answer as one delta, for replies that need no agent run (fast path, cache)."""
+    yield sse_event("agent", {"agent": agent_name})
+    yield sse_event("delta", {"text": response_text})
+    yield sse_event("done", {"response": response_text, "agent_type": agent_name, "session_id": session_id})
+
+async def chat_stream_events(chat_message: ChatMessage):
+    """Events for /chat/stream: agent, handoff, tool_call, tool_output and delta as the run
+    progresses, then done (or error) with the same fields /chat returns."""
+    session_id = chat_message.session_id or str(uuid.uuid4())
+    with trace("ReadyFlight chat", metadata={"user_type": chat_message.user_type}):
+        with custom_span("chat", {"user_type": chat_message.user_type, "message_chars": len(chat_message.message), "stream": True}) as span:
+            try:
+                session_id, session = await load_session(chat_message)
+                context = AirlineAgentContext(**session["context"])
+
+                faq_answer = faq_fast_path(chat_message)
+                if faq_answer:
+                    await save_turn(session_id, session, chat_message.message, faq_answer, context)
+                    for event in instant_reply_events("FAQ Agent", faq_answer, session_id):
+                        yield event
+                    return
+
+                initial_agent, agent_name = pick_initial_agent(chat_message)
+
+                cache_key = None
+                if initial_agent is faq_agent and RESPONSE_CACHE_ENABLED and not session["turns"]:
+                    cache_key = await response_cache_key(agent_name, chat_message.message)
+                    cached = await response_cache.get(cache_key)
+                    if cached is not None:
+                        response_cache_stats["hits"] += 1
+                        await save_turn(session_id, session, chat_message.message, cached, context)
+                        for event in instant_reply_events(agent_name, cached, session_id):
+                            yield event
+                        return
+                    response_cache_stats["misses"] += 1
+
+                yield sse_event("agent", {"agent": agent_name})
+                tool_names = {}
+                async with stream_agent(initial_agent, session_agent_input(session, chat_message.message), context) as (result, events):
+                    async for event in events:
+                        if event.type == "raw_response_event" and isinstance(event.data, ResponseTextDeltaEvent):
+                            yield sse_event("delta", {"text": event.data.delta})
+                        elif event.type == "agent_updated_stream_event" and event.new_agent.name != agent_name:
+                            yield sse_event("handoff", {"from": agent_name, "to": event.new_agent.name})
+                            agent_name = event.new_agent.name
+                        elif event.type == "run_item_stream_event" and event.name == "tool_called":
+                            call_id = raw_item_field(event.item.raw_item, "call_id")
+                            tool_names[call_id] = raw_item_field(event.item.raw_item, "name")
+                            yield sse_event("tool_call", {"tool": tool_names[call_id]})
+                        elif event.type == "run_item_stream_event" and event.name == "tool_output":
+                            call_id = raw_item_field(event.item.raw_item, "call_id")
+                            yield sse_event("tool_output", {"tool": tool_names.get(call_id)})
+
+                response_text = result.final_output or "I'm sorry, I couldn't process your request right now."
+                if cache_key and result.final_output:
+                    await response_cache.set(cache_key, response_text, RESPONSE_CACHE_TTL_SECONDS)
+                await save_turn(session_id, session, chat_message.message, response_text, context)
+                span.span_data.data["agent_type"] = agent_name
+                yield sse_event("done", {"response": response_text, "agent_type": agent_name, "session_id": session_id})
+
+            except asyncio.TimeoutError:
+                yield sse_event("error", {"message": "⏳ Sorry, that took longer than expected. Please try again in a moment.",
+                                          "agent_type": "System", "session_id": session_id})
+            except Exception as e:
+                yield sse_event("error", {"message": f"I apologize, but I'm experiencing some technical difficulties right now. Please try again in a moment. Error: {str(e)}",
+                                          "agent_type": "System", "session_id": session_id})
+
+@app.post("/chat/stream")
+async def chat_stream_endpoint(chat_message: ChatMessage):
+    """Same as /chat, but streamed as server-sent events so text shows up while the agents work"""
+    return StreamingResponse(
+        chat_stream_events(chat_message),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
+API_PAGE_SIZE = 100
+MAX_API_PAGE_SIZE = 1000
+STREAM_CHUNK_SIZE = 500
+
+def flight_to_dict(flight: Flight, available_seats: list[str]) -> dict:
+    return {
+        "id": flight.id,
+        "flight_number": flight.flight_number,
+        "departure": flight.departure,
+        "arrival": flight.arrival,
+        "departure_time": flight.departure_time,
+        "arrival_time": flight.arrival_time,
+        "available_seats": available_seats,
+        "price": flight.price,
+        "status": flight.status
+    }
+
+def booking_to_dict(booking: Booking) -> dict:
+    return {
+        "id": booking.id,
+        "booking_id": booking.booking_id,
+        "flight_number": booking.flight_number,
+        "passenger_name": booking.passenger_name,
+        "departure": booking.departure,
+        "arrival": booking.arrival,
+        "departure_time": booking.departure_time,
+        "arrival_time": booking.arrival_time,
+        "available_seat": booking.available_seat,
+        "price": booking.price,
+        "booked": booking.booked,
+        "created_at": booking.created_at
+    }
+
+def ndjson_line(item: dict) -> str:
+    return json.dumps(jsonable_encoder(item)) + "\n"
+
+def keyset_query(model, after_id: int | None):
+    query = select(model).order_by(model.id)
+    if after_id is not None:
+        query = query.where(model.id > after_id)
+    return query
+
+async def stream_flights(after_id: int | None):
+    snapshot = schedule_store.current()
+    if snapshot:
+        # Pinned to one snapshot, so the stream is consistent even if the schedule changes meanwhile
+        while chunk := snapshot.page(after_id, STREAM_CHUNK_SIZE):
+            yield "".join(ndjson_line(flight_to_dict(flight, list(flight.available_seats))) for flight in chunk)
+            after_id = chunk[-1].id
+        return
+    # The generator owns its session: it outlives the request handler
+    async with AsyncSessionLocal() as db:
+        result = await db.stream(keyset_query(Flight, after_id).execution_options(yield_per=STREAM_CHUNK_SIZE))
+        async for chunk in result.scalars().partitions():
+            seats = await available_seats_by_flight(db, [flight.flight_number for flight in chunk])
+            yield "".join(ndjson_line(flight_to_dict(flight, seats[flight.flight_number])) for flight in chunk)
+
+async def stream_bookings(after_id: int | None):
+    async with AsyncSessionLocal() as db:
+        result = await db.stream(keyset_query(Booking, after_id).execution_options(yield_per=STREAM_CHUNK_SIZE))
+        async for chunk in result.scalars().partitions():
+            yield "".join(ndjson_line(booking_to_dict(booking)) for booking in chunk)
+
 @app.get("/flights")
-async def get_flights():
-    """Get all available flights"""
-    with SessionLocal() as db:
-        flights = db.query(Flight).all()
-        return {"flights": [
-            {
-                "id": flight.id,
-                "flight_number": flight.flight_number,
-                "departure": flight.departure,
-                "arrival": flight.arrival,
-                "departure_time": flight.departure_time,
-                "arrival_time": flight.arrival_time,
-                "available_seats": flight.available_seats.split(",") if flight.available_seats else [],
-                "price": flight.price,
-                "status": flight.status
-            } for flight in flights
-        ]}
+async def get_flights(after_id: int | None = None, limit: int = Query(API_PAGE_SIZE, ge=1, le=MAX_API_PAGE_SIZE),
+                      stream: bool = False, db: AsyncSession = Depends(get_db)):
+    """Get available flights, one keyset page at a time or streamed as NDJSON"""
+    if stream:
+        return StreamingResponse(stream_flights(after_id), media_type="application/x-ndjson")
+    snapshot = schedule_store.current()
+    if snapshot:
+        flights = snapshot.page(after_id, limit)
+        seats = {flight.flight_number: list(flight.available_seats) for flight in flights}
+    else:
+        flights = (await db.execute(keyset_query(Flight, after_id).limit(limit))).scalars().all()
+        seats = await available_seats_by_flight(db, [flight.flight_number for flight in flights])
+    return {
+        "flights": [flight_to_dict(flight, seats[flight.flight_number]) for flight in flights],
+        "next_after_id": flights[-1].id if len(flights) == limit else None
+    }
 
 @app.get("/bookings")
-async def get_bookings():
-    """Get all bookings (staff only)"""
-    with SessionLocal() as db:
-        bookings = db.query(Booking).all()
-        return {"bookings": [
-            {
-                "id": booking.id,
-                "booking_id": booking.booking_id,
-                "flight_number": booking.flight_number,
-                "passenger_name": booking.passenger_name,
-                "departure": booking.departure,
-                "arrival": booking.arrival,
-                "departure_time": booking.departure_time,
-                "arrival_time": booking.arrival_time,
-                "available_seat": booking.available_seat,
-                "price": booking.price,
-                "booked": booking.booked,
-                "created_at": booking.created_at
-            } for booking in bookings
-        ]}
+async def get_bookings(after_id: int | None = None, limit: int = Query(API_PAGE_SIZE, ge=1, le=MAX_API_PAGE_SIZE),
+                       stream: bool = False, db: AsyncSession = Depends(get_db)):
+    """Get bookings (staff only), one keyset page at a time or streamed as NDJSON"""
+    if stream:
+        return StreamingResponse(stream_bookings(after_id), media_type="application/x-ndjson")
+    bookings = (await db.execute(keyset_query(Booking, after_id).limit(limit))).scalars().all()
+    return {
+        "bookings": [booking_to_dict(booking) for booking in bookings],
+        "next_after_id": bookings[-1].id if len(bookings) == limit else None
+    }
+
+@app.get("/faq/fast-path/stats")
+async def faq_fast_path_stats_endpoint():
+    """Hit rate of the /chat FAQ fast path"""
+    checked = faq_fast_path_stats["checked"]
+    return {
+        **faq_fast_path_stats,
+        "hit_rate": faq_fast_path_stats["hits"] / checked if checked else 0.0,
+        "enabled": FAQ_FAST_PATH_ENABLED,
+        "threshold": FAQ_FAST_PATH_THRESHOLD
+    }
+
+@app.post("/bookings/group")
+async def create_group_booking(request: GroupBookingRequest, db: AsyncSession = Depends(get_db)):
+    """Book seats for a whole group on one flight, all or nothing"""
+    try:
+        flight, bookings = await book_group(db, request.flight_number, request.passenger_names)
+    except GroupSeatsTakenError as e:
+        raise HTTPException(status_code=status.HTTP_409_CONFLICT, detail=str(e), headers={"Retry-After": "1"})
+    except GroupBookingError as e:
+        raise HTTPException(status_code=status.HTTP_409_CONFLICT, detail=str(e))
+    return {"flight_number": flight.flight_number, "bookings": [booking_to_dict(booking) for booking in bookings]}
+
+@app.post("/staff/flights/import")
+async def import_flights_endpoint(request: Request, format: str | None = Query(None, pattern="^(csv|json)$"),
+                                  db: AsyncSession = Depends(get_db)):
+    """Bulk import a flight schedule from a CSV or JSON request body (staff only)"""
+    fmt = format or ("csv" if "csv" in request.headers.get("content-type", "") else "json")
+    try:
+        rows = parse_schedule((await request.body()).decode("utf-8-sig"), fmt)
+    except (ValueError, UnicodeDecodeError) as e:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=str(e))
+    return await import_flights(db, rows)
+
+@app.get("/schedule/snapshot/stats")
+async def schedule_snapshot_stats_endpoint():
+    """Version, size and age of the in-memory schedule snapshot, and how it has been updated"""
+    snapshot = schedule_store.snapshot
+    return {
+        **schedule_store.stats,
+        "enabled": SCHEDULE_SNAPSHOT_ENABLED,
+        "version": snapshot.version if snapshot else None,
+        "schedule_version": snapshot.schedule_version if snapshot else None,
+        "flights": len(snapshot.flights) if snapshot else 0,
+        "age_seconds": round(time.monotonic() - snapshot.built_at, 1) if snapshot else None,
+        "change_cursor": schedule_store.change_cursor,
+        "poll_seconds": SCHEDULE_SNAPSHOT_POLL_SECONDS,
+        "rebuild_seconds": SCHEDULE_SNAPSHOT_REBUILD_SECONDS
+    }
+
+@app.get("/faq/cache/stats")
+async def response_cache_stats_endpoint():
+    """Hit rate of the FAQ response cache"""
+    lookups = response_cache_stats["hits"] + response_cache_stats["misses"]
+    return {
+        **response_cache_stats,
+        "hit_rate": response_cache_stats["hits"] / lookups if lookups else 0.0,
+        "schedule_version": await response_cache.get_counter(SCHEDULE_VERSION_KEY),
+        "backend": type(response_cache).__name__
+    }
+
+@app.middleware("http")
+async def record_request_metrics(request: Request, call_next):
+    start, status_code = time.perf_counter(), 500
+    try:
+        response = await call_next(request)
+        status_code = response.status_code
+        return response
+    finally:
+        # Label by route template, not raw path, so IDs in URLs don't create new series
+        route = getattr(request.scope.get("route"), "path", "unmatched")
+        metrics.observe("readyflight_http_request_duration_seconds", time.perf_counter() - start,
+                        method=request.method, route=route)
+        metrics.inc("readyflight_http_requests_total", method=request.method, route=route, status=str(status_code))
+
+@app.get("/metrics")
+async def metrics_endpoint():
+    """Prometheus metrics: tool, model and SQL latency, counts, errors and token usage per agent"""
+    # Stats the app already keeps elsewhere, exported alongside the live registry
+    existing = MetricsRegistry()
+    existing.histogram("readyflight_db_pool_checkout_wait_seconds", "Time spent waiting for a pooled connection")
+    existing.series["readyflight_db_pool_checkout_wait_seconds"][()] = pool_wait_histogram
+    existing.counter("readyflight_db_pool_timeouts_total", "Pool checkouts that timed out")
+    existing.inc("readyflight_db_pool_timeouts_total", pool_stats["timeouts"])
+    existing.counter("readyflight_response_cache_total", "FAQ response cache lookups and invalidations")
+    for result, count in response_cache_stats.items():
+        existing.inc("readyflight_response_cache_total", count, result=result)
+    existing.counter("readyflight_faq_fast_path_total", "FAQ fast path checks by result")
+    for result, count in faq_fast_path_stats.items():
+        existing.inc("readyflight_faq_fast_path_total", count, result=result)
+    existing.counter("readyflight_schedule_snapshot_updates_total", "Schedule snapshot swaps by kind")
+    for kind in ("full_rebuilds", "flight_reloads", "seat_updates", "refresh_errors"):
+        existing.inc("readyflight_schedule_snapshot_updates_total", schedule_store.stats[kind], kind=kind)
+    return PlainTextResponse(metrics.render() + existing.render(), media_type="text/plain; version=0.0.4")
+
+@app.get("/debug/traces")
+async def recent_traces(limit: int = Query(20, ge=1, le=TRACE_BUFFER_SIZE)):
+    """Most recent /chat traces, newest first, without their spans"""
+    return {"traces": [
+        {key: value for key, value in record.items() if key != "spans"} | {"span_count": len(record["spans"])}
+        for record in trace_exporter.recent(limit)
+    ]}
+
+@app.get("/debug/traces/{trace_id}")
+async def trace_detail(trace_id: str):
+    """Every span of one trace: agent turns, model calls, handoffs, tool calls and SQL statements"""
+    record = trace_exporter.get(trace_id)
+    if not record:
+        raise HTTPException(status_code=404, detail="Trace not found")
+    return record
+
+@app.get("/health/pool")
+async def pool_health():
+    """Connection pool usage and checkout wait times"""
+    pool = async_engine.pool
+    if not isinstance(pool, InstrumentedAsyncPool):
+        return {"pool": type(pool).__name__}
+    return {
+        "pool": type(pool).__name__,
+        "size": pool.size(),
+        "checked_out": pool.checkedout(),
+        "checked_in": pool.checkedin(),
+        "overflow": pool.overflow(),
+        "max_overflow": DB_MAX_OVERFLOW,
+        "timeouts": pool_stats["timeouts"],
+        "checkout_wait_seconds": pool_wait_histogram.snapshot()
+    }
 
 @app.get("/health")
 async def health_check():
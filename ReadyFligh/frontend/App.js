@@ -1,12 +1,50 @@
 import React, { useState, useRef, useEffect } from 'react';
 import { Send, Plane, Users, HelpCircle, Settings, MessageCircle, Loader2 } from 'lucide-react';
 
+const TOOL_LABELS = {
+  basic_info_tool: '📋 Looking up airline information',
+  flight_schedule_tool: '🗓️ Checking flight schedules',
+  book_flight_tool: '💺 Booking your seat',
+  book_group_tool: '💺 Booking seats for your group',
+  check_booking_tool: '🔍 Looking up your booking',
+  cancel_booking_tool: '❌ Cancelling your booking',
+  add_flight_tool: '✈️ Adding the flight',
+  update_flight_tool: '✏️ Updating the flight',
+  view_all_bookings_tool: '📑 Loading bookings',
+  flight_status_overview_tool: '📊 Building the flight overview'
+};
+
+// Reads a text/event-stream response and calls onEvent(event, data) for each event
+const readEventStream = async (response, onEvent) => {
+  const reader = response.body.getReader();
+  const decoder = new TextDecoder();
+  let buffer = '';
+  while (true) {
+    const { done, value } = await reader.read();
+    if (done) break;
+    buffer += decoder.decode(value, { stream: true });
+    const blocks = buffer.split('\n\n');
+    buffer = blocks.pop();
+    for (const block of blocks) {
+      let event = 'message';
+      let data = '';
+      for (const line of block.split('\n')) {
+        if (line.startsWith('event: ')) event = line.slice(7);
+        else if (line.startsWith('data: ')) data += line.slice(6);
+      }
+      if (data) onEvent(event, JSON.parse(data));
+    }
+  }
+};
+
 const ReadyFlightApp = () => {
   const [activeTab, setActiveTab] = useState('customer');
   const [messages, setMessages] = useState([]);
   const [inputMessage, setInputMessage] = useState('');
   const [isLoading, setIsLoading] = useState(false);
   const [currentAgent, setCurrentAgent] = useState('');
+  const [streamingId, setStreamingId] = useState(null);
+  const [sessionId, setSessionId] = useState(null);
   const messagesEndRef = useRef(null);
 
   const scrollToBottom = () => {
@@ -31,16 +69,37 @@ const ReadyFlightApp = () => {
     setInputMessage('');
     setIsLoading(true);
 
+    // The reply is rendered as it streams in; the bubble is added on the first event
+    const botId = Date.now() + 1;
+    let botAdded = false;
+    const updateBot = (changes) => {
+      if (!botAdded) {
+        botAdded = true;
+        setStreamingId(botId);
+        setMessages(prev => [...prev, {
+          id: botId,
+          type: 'bot',
+          content: '',
+          agent: '',
+          status: '',
+          timestamp: new Date().toLocaleTimeString()
+        }]);
+      }
+      setMessages(prev => prev.map(message => (
+        message.id === botId ? { ...message, ...changes(message) } : message
+      )));
+    };
+
     try {
-      // Simulate API call to your FastAPI backend
-      const response = await fetch('/chat', {
+      const response = await fetch('/chat/stream', {
         method: 'POST',
         headers: {
           'Content-Type': 'application/json',
         },
         body: JSON.stringify({
           message: inputMessage,
-          user_type: activeTab
+          user_type: activeTab,
+          session_id: sessionId
         })
       });
 
@@ -48,19 +107,45 @@ const ReadyFlightApp = () => {
         throw new Error('Network response was not ok');
       }
 
-      const data = await response.json();
-      
-      const botMessage = {
-        id: Date.now() + 1,
-        type: 'bot',
-        content: data.response,
-        agent: data.agent_type,
-        timestamp: new Date().toLocaleTimeString()
-      };
-
-      setMessages(prev => [...prev, botMessage]);
-      setCurrentAgent(data.agent_type);
+      await readEventStream(response, (event, data) => {
+        switch (event) {
+          case 'agent':
+            updateBot(() => ({ agent: data.agent }));
+            setCurrentAgent(data.agent);
+            break;
+          case 'handoff':
+            updateBot(() => ({ agent: data.to, status: `🔄 Connecting you to ${data.to}...` }));
+            setCurrentAgent(data.to);
+            break;
+          case 'tool_call':
+            updateBot(() => ({ status: `${TOOL_LABELS[data.tool] || '🔧 Working on it'}...` }));
+            break;
+          case 'tool_output':
+            updateBot(() => ({ status: '' }));
+            break;
+          case 'delta':
+            updateBot(message => ({ content: message.content + data.text, status: '' }));
+            break;
+          case 'done':
+            setSessionId(data.session_id);
+            updateBot(() => ({ content: data.response, agent: data.agent_type, status: '' }));
+            setCurrentAgent(data.agent_type);
+            break;
+          case 'error':
+            updateBot(() => ({ content: data.message, agent: data.agent_type, status: '' }));
+            break;
+          default:
+            break;
+        }
+      });
     } catch (error) {
+      if (botAdded) {
+        updateBot(message => ({
+          content: `${message.content}\n\n⚠️ The connection was interrupted. Please try again.`,
+          status: ''
+        }));
+        return;
+      }
       // Fallback demo response
       const demoResponses = {
         customer: {
@@ -88,6 +173,7 @@ const ReadyFlightApp = () => {
       setCurrentAgent(randomAgent);
     } finally {
       setIsLoading(false);
+      setStreamingId(null);
     }
   };
 
@@ -101,6 +187,7 @@ const ReadyFlightApp = () => {
   const clearChat = () => {
     setMessages([]);
     setCurrentAgent('');
+    setSessionId(null);
   };
 
   const getAgentIcon = (agent) => {
@@ -270,6 +357,12 @@ const ReadyFlightApp = () => {
                       </div>
                     )}
                     <div className="whitespace-pre-wrap">{message.content}</div>
+                    {message.status && (
+                      <div className="flex items-center space-x-2 mt-1 text-xs italic text-gray-500">
+                        <Loader2 className="w-3 h-3 animate-spin" />
+                        <span>{message.status}</span>
+                      </div>
+                    )}
                     <div className={`text-xs mt-2 ${
                       message.type === 'user' ? 'text-white/70' : 'text-gray-500'
                     }`}>
@@ -279,7 +372,7 @@ const ReadyFlightApp = () => {
                 </div>
               ))}
 
-              {isLoading && (
+              {isLoading && !streamingId && (
                 <div className="flex justify-start">
                   <div className="bg-gray-100 text-gray-800 px-4 py-3 rounded-2xl flex items-center space-x-2">
                     <Loader2 className="w-4 h-4 animate-spin" />
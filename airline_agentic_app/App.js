@@ -1,6 +1,42 @@
 import React, { useState, useRef, useEffect } from 'react';
 import { Send, Plane, User, Bot, Settings, MessageCircle, Users, HelpCircle } from 'lucide-react';
 
+const TOOL_LABELS = {
+  basic_info_tool: '📋 Looking up airline information',
+  flight_schedule_tool: '🗓️ Checking flight schedules',
+  search_flights_tool: '🔎 Searching flights',
+  book_flight_tool: '💺 Booking your seat',
+  check_booking_tool: '🔍 Looking up your booking',
+  cancel_booking_tool: '❌ Cancelling your booking',
+  add_flight_tool: '✈️ Adding the flight',
+  update_flight_tool: '✏️ Updating the flight',
+  view_all_bookings_tool: '📑 Loading bookings',
+  flight_status_overview_tool: '📊 Building the flight overview'
+};
+
+// Reads a text/event-stream response and calls onEvent(event, data) for each event
+const readEventStream = async (response, onEvent) => {
+  const reader = response.body.getReader();
+  const decoder = new TextDecoder();
+  let buffer = '';
+  while (true) {
+    const { done, value } = await reader.read();
+    if (done) break;
+    buffer += decoder.decode(value, { stream: true });
+    const blocks = buffer.split('\n\n');
+    buffer = blocks.pop();
+    for (const block of blocks) {
+      let event = 'message';
+      let data = '';
+      for (const line of block.split('\n')) {
+        if (line.startsWith('event: ')) event = line.slice(7);
+        else if (line.startsWith('data: ')) data += line.slice(6);
+      }
+      if (data) onEvent(event, JSON.parse(data));
+    }
+  }
+};
+
 const ReadyFlightChat = () => {
   const [messages, setMessages] = useState([
     {
@@ -15,6 +51,7 @@ const ReadyFlightChat = () => {
   const [isLoading, setIsLoading] = useState(false);
   const [userType, setUserType] = useState('customer');
   const [sessionId, setSessionId] = useState(null);
+  const [streamingId, setStreamingId] = useState(null);
   const messagesEndRef = useRef(null);
 
   const scrollToBottom = () => {
@@ -39,15 +76,37 @@ const ReadyFlightChat = () => {
     setInputMessage('');
     setIsLoading(true);
 
+    // The reply is rendered as it streams in; the bubble is added on the first event
+    const botId = Date.now() + 1;
+    let botAdded = false;
+    const updateBot = (changes) => {
+      if (!botAdded) {
+        botAdded = true;
+        setStreamingId(botId);
+        setMessages(prev => [...prev, {
+          id: botId,
+          text: '',
+          sender: 'bot',
+          agent: '',
+          status: '',
+          timestamp: new Date()
+        }]);
+      }
+      setMessages(prev => prev.map(message => (
+        message.id === botId ? { ...message, ...changes(message) } : message
+      )));
+    };
+
     try {
-      const response = await fetch('http://localhost:8000/chat', {
+      const response = await fetch('http://localhost:8000/chat/stream', {
         method: 'POST',
         headers: {
           'Content-Type': 'application/json',
         },
         body: JSON.stringify({
           message: inputMessage,
-          user_type: userType
+          user_type: userType,
+          session_id: sessionId
         }),
       });
 
@@ -55,32 +114,55 @@ const ReadyFlightChat = () => {
         throw new Error('Network response was not ok');
       }
 
-      const data = await response.json();
-      
-      setSessionId(data.session_id);
-      
-      const botMessage = {
-        id: Date.now() + 1,
-        text: data.response,
-        sender: 'bot',
-        agent: data.agent_type,
-        timestamp: new Date()
-      };
-
-      setMessages(prev => [...prev, botMessage]);
+      await readEventStream(response, (event, data) => {
+        switch (event) {
+          case 'agent':
+            updateBot(() => ({ agent: data.agent }));
+            break;
+          case 'handoff':
+            updateBot(() => ({ agent: data.to, status: `🔄 Connecting you to ${data.to}...` }));
+            break;
+          case 'tool_call':
+            updateBot(() => ({ status: `${TOOL_LABELS[data.tool] || '🔧 Working on it'}...` }));
+            break;
+          case 'tool_output':
+            updateBot(() => ({ status: '' }));
+            break;
+          case 'delta':
+            updateBot(message => ({ text: message.text + data.text, status: '' }));
+            break;
+          case 'done':
+            setSessionId(data.session_id);
+            updateBot(() => ({ text: data.response, agent: data.agent_type, status: '' }));
+            break;
+          case 'error':
+            updateBot(() => ({ text: data.message, agent: data.agent_type, status: '' }));
+            break;
+          default:
+            break;
+        }
+      });
     } catch (error) {
       console.error('Error sending message:', error);
-      const errorMessage = {
-        id: Date.now() + 1,
-        text: "I'm sorry, I'm having trouble connecting right now. Please try again in a moment. ✈️",
-        sender: 'bot',
-        agent: 'System',
-        timestamp: new Date()
-      };
-      setMessages(prev => [...prev, errorMessage]);
+      if (botAdded) {
+        updateBot(message => ({
+          text: `${message.text}\n\n⚠️ The connection was interrupted. Please try again.`,
+          status: ''
+        }));
+      } else {
+        const errorMessage = {
+          id: Date.now() + 1,
+          text: "I'm sorry, I'm having trouble connecting right now. Please try again in a moment. ✈️",
+          sender: 'bot',
+          agent: 'System',
+          timestamp: new Date()
+        };
+        setMessages(prev => [...prev, errorMessage]);
+      }
     }
 
     setIsLoading(false);
+    setStreamingId(null);
   };
 
   const handleKeyPress = (e) => {
@@ -198,6 +280,13 @@ const ReadyFlightChat = () => {
                 <div className={`${message.sender === 'user' ? 'text-white' : 'text-gray-800'}`}>
                   {message.sender === 'bot' ? formatMessage(message.text) : message.text}
                 </div>
+
+                {message.status && (
+                  <div className="flex items-center space-x-2 mt-1 text-xs italic text-gray-500">
+                    <div className="animate-spin rounded-full h-3 w-3 border-b-2 border-blue-600"></div>
+                    <span>{message.status}</span>
+                  </div>
+                )}
                 
                 {message.sender === 'user' && (
                   <div className="text-xs text-blue-100 mt-1">
@@ -208,7 +297,7 @@ const ReadyFlightChat = () => {
             </div>
           ))}
           
-          {isLoading && (
+          {isLoading && !streamingId && (
             <div className="flex justify-start">
               <div className="bg-gray-100 border border-gray-300 rounded-lg p-4 mr-8">
                 <div className="flex items-center space-x-2">
@@ -0,0 +1,111 @@
+"""Route index benchmark: FlightStore.search vs the old scan over every flight.
+
+Builds a synthetic flights_db (200k flights between 300 airports by default) and answers
+the same departure/arrival searches with the inverted index and with the lowercase
+substring scan the search tools used to run, checking both return the same flights. Then
+times the incremental index updates behind add_flight_tool and update_flight_tool.
+
+    python benchmarks/route_index.py --flights 200000 --queries 200
+"""
+import argparse
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault("GEMINI_API_KEY", "bench")
+
+from main import FlightStore  # noqa: E402
+
+CITIES = [f"City {chr(65 + i // 26)}{chr(65 + i % 26)}ville" for i in range(300)]
+AIRPORTS = [f"{city} {city[5:7].upper()}{chr(65 + i % 26)}" for i, city in enumerate(CITIES)]
+
+
+def make_flight(number: int, rng: random.Random) -> dict:
+    departure, arrival = rng.sample(AIRPORTS, 2)
+    return {
+        "flight_number": f"SY{number}",
+        "departure": departure,
+        "arrival": arrival,
+        "departure_time": "2025-06-08 10:00:00",
+        "arrival_time": "2025-06-08 12:00:00",
+        "available_seats": ["1A", "1B", "2A"],
+        "price": 100.0,
+        "status": "scheduled",
+    }
+
+
+def scan(flights: dict, departure: str = None, arrival: str = None) -> list[dict]:
+    """The search loop flight_schedule_tool and search_flights_tool used before the index."""
+    results = []
+    for flight in flights.values():
+        if departure and departure.lower() not in flight["departure"].lower():
+            continue
+        if arrival and arrival.lower() not in flight["arrival"].lower():
+            continue
+        results.append(flight)
+    return results
+
+
+def time_searches(search, queries) -> tuple[float, list[list[str]]]:
+    results = []
+    start = time.perf_counter()
+    for departure, arrival in queries:
+        results.append([flight["flight_number"] for flight in search(departure, arrival)])
+    return (time.perf_counter() - start) / len(queries), results
+
+
+def main_bench():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--flights", type=int, default=200_000)
+    parser.add_argument("--queries", type=int, default=200)
+    args = parser.parse_args()
+
+    rng = random.Random(7)
+    plain = {f"SY{n}": make_flight(n, rng) for n in range(1, args.flights + 1)}
+    start = time.perf_counter()
+    store = FlightStore(plain)
+    build_time = time.perf_counter() - start
+
+    # City names, IATA codes, a mix of both and one-sided searches, as customers type them
+    queries = []
+    for _ in range(args.queries):
+        departure, arrival = rng.sample(AIRPORTS, 2)
+        queries.append(rng.choice([
+            (departure.rsplit(" ", 1)[0], arrival.rsplit(" ", 1)[0]),
+            (departure.rsplit(" ", 1)[1], arrival.rsplit(" ", 1)[1]),
+            (departure.rsplit(" ", 1)[0].lower(), arrival.rsplit(" ", 1)[1].lower()),
+            (departure.rsplit(" ", 1)[1], None),
+        ]))
+    scan_time, scan_results = time_searches(lambda d, a: scan(plain, d, a), queries)
+    index_time, index_results = time_searches(store.search, queries)
+
+    new_flights = [make_flight(n, rng) for n in range(args.flights + 1, args.flights + 1001)]
+    start = time.perf_counter()
+    for flight in new_flights:
+        store[flight["flight_number"]] = flight
+    add_time = (time.perf_counter() - start) / 1000
+    moves = [rng.choice(AIRPORTS) for _ in range(1000)]
+    start = time.perf_counter()
+    for n, airport in enumerate(moves, start=1):
+        store.set_field(f"SY{n}", "departure", airport)
+    update_time = (time.perf_counter() - start) / 1000
+    plain = dict(store)
+    moved_ok = all(
+        [f["flight_number"] for f in store.search(d, a)] == [f["flight_number"] for f in scan(plain, d, a)]
+        for d, a in queries[:20]
+    )
+
+    print(f"flights:            {args.flights} ({len(AIRPORTS)} airports)")
+    print(f"index build:        {build_time:.2f}s")
+    print(f"full scan:          {scan_time * 1000:9.3f} ms/query")
+    print(f"inverted index:     {index_time * 1000:9.3f} ms/query ({scan_time / index_time:.0f}x faster)")
+    print(f"add flight:         {add_time * 1e6:9.1f} µs")
+    print(f"update departure:   {update_time * 1e6:9.1f} µs")
+    print(f"same results:       {scan_results == index_results} (after updates: {moved_ok})")
+    sys.exit(0 if scan_results == index_results and moved_ok else 1)
+
+
+if __name__ == "__main__":
+    main_bench()
@@ -0,0 +1,185 @@
+"""Multi-worker benchmark: booking throughput and inventory consistency with 1..N workers.
+
+Each worker is its own process that imports the app the way a uvicorn worker would (same
+STORAGE_BACKEND and STORAGE_SQLITE_PATH for all), swaps every agent's model for the scripted
+stand-in from benchmarks/chat_replay.py, and sends booking conversations through
+answer_chat(): the real agents, tools and storage run, without any Gemini call. All workers
+book the same flights at once, with a little more demand than seats. Afterwards the shared
+inventory is checked: no seat sold twice, every confirmed booking holds its seat, and
+nothing sold beyond capacity. With --backend memory every worker sells from its own copy
+of the flights, which shows up as seats sold more than once.
+
+Workers only add throughput where there are cores for them: on a single core the default
+20 ms model latency leaves the run CPU-bound, and a larger --latency shows how far the
+storage itself lets workers scale.
+
+    python benchmarks/shared_storage.py --workers 1 2 4 --requests 200 --concurrency 16
+    python benchmarks/shared_storage.py --backend sqlite --workers 1 2 4 --latency 0.2
+"""
+import argparse
+import asyncio
+import multiprocessing
+import os
+import shutil
+import sqlite3
+import sys
+import tempfile
+import time
+from collections import Counter
+
+ROOT = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+sys.path.insert(0, os.path.join(ROOT, "benchmarks"))
+
+from chat_replay import load_app, scripted_model_class  # noqa: E402
+
+SEAT_LETTERS = "ABCDEF"
+
+
+def booking_scenario(flight_number: str) -> dict:
+    return {
+        "message": f"Please book flight {flight_number} for Bench Passenger",
+        "calls": [("book_flight_tool", {"flight_number": flight_number, "passenger_name": "Bench Passenger"})],
+        "reply": "You're booked! ✈️",
+    }
+
+
+def bench_flight(flight_number: str, seats: int, seat_map_class) -> dict:
+    rows = -(-seats // len(SEAT_LETTERS))
+    labels = [f"{row}{letter}" for row in range(1, rows + 1) for letter in SEAT_LETTERS][:seats]
+    return {
+        "flight_number": flight_number, "departure": "Bench City BCY", "arrival": "Load Town LDT",
+        "departure_time": "2025-06-08 10:00:00", "arrival_time": "2025-06-08 12:00:00",
+        "available_seats": seat_map_class(labels), "price": 100.0, "status": "scheduled",
+    }
+
+
+def worker(backend: str, directory: str, flight_numbers: list[str], seats: int, args, barrier, results):
+    os.environ.update({
+        "STORAGE_BACKEND": backend,
+        "STORAGE_SQLITE_PATH": os.path.join(directory, "airline.db"),
+        "SESSION_SQLITE_PATH": os.path.join(directory, "sessions.db"),
+        "GEMINI_API_KEY": os.environ.get("GEMINI_API_KEY", "bench"),
+        "OPENAI_API_KEY": os.environ.get("OPENAI_API_KEY", "bench"),
+    })
+    main = load_app("airline")
+    scenarios = [booking_scenario(number) for number in flight_numbers]
+    ScriptedModel = scripted_model_class()
+    for agent in (main.faq_agent, main.customer_agent, main.staff_agent, main.frontline_agent):
+        agent.model.model = ScriptedModel({scenario["message"]: scenario for scenario in scenarios}, args.latency)
+
+    async def run() -> tuple[float, float, int]:
+        for number in flight_numbers:  # a no-op for every worker but the first with a shared store
+            await main.storage.add_flight(bench_flight(number, seats, main.SeatMap))
+        pending = iter(range(args.requests))
+        errors = 0
+
+        async def client():
+            nonlocal errors
+            for i in pending:
+                scenario = scenarios[(i + os.getpid()) % len(scenarios)]
+                response = await main.answer_chat(main.ChatMessage(message=scenario["message"], user_type="customer", fast_path=False))
+                errors += response.agent_type == "System"
+
+        barrier.wait()
+        start = time.time()
+        await asyncio.gather(*(client() for _ in range(args.concurrency)))
+        return start, time.time(), errors
+
+    start, end, errors = asyncio.run(run())
+    sold = [(booking["flight_number"], booking["seat"]) for booking in asyncio.run(main.storage.bookings())
+            if booking["status"] == "confirmed"] if backend == "memory" else []
+    results.put({"start": start, "end": end, "errors": errors, "stats": main.storage.stats, "sold": sold})
+
+
+def check_shared_inventory(path: str, flight_numbers: list[str], seats: int) -> list[str]:
+    """Invariants of the SQLite store once every worker is done; returns the violations."""
+    conn = sqlite3.connect(path)
+    marks = ", ".join("?" * len(flight_numbers))
+    problems = []
+    duplicated = conn.execute(f"SELECT flight_number, seat FROM bookings WHERE status = 'confirmed' AND flight_number IN ({marks}) "
+                              "GROUP BY flight_number, seat HAVING COUNT(*) > 1", flight_numbers).fetchall()
+    if duplicated:
+        problems.append(f"seats sold twice: {duplicated[:5]}")
+    stray = conn.execute(f"SELECT b.booking_id FROM bookings b LEFT JOIN flight_seats s ON s.flight_number = b.flight_number "
+                         f"AND s.seat = b.seat WHERE b.status = 'confirmed' AND b.flight_number IN ({marks}) "
+                         "AND (s.booking_id IS NULL OR s.booking_id != b.booking_id)", flight_numbers).fetchall()
+    if stray:
+        problems.append(f"{len(stray)} bookings whose seat is not held for them")
+    for flight_number, total, held in conn.execute(
+        f"SELECT flight_number, COUNT(*), COUNT(booking_id) FROM flight_seats WHERE flight_number IN ({marks}) GROUP BY flight_number",
+        flight_numbers
+    ):
+        if total != seats:
+            problems.append(f"{flight_number} has {total} seat rows, expected {seats}")
+        confirmed = conn.execute("SELECT COUNT(*) FROM bookings WHERE flight_number = ? AND status = 'confirmed'", (flight_number,)).fetchone()[0]
+        if confirmed != held:
+            problems.append(f"{flight_number}: {confirmed} confirmed bookings but {held} booked seats")
+    conn.close()
+    return problems
+
+
+def run_workers(backend: str, workers: int, args) -> dict:
+    directory = tempfile.mkdtemp(prefix="shared_storage_")
+    flight_numbers = [f"BN{900 + n}" for n in range(args.flights)]
+    demand = workers * args.requests
+    seats = max(1, int(demand / args.oversubscribe) // args.flights)
+    capacity = seats * args.flights
+
+    context = multiprocessing.get_context("spawn")
+    barrier = context.Barrier(workers)
+    results = context.Queue()
+    processes = [context.Process(target=worker, args=(backend, directory, flight_numbers, seats, args, barrier, results))
+                 for _ in range(workers)]
+    for process in processes:
+        process.start()
+    reports = [results.get() for _ in processes]
+    for process in processes:
+        process.join()
+
+    wall = max(report["end"] for report in reports) - min(report["start"] for report in reports)
+    booked = sum(report["stats"]["bookings"] for report in reports)
+    if backend == "sqlite":
+        problems = check_shared_inventory(os.path.join(directory, "airline.db"), flight_numbers, seats)
+    else:
+        # Each worker only sees its own bookings; the same seat sold by two workers is an oversale
+        sold = Counter(seat for report in reports for seat in report["sold"])
+        oversold = sum(count - 1 for count in sold.values() if count > 1)
+        problems = [f"{oversold} seats sold more than once"] if oversold else []
+    shutil.rmtree(directory, ignore_errors=True)
+    if booked != min(capacity, demand):
+        problems.append(f"{booked} bookings for {capacity} seats and {demand} requests")
+    return {
+        "backend": backend, "workers": workers, "requests": demand, "capacity": capacity, "wall": wall,
+        "throughput": demand / wall, "booked": booked, "sold_out": sum(report["stats"]["sold_out"] for report in reports),
+        "errors": sum(report["errors"] for report in reports), "problems": problems,
+    }
+
+
+def main_bench():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--backend", nargs="+", choices=["sqlite", "memory"], default=["sqlite", "memory"])
+    parser.add_argument("--workers", type=int, nargs="+", default=[1, 2, 4])
+    parser.add_argument("--requests", type=int, default=200, help="booking conversations per worker")
+    parser.add_argument("--concurrency", type=int, default=16, help="conversations in flight per worker")
+    parser.add_argument("--latency", type=float, default=0.02, help="seconds per scripted model turn")
+    parser.add_argument("--flights", type=int, default=4)
+    parser.add_argument("--oversubscribe", type=float, default=1.1, help="booking requests per seat")
+    args = parser.parse_args()
+
+    print(f"cpus: {os.cpu_count()}  requests/worker: {args.requests}  concurrency/worker: {args.concurrency}  "
+          f"model latency: {args.latency * 1000:.0f} ms")
+    print(f"{'backend':8} {'workers':>7} {'requests':>8} {'seats':>6} {'req/s':>8} {'booked':>7} {'sold out':>8} "
+          f"{'errors':>6}  inventory")
+    failed = False
+    for backend in args.backend:
+        for workers in args.workers:
+            run = run_workers(backend, workers, args)
+            print(f"{backend:8} {workers:7} {run['requests']:8} {run['capacity']:6} {run['throughput']:8.1f} {run['booked']:7} "
+                  f"{run['sold_out']:8} {run['errors']:6}  "
+                  + ("consistent" if not run["problems"] else "INCONSISTENT: " + "; ".join(run["problems"])))
+            failed |= backend == "sqlite" and bool(run["problems"] or run["errors"])
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == "__main__":
+    main_bench()
@@ -1,20 +1,40 @@
-from fastapi import FastAPI, HTTPException
+from fastapi import FastAPI, HTTPException, Request
+from fastapi.responses import PlainTextResponse, StreamingResponse
 from fastapi.middleware.cors import CORSMiddleware
-from pydantic import BaseModel
+from pydantic import BaseModel, Field
 from typing import Optional, List, Dict, Any
 import uuid
 import os
 from datetime import datetime, timedelta
 from openai import AsyncOpenAI
+from openai.types.responses import ResponseTextDeltaEvent
 import json
-import random
+import re
+from collections import OrderedDict, deque
+import bisect
+import contextlib
+import dataclasses
+import tempfile
+import threading
+import queue
+import time
+import asyncio
+import sqlite3
+import textwrap
 from dotenv import load_dotenv
 
+try:
+    import fcntl  # booking worker id leases; not available on Windows
+except ImportError:
+    fcntl = None
+    import msvcrt
+
 # Import the agents framework as specified
 from agents import (
     Agent, Runner, RunContextWrapper, function_tool, handoff,
     ToolCallItem, ToolCallOutputItem, MessageOutputItem, HandoffOutputItem, ItemHelpers,
-    TResponseInputItem, trace, OpenAIChatCompletionsModel
+    TResponseInputItem, trace, OpenAIChatCompletionsModel, Model, FunctionTool, MultiProvider,
+    TracingProcessor, set_trace_processors, custom_span
 )
 from agents.extensions.handoff_prompt import RECOMMENDED_PROMPT_PREFIX
 
@@ -51,25 +71,270 @@ class AirlineAgentContext(BaseModel):
     flight_number: str | None = None
     user_type: str = "customer"  # "customer" or "staff"
 
+CHAT_MESSAGE_MAX_CHARS = int(os.getenv("CHAT_MESSAGE_MAX_CHARS", "4000"))
+
 # Data Models for API
 class ChatMessage(BaseModel):
-    message: str
+    message: str = Field(max_length=CHAT_MESSAGE_MAX_CHARS)
     user_type: str
+    fast_path: bool = True  # set False to always run the agent
+    session_id: str | None = None  # from a previous response, to continue that conversation
 
 class ChatResponse(BaseModel):
     response: str
     agent_type: str
     session_id: str
 
-# In-memory databases (replace with MongoDB in production)
-flights_db = {
+# Seat maps
+SEAT_LABEL = re.compile(r"(\d+)([A-Z])")
+
+class SeatMap:
+    """One flight's seats as bits of two ints, one bit per seat at (row - 1) * width + letter,
+    so lower bits are seats nearer the front. `seats` marks seats that exist and `free` the
+    ones still available. Claim, release and membership are single bit operations, and the
+    first free seat is the lowest set bit of `free`. Labels that are not row + letter
+    ("EXIT1") get positions after the grid."""
+
+    def __init__(self, seats):
+        seats = list(dict.fromkeys(seat.strip().upper() for seat in seats if seat.strip()))
+        grid = [SEAT_LABEL.fullmatch(seat) for seat in seats]
+        self.letters = sorted({match[2] for match in grid if match})
+        self.letter_index = {letter: i for i, letter in enumerate(self.letters)}
+        self.width = len(self.letters)
+        self.rows = max((int(match[1]) for match in grid if match), default=0)
+        self.positions: dict[str, int] = {}  # label -> bit, for every seat that exists
+        self.extra_labels: dict[int, str] = {}
+        self.seats = self.free = 0
+        for seat in seats:
+            bit = 1 << self.position(seat, add=True)
+            self.seats |= bit
+            self.free |= bit
+
+    def position(self, seat: str, add: bool = False) -> int | None:
+        seat = (seat or "").strip().upper()
+        position = self.positions.get(seat)
+        if position is None and add:
+            match = SEAT_LABEL.fullmatch(seat)
+            if match and 1 <= int(match[1]) <= self.rows and match[2] in self.letter_index:
+                position = (int(match[1]) - 1) * self.width + self.letter_index[match[2]]
+            else:
+                position = self.rows * self.width + len(self.extra_labels)
+                self.extra_labels[position] = seat
+            self.positions[seat] = position
+        return position
+
+    def label(self, position: int) -> str:
+        if position in self.extra_labels:
+            return self.extra_labels[position]
+        row, letter = divmod(position, self.width)
+        return f"{row + 1}{self.letters[letter]}"
+
+    def __contains__(self, seat: str) -> bool:
+        position = self.position(seat)
+        return position is not None and bool(self.free >> position & 1)
+
+    def __len__(self) -> int:
+        return self.free.bit_count()
+
+    def __iter__(self):
+        free = self.free
+        while free:
+            lowest = free & -free
+            yield self.label(lowest.bit_length() - 1)
+            free ^= lowest
+
+    def __str__(self) -> str:
+        return ", ".join(self)
+
+    def claim(self, seat: str) -> bool:
+        """Take a specific seat; False if it does not exist or is already taken."""
+        position = self.position(seat)
+        if position is None or not self.free >> position & 1:
+            return False
+        self.free &= ~(1 << position)
+        return True
+
+    def claim_first(self) -> str | None:
+        """Take the front-most free seat, or None if the flight is full."""
+        if not self.free:
+            return None
+        lowest = self.free & -self.free
+        self.free ^= lowest
+        return self.label(lowest.bit_length() - 1)
+
+    def release(self, seat: str) -> bool:
+        """Give a seat back; False if it was already free, so a repeated release changes nothing."""
+        position = self.position(seat, add=True)
+        bit = 1 << position
+        if self.free & bit:
+            return False
+        self.seats |= bit
+        self.free |= bit
+        return True
+
+# Flight store
+def place_tokens(place: str) -> list[str]:
+    """Lowercase words of a departure/arrival string: city name words and the IATA code."""
+    return re.findall(r"[0-9a-z]+", (place or "").lower())
+
+class FlightStore(dict):
+    """flights_db: a dict of flight number -> flight that also keeps route indexes, so searches
+    intersect small sets instead of scanning every flight.
+    - places_by_token: word -> places containing it, plus a sorted word list for prefix lookups
+    - by_departure / by_arrival: place -> flight numbers
+    Assign whole flights (flights_db[number] = flight) or use set_field(); editing a flight
+    dict's departure/arrival in place would bypass the indexes."""
+
+    def __init__(self, flights: dict = None):
+        super().__init__()
+        self.places_by_token: dict[str, set[str]] = {}
+        self.tokens: list[str] = []
+        self.place_refs: dict[str, int] = {}
+        self.by_departure: dict[str, set[str]] = {}
+        self.by_arrival: dict[str, set[str]] = {}
+        self.order: dict[str, int] = {}  # insertion sequence, so results keep flights_db order
+        self.sequence = 0
+        for flight_number, flight in (flights or {}).items():
+            self[flight_number] = flight
+
+    def __setitem__(self, flight_number: str, flight: dict):
+        if flight_number in self:
+            self.unindex(flight_number)
+        else:
+            self.sequence += 1
+            self.order[flight_number] = self.sequence
+        super().__setitem__(flight_number, flight)
+        self.index(flight_number)
+
+    def __delitem__(self, flight_number: str):
+        self.unindex(flight_number)
+        super().__delitem__(flight_number)
+        del self.order[flight_number]
+
+    def set_field(self, flight_number: str, field: str, value):
+        """Change one field of a flight, re-indexing it if the route changed."""
+        routed = field in ("departure", "arrival")
+        if routed:
+            self.unindex(flight_number)
+        self[flight_number][field] = value
+        if routed:
+            self.index(flight_number)
+
+    def index(self, flight_number: str):
+        flight = self[flight_number]
+        for index, place in ((self.by_departure, flight["departure"]), (self.by_arrival, flight["arrival"])):
+            place = place.lower()
+            index.setdefault(place, set()).add(flight_number)
+            self.place_refs[place] = self.place_refs.get(place, 0) + 1
+            if self.place_refs[place] == 1:
+                for token in place_tokens(place):
+                    if token not in self.places_by_token:
+                        self.places_by_token[token] = set()
+                        bisect.insort(self.tokens, token)
+                    self.places_by_token[token].add(place)
+
+    def unindex(self, flight_number: str):
+        flight = self[flight_number]
+        for index, place in ((self.by_departure, flight["departure"]), (self.by_arrival, flight["arrival"])):
+            place = place.lower()
+            index[place].discard(flight_number)
+            if not index[place]:
+                del index[place]
+            self.place_refs[place] -= 1
+            if not self.place_refs[place]:
+                del self.place_refs[place]
+                for token in place_tokens(place):
+                    self.places_by_token[token].discard(place)
+                    if not self.places_by_token[token]:
+                        del self.places_by_token[token]
+                        del self.tokens[bisect.bisect_left(self.tokens, token)]
+
+    def match_places(self, query: str) -> set[str] | None:
+        """Places where every word of the query starts a word of the place ("new york", "jfk",
+        "los ang"). None means the query has no words and filters nothing."""
+        places = None
+        for term in place_tokens(query):
+            matches = set()
+            for position in range(bisect.bisect_left(self.tokens, term), len(self.tokens)):
+                if not self.tokens[position].startswith(term):
+                    break
+                matches |= self.places_by_token[self.tokens[position]]
+            places = matches if places is None else places & matches
+            if not places:
+                return set()
+        return places
+
+    def search(self, departure: str = None, arrival: str = None) -> list[dict]:
+        """Flights whose departure and arrival match the queries, in flights_db order."""
+        departures = self.match_places(departure) if departure else None
+        arrivals = self.match_places(arrival) if arrival else None
+        if departures is None and arrivals is None:
+            return list(self.values())
+        # Collect from the side with fewer places, then check the other side per flight
+        if departures is None or (arrivals is not None and len(arrivals) < len(departures)):
+            candidates = {number for place in arrivals for number in self.by_arrival[place]}
+            wanted, field = departures, "departure"
+        else:
+            candidates = {number for place in departures for number in self.by_departure[place]}
+            wanted, field = arrivals, "arrival"
+        if wanted is not None:
+            candidates = {number for number in candidates if self[number][field].lower() in wanted}
+        return [self[number] for number in sorted(candidates, key=self.order.__getitem__)]
+
+# Booking store
+class BookingStore(dict):
+    """bookings_db: a dict of booking id -> booking that also keeps, per flight, the ids of its
+    bookings (in booking order) and how many are in each status, so the staff tools never
+    scan every booking. Add bookings by assignment and change status with set_status()."""
+
+    def __init__(self):
+        super().__init__()
+        self.by_flight: dict[str, dict[str, None]] = {}  # flight number -> booking ids, as an ordered set
+        self.status_counts: dict[str, dict[str, int]] = {}  # flight number -> status -> count
+
+    def __setitem__(self, booking_id: str, booking: dict):
+        if booking_id in self:
+            self.unindex(booking_id)
+        super().__setitem__(booking_id, booking)
+        self.index(booking_id)
+
+    def __delitem__(self, booking_id: str):
+        self.unindex(booking_id)
+        super().__delitem__(booking_id)
+
+    def set_status(self, booking_id: str, status: str):
+        booking = self[booking_id]
+        counts = self.status_counts[booking["flight_number"]]
+        counts[booking["status"]] -= 1
+        booking["status"] = status
+        counts[status] = counts.get(status, 0) + 1
+
+    def index(self, booking_id: str):
+        booking = self[booking_id]
+        self.by_flight.setdefault(booking["flight_number"], {})[booking_id] = None
+        counts = self.status_counts.setdefault(booking["flight_number"], {})
+        counts[booking["status"]] = counts.get(booking["status"], 0) + 1
+
+    def unindex(self, booking_id: str):
+        booking = self[booking_id]
+        del self.by_flight[booking["flight_number"]][booking_id]
+        self.status_counts[booking["flight_number"]][booking["status"]] -= 1
+
+    def for_flight(self, flight_number: str) -> list[dict]:
+        return [self[booking_id] for booking_id in self.by_flight.get(flight_number, ())]
+
+    def count(self, flight_number: str, status: str) -> int:
+        return self.status_counts.get(flight_number, {}).get(status, 0)
+
+# In-memory databases: the memory storage backend, and the sample flights a new SQLite store starts with
+flights_db = FlightStore({
     "RF001": {
         "flight_number": "RF001",
         "departure": "New York JFK",
         "arrival": "Los Angeles LAX",
         "departure_time": "2025-06-08 10:00:00",
         "arrival_time": "2025-06-08 13:30:00",
-        "available_seats": ["1A", "1B", "2A", "2B", "3A", "3B", "4A", "4B"],
+        "available_seats": SeatMap(["1A", "1B", "2A", "2B", "3A", "3B", "4A", "4B"]),
         "price": 299.99,
         "status": "scheduled"
     },
@@ -79,7 +344,7 @@ flights_db = {
         "arrival": "Miami MIA",
         "departure_time": "2025-06-08 14:00:00",
         "arrival_time": "2025-06-08 17:00:00",
-        "available_seats": ["1A", "2A", "2B", "3A", "5A", "5B"],
+        "available_seats": SeatMap(["1A", "2A", "2B", "3A", "5A", "5B"]),
         "price": 199.99,
         "status": "scheduled"
     },
@@ -89,17 +354,922 @@ flights_db = {
         "arrival": "Seattle SEA",
         "departure_time": "2025-06-08 16:00:00",
         "arrival_time": "2025-06-08 18:30:00",
-        "available_seats": ["1A", "1B", "2A", "3A", "3B", "4A"],
+        "available_seats": SeatMap(["1A", "1B", "2A", "3A", "3B", "4A"]),
         "price": 149.99,
         "status": "scheduled"
     }
-}
+})
+
+bookings_db = BookingStore()
+
+# Booking IDs
+class BookingIdGenerator:
+    """Time-ordered booking IDs: 41 bits of ms, 10 of worker id, 12 of sequence, in base32."""
+    EPOCH_MS = 1704067200000
+    WORKER_BITS = 10
+    SEQUENCE_BITS = 12
+    ALPHABET = "0123456789ABCDEFGHJKMNPQRSTVWXYZ"
+
+    def __init__(self, worker_id: int, prefix: str = "RF"):
+        if not 0 <= worker_id < 1 << self.WORKER_BITS:
+            raise ValueError(f"worker_id must be between 0 and {(1 << self.WORKER_BITS) - 1}")
+        self.worker_id = worker_id
+        self.prefix = prefix
+        self.lock = threading.Lock()
+        self.last_ms = -1
+        self.sequence = 0
+
+    def next_id(self) -> str:
+        with self.lock:
+            now_ms = int(time.time() * 1000) - self.EPOCH_MS
+            if now_ms > self.last_ms:
+                self.last_ms, self.sequence = now_ms, 0
+            else:
+                # Same ms or clock went back
+                self.sequence += 1
+                if self.sequence >> self.SEQUENCE_BITS:
+                    self.last_ms, self.sequence = self.last_ms + 1, 0
+            value = (self.last_ms << (self.WORKER_BITS + self.SEQUENCE_BITS)) | (self.worker_id << self.SEQUENCE_BITS) | self.sequence
+        chars = []
+        for _ in range(13):
+            value, digit = divmod(value, 32)
+            chars.append(self.ALPHABET[digit])
+        return self.prefix + "".join(reversed(chars))
+
+BOOKING_WORKER_LOCK_PATH = os.getenv("BOOKING_WORKER_LOCK_PATH", os.path.join(tempfile.gettempdir(), "readyflight-booking-workers.lock"))
+
+def lease_booking_worker_id(path: str) -> int:
+    """Worker id = offset of a byte we hold locked in the host-wide lock file."""
+    size = 1 << BookingIdGenerator.WORKER_BITS
+    fd = os.open(path, os.O_RDWR | os.O_CREAT, 0o666)
+    start = os.getpid() % size
+    for worker_id in [(start + offset) % size for offset in range(size)]:
+        try:
+            if fcntl:
+                fcntl.lockf(fd, fcntl.LOCK_EX | fcntl.LOCK_NB, 1, worker_id)
+            else:
+                os.lseek(fd, worker_id, os.SEEK_SET)
+                msvcrt.locking(fd, msvcrt.LK_NBLCK, 1)
+        except OSError:
+            continue
+        return worker_id  # keep fd open to hold the lock
+    os.close(fd)
+    raise RuntimeError(f"All {size} booking worker ids on this host are in use; set BOOKING_WORKER_ID")
+
+def default_booking_worker_id() -> int:
+    """BOOKING_WORKER_ID if set, else a leased id."""
+    worker_id = os.getenv("BOOKING_WORKER_ID")
+    if worker_id is not None:
+        return int(worker_id)
+    return lease_booking_worker_id(BOOKING_WORKER_LOCK_PATH)
+
+booking_ids = BookingIdGenerator(default_booking_worker_id())
+if hasattr(os, "register_at_fork"):
+    # Forked workers lease their own id
+    os.register_at_fork(after_in_child=lambda: setattr(booking_ids, "worker_id", default_booking_worker_id()))
+
+# ================================================================== Metrics
+
+class LatencyHistogram:
+    """Fixed-bucket histogram of durations in seconds."""
+    BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+    def __init__(self, buckets: tuple = BUCKETS):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, seconds: float):
+        self.counts[bisect.bisect_left(self.buckets, seconds)] += 1
+        self.sum += seconds
+        self.count += 1
+
+    def snapshot(self) -> dict:
+        cumulative, running = {}, 0
+        for bound, count in zip(self.buckets + (float("inf"),), self.counts):
+            running += count
+            cumulative["+Inf" if bound == float("inf") else str(bound)] = running
+        return {"buckets": cumulative, "sum": self.sum, "count": self.count}
+
+class MetricsRegistry:
+    """Labelled counters and latency histograms, rendered in Prometheus text format."""
+
+    def __init__(self):
+        self.help = {}
+        self.kinds = {}
+        self.series = {}
+        self.lock = threading.Lock()
+
+    def counter(self, name: str, help_text: str):
+        self.help[name], self.kinds[name], self.series[name] = help_text, "counter", {}
+
+    def histogram(self, name: str, help_text: str):
+        self.help[name], self.kinds[name], self.series[name] = help_text, "histogram", {}
+
+    def gauge(self, name: str, help_text: str):
+        self.help[name], self.kinds[name], self.series[name] = help_text, "gauge", {}
+
+    def set(self, name: str, value: float, **labels):
+        with self.lock:
+            self.series[name][tuple(sorted(labels.items()))] = value
+
+    def inc(self, name: str, amount: float = 1, **labels):
+        key = tuple(sorted(labels.items()))
+        with self.lock:
+            self.series[name][key] = self.series[name].get(key, 0) + amount
+
+    def observe(self, name: str, seconds: float, **labels):
+        key = tuple(sorted(labels.items()))
+        with self.lock:
+            histogram = self.series[name].get(key)
+            if histogram is None:
+                histogram = self.series[name][key] = LatencyHistogram()
+            histogram.observe(seconds)
+
+    @staticmethod
+    def format_labels(labels, **extra) -> str:
+        pairs = list(labels) + list(extra.items())
+        if not pairs:
+            return ""
+        escape = lambda value: str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+        return "{" + ",".join(f'{key}="{escape(value)}"' for key, value in pairs) + "}"
+
+    def render(self) -> str:
+        lines = []
+        with self.lock:
+            for name, series in self.series.items():
+                lines.append(f"# HELP {name} {self.help[name]}")
+                lines.append(f"# TYPE {name} {self.kinds[name]}")
+                for labels, value in series.items():
+                    if self.kinds[name] != "histogram":
+                        lines.append(f"{name}{self.format_labels(labels)} {value}")
+                        continue
+                    snapshot = value.snapshot()
+                    for bound, count in snapshot["buckets"].items():
+                        lines.append(f"{name}_bucket{self.format_labels(labels, le=bound)} {count}")
+                    lines.append(f"{name}_sum{self.format_labels(labels)} {snapshot['sum']}")
+                    lines.append(f"{name}_count{self.format_labels(labels)} {snapshot['count']}")
+        return "\n".join(lines) + "\n"
+
+metrics = MetricsRegistry()
+metrics.counter("readyflight_tool_calls_total", "Tool invocations by agent, tool and outcome (ok, failed reply, error)")
+metrics.histogram("readyflight_tool_duration_seconds", "Tool latency by agent and tool")
+metrics.counter("readyflight_llm_calls_total", "Model calls by agent, model and outcome")
+metrics.histogram("readyflight_llm_duration_seconds", "Model call latency by agent and model")
+metrics.counter("readyflight_llm_tokens_total", "Tokens used by agent, model and direction (input/output)")
+metrics.counter("readyflight_http_requests_total", "HTTP requests by method, route and status code")
+metrics.histogram("readyflight_http_request_duration_seconds", "HTTP request latency by method and route")
+
+def record_llm_usage(agent_name: str, model_name: str, usage):
+    if usage is None:
+        return
+    metrics.inc("readyflight_llm_tokens_total", usage.input_tokens or 0, agent=agent_name, model=model_name, direction="input")
+    metrics.inc("readyflight_llm_tokens_total", usage.output_tokens or 0, agent=agent_name, model=model_name, direction="output")
+
+class InstrumentedModel(Model):
+    """Records latency, errors and token usage of an agent's model calls."""
+
+    def __init__(self, model, agent_name: str):
+        self.model = model if isinstance(model, Model) else None
+        self.model_name = str(getattr(model, "model", None) or model or "default")
+        self.requested_model = None if isinstance(model, Model) else model
+        self.agent_name = agent_name
+
+    def resolve(self) -> Model:
+        if self.model is None:
+            self.model = MultiProvider().get_model(self.requested_model)
+        return self.model
+
+    def record(self, start: float, status: str):
+        labels = {"agent": self.agent_name, "model": self.model_name}
+        metrics.observe("readyflight_llm_duration_seconds", time.perf_counter() - start, **labels)
+        metrics.inc("readyflight_llm_calls_total", status=status, **labels)
+
+    async def get_response(self, *args, **kwargs):
+        start, status = time.perf_counter(), "error"
+        try:
+            response = await self.resolve().get_response(*args, **kwargs)
+            record_llm_usage(self.agent_name, self.model_name, response.usage)
+            status = "ok"
+            return response
+        finally:
+            self.record(start, status)
+
+    async def stream_response(self, *args, **kwargs):
+        start, status = time.perf_counter(), "error"
+        try:
+            async for event in self.resolve().stream_response(*args, **kwargs):
+                if getattr(event, "type", None) == "response.completed":
+                    record_llm_usage(self.agent_name, self.model_name, event.response.usage)
+                yield event
+            status = "ok"
+        finally:
+            self.record(start, status)
+
+def instrument_tool(tool: FunctionTool, agent_name: str) -> FunctionTool:
+    invoke = tool.on_invoke_tool
+
+    async def on_invoke_tool(ctx, input):
+        start, status = time.perf_counter(), "error"
+        try:
+            result = await invoke(ctx, input)
+            # Failed tools reply "❌ ..." or the SDK's "An error occurred ..."
+            status = "failed" if str(result).startswith(("❌", "An error occurred")) else "ok"
+            return result
+        finally:
+            labels = {"agent": agent_name, "tool": tool.name}
+            metrics.observe("readyflight_tool_duration_seconds", time.perf_counter() - start, **labels)
+            metrics.inc("readyflight_tool_calls_total", status=status, **labels)
+
+    return dataclasses.replace(tool, on_invoke_tool=on_invoke_tool)
+
+def instrument_agent(agent: Agent, agent_name: str):
+    """Record metrics for every model call and tool call the agent makes."""
+    agent.model = InstrumentedModel(agent.model, agent_name)
+    agent.tools = [instrument_tool(tool, agent_name) if isinstance(tool, FunctionTool) else tool for tool in agent.tools]
+
+# ================================================================== Tracing
+
+TRACE_BUFFER_SIZE = int(os.getenv("TRACE_BUFFER_SIZE", "200"))
+TRACE_EXPORT_PATH = os.getenv("TRACE_EXPORT_PATH")
+TRACE_INCLUDE_CONTENT = os.getenv("TRACE_INCLUDE_CONTENT", "false").lower() == "true"
+TRACE_MAX_OPEN = 1000
+TRACE_EXPORT_QUEUE_SIZE = 1000
+
+def span_duration_ms(span: dict) -> float | None:
+    if not span.get("started_at") or not span.get("ended_at"):
+        return None
+    started = datetime.fromisoformat(span["started_at"])
+    ended = datetime.fromisoformat(span["ended_at"])
+    return round((ended - started).total_seconds() * 1000, 3)
+
+class LocalTraceExporter(TracingProcessor):
+    """Recent traces in memory, optionally appended to TRACE_EXPORT_PATH by a background thread."""
+
+    def __init__(self, buffer_size: int, export_path: str | None):
+        self.finished = deque(maxlen=buffer_size)
+        self.open = OrderedDict()
+        self.export_path = export_path
+        self.lock = threading.Lock()
+        self.dropped = 0
+        self.pending = queue.Queue(maxsize=TRACE_EXPORT_QUEUE_SIZE) if export_path else None
+        self.writer = threading.Thread(target=self.write_loop, name="trace-export", daemon=True) if export_path else None
+        if self.writer:
+            self.writer.start()
+
+    def write_loop(self):
+        with open(self.export_path, "a", encoding="utf-8") as f:
+            while True:
+                record = self.pending.get()
+                if record is not None:
+                    f.write(json.dumps(record, default=str) + "\n")
+                if record is None or self.pending.empty():
+                    f.flush()
+                self.pending.task_done()
+                if record is None:
+                    return
+
+    def on_trace_start(self, trace):
+        with self.lock:
+            self.open[trace.trace_id] = []
+            while len(self.open) > TRACE_MAX_OPEN:
+                self.open.popitem(last=False)
+
+    def on_span_start(self, span):
+        pass
+
+    def on_span_end(self, span):
+        exported = span.export()
+        if not exported:
+            return
+        exported["duration_ms"] = span_duration_ms(exported)
+        data = exported["span_data"]
+        if data.get("type") == "generation" and not TRACE_INCLUDE_CONTENT:
+            data.pop("input", None)
+            data.pop("output", None)
+        with self.lock:
+            spans = self.open.get(span.trace_id)
+            if spans is not None:
+                spans.append(exported)
+
+    def on_trace_end(self, trace):
+        with self.lock:
+            spans = self.open.pop(trace.trace_id, [])
+        record = {**(trace.export() or {}), "spans": sorted(spans, key=lambda span: span["started_at"] or "")}
+        roots = [span for span in spans if span["parent_id"] is None]
+        record["duration_ms"] = sum(span["duration_ms"] or 0 for span in roots)
+        usage = [span["span_data"].get("usage") or {} for span in spans]
+        record["input_tokens"] = sum(item.get("input_tokens") or 0 for item in usage)
+        record["output_tokens"] = sum(item.get("output_tokens") or 0 for item in usage)
+        with self.lock:
+            self.finished.append(record)
+        if self.pending is not None:
+            try:
+                self.pending.put_nowait(record)
+            except queue.Full:
+                self.dropped += 1
+
+    def recent(self, limit: int) -> list[dict]:
+        with self.lock:
+            return list(self.finished)[-limit:][::-1]
+
+    def get(self, trace_id: str) -> dict | None:
+        with self.lock:
+            return next((record for record in self.finished if record.get("id") == trace_id), None)
+
+    def shutdown(self):
+        if self.writer and self.writer.is_alive():
+            self.pending.put(None)
+            self.writer.join(timeout=5)
+
+    def force_flush(self):
+        if self.writer and self.writer.is_alive():
+            self.pending.join()
+
+trace_exporter = LocalTraceExporter(TRACE_BUFFER_SIZE, TRACE_EXPORT_PATH)
+# Keep traces local instead of uploading them to OpenAI
+set_trace_processors([trace_exporter])
+
+# ================================================================== Storage
+
+STORAGE_BACKEND = os.getenv("STORAGE_BACKEND", "memory")  # "memory" (one worker), or "sqlite" to share inventory between workers
+STORAGE_SQLITE_PATH = os.getenv("STORAGE_SQLITE_PATH", "airline.db")
+
+FLIGHT_FIELDS = ("flight_number", "departure", "arrival", "departure_time", "arrival_time", "price", "status")
+
+class InMemoryStorage:
+    """flights_db and bookings_db of this process. No method awaits anything, so each one runs
+    to completion on the event loop and needs no lock; but every worker process gets its own
+    copy of the inventory, so only run a single worker with this backend."""
+
+    def __init__(self, flights: FlightStore, bookings: BookingStore):
+        self.flights_db = flights
+        self.bookings_db = bookings
+        self.stats = {"bookings": 0, "sold_out": 0, "cancellations": 0}
+
+    async def search_flights(self, departure: str = None, arrival: str = None) -> list[dict]:
+        return self.flights_db.search(departure, arrival)
+
+    async def all_flights(self) -> list[dict]:
+        return list(self.flights_db.values())
+
+    async def get_flight(self, flight_number: str) -> dict | None:
+        return self.flights_db.get(flight_number)
+
+    async def get_flights(self, flight_numbers) -> dict[str, dict]:
+        """The known flights among flight_numbers, by number."""
+        return {number: self.flights_db[number] for number in flight_numbers if number in self.flights_db}
+
+    async def add_flight(self, flight: dict) -> bool:
+        """False if the flight number is taken."""
+        if flight["flight_number"] in self.flights_db:
+            return False
+        self.flights_db[flight["flight_number"]] = flight
+        return True
+
+    async def update_flight(self, flight_number: str, field: str, value):
+        if field == "available_seats":
+            # Booked seats stay with their bookings; the new list replaces the free ones
+            booked = [booking["seat"] for booking in self.bookings_db.for_flight(flight_number) if booking["status"] == "confirmed"]
+            value = SeatMap([*value, *booked])
+            for seat in booked:
+                value.claim(seat)
+        self.flights_db.set_field(flight_number, field, value)
+
+    async def book(self, flight_number: str, passenger_name: str, preferred_seat: str = None) -> tuple[dict | None, dict | None]:
+        """The flight (None if unknown) and the new booking (None if the flight is full).
+        Takes the preferred seat if it is free, else the front-most free seat."""
+        flight = self.flights_db.get(flight_number)
+        if flight is None:
+            return None, None
+        if preferred_seat and flight["available_seats"].claim(preferred_seat):
+            seat = preferred_seat.strip().upper()
+        else:
+            seat = flight["available_seats"].claim_first()
+        if seat is None:
+            self.stats["sold_out"] += 1
+            return flight, None
+        booking_id = booking_ids.next_id()
+        self.bookings_db[booking_id] = {
+            "booking_id": booking_id,
+            "flight_number": flight_number,
+            "passenger_name": passenger_name,
+            "seat": seat,
+            "status": "confirmed",
+            "booking_time": datetime.now().isoformat(),
+            "price": flight["price"]
+        }
+        self.stats["bookings"] += 1
+        return flight, self.bookings_db[booking_id]
+
+    async def get_booking(self, booking_id: str) -> dict | None:
+        return self.bookings_db.get(booking_id)
+
+    async def cancel(self, booking_id: str) -> tuple[str, dict | None]:
+        """("cancelled" | "already_cancelled" | "not_found", booking); the seat goes back on sale once."""
+        booking = self.bookings_db.get(booking_id)
+        if booking is None:
+            return "not_found", None
+        if booking["status"] == "cancelled":
+            return "already_cancelled", booking
+        if booking["flight_number"] in self.flights_db:
+            self.flights_db[booking["flight_number"]]["available_seats"].release(booking["seat"])
+        self.bookings_db.set_status(booking_id, "cancelled")
+        booking["cancellation_time"] = datetime.now().isoformat()
+        self.stats["cancellations"] += 1
+        return "cancelled", booking
+
+    async def bookings(self, flight_number: str = None) -> list[dict]:
+        return self.bookings_db.for_flight(flight_number) if flight_number else list(self.bookings_db.values())
+
+    async def booking_counts(self) -> tuple[dict[str, int], int]:
+        """Confirmed bookings per flight, and the number of bookings in any status."""
+        confirmed = {number: self.bookings_db.count(number, "confirmed") for number in self.bookings_db.by_flight}
+        return confirmed, len(self.bookings_db)
+
+class SQLiteStorage:
+    """Flights, seats and bookings in one SQLite file in WAL mode, shared by every worker on
+    the host. A seat is a row, claimed or released by a conditional UPDATE in a short
+    BEGIN IMMEDIATE transaction. SQLite lets one such transaction in at a time across the
+    whole file, so writes from every thread and worker queue there (connect timeout) and no
+    lock of our own is taken; reads run alongside them, as WAL allows. Each worker keeps a
+    FlightStore of the schedule for route searches and reloads it when another worker adds
+    or changes a flight. Queries run in a worker thread, on that thread's own connection."""
+
+    def __init__(self, path: str, seed: dict):
+        self.path = path
+        self.connections = threading.local()
+        self.schedule_lock = threading.Lock()
+        self.counts_lock = threading.Lock()
+        self.schedule = FlightStore()
+        self.schedule_version = None
+        self.counts = {"bookings": 0, "sold_out": 0, "cancellations": 0, "schedule_reloads": 0}
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        with self.transaction():
+            self.conn.execute("CREATE TABLE IF NOT EXISTS flights (flight_number TEXT PRIMARY KEY, seq INTEGER NOT NULL, departure TEXT NOT NULL, "
+                              "arrival TEXT NOT NULL, departure_time TEXT NOT NULL, arrival_time TEXT NOT NULL, price REAL NOT NULL, status TEXT NOT NULL)")
+            self.conn.execute("CREATE TABLE IF NOT EXISTS flight_seats (flight_number TEXT NOT NULL, seat TEXT NOT NULL, position INTEGER NOT NULL, "
+                              "booking_id TEXT, PRIMARY KEY (flight_number, seat))")
+            self.conn.execute("CREATE INDEX IF NOT EXISTS ix_flight_seats_free ON flight_seats (flight_number, position) WHERE booking_id IS NULL")
+            self.conn.execute("CREATE TABLE IF NOT EXISTS bookings (booking_id TEXT PRIMARY KEY, flight_number TEXT NOT NULL, passenger_name TEXT NOT NULL, "
+                              "seat TEXT NOT NULL, status TEXT NOT NULL, booking_time TEXT NOT NULL, cancellation_time TEXT, price REAL)")
+            self.conn.execute("CREATE INDEX IF NOT EXISTS ix_bookings_flight_number ON bookings (flight_number, status)")
+            self.conn.execute("CREATE TABLE IF NOT EXISTS storage_meta (key TEXT PRIMARY KEY, value INTEGER NOT NULL)")
+            for flight in seed.values():  # the first worker to start loads the sample flights
+                self._insert_flight(flight)
+
+    @property
+    def stats(self) -> dict:
+        return dict(self.counts)
+
+    @property
+    def conn(self) -> sqlite3.Connection:
+        """This thread's connection, opened on first use."""
+        conn = getattr(self.connections, "conn", None)
+        if conn is None:
+            conn = self.connections.conn = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+            conn.execute("PRAGMA synchronous=NORMAL")  # WAL stays consistent; a power cut may lose the last commits
+        return conn
+
+    def count(self, key: str):
+        with self.counts_lock:
+            self.counts[key] += 1
+
+    @contextlib.contextmanager
+    def transaction(self):
+        self.conn.execute("BEGIN IMMEDIATE")
+        try:
+            yield
+        except BaseException:
+            self.conn.execute("ROLLBACK")
+            raise
+        self.conn.execute("COMMIT")
+
+    def _insert_flight(self, flight: dict) -> bool:
+        inserted = self.conn.execute(
+            "INSERT INTO flights (flight_number, seq, departure, arrival, departure_time, arrival_time, price, status) "
+            "VALUES (?, (SELECT COALESCE(MAX(seq), 0) + 1 FROM flights), ?, ?, ?, ?, ?, ?) ON CONFLICT (flight_number) DO NOTHING",
+            (flight["flight_number"], flight["departure"], flight["arrival"], flight["departure_time"],
+             flight["arrival_time"], flight["price"], flight["status"])
+        ).rowcount
+        if inserted:
+            self._add_seats(flight["flight_number"], flight["available_seats"])
+            self._schedule_changed()
+        return bool(inserted)
+
+    def _add_seats(self, flight_number: str, seat_map: SeatMap):
+        self.conn.executemany(
+            "INSERT INTO flight_seats (flight_number, seat, position) VALUES (?, ?, ?) ON CONFLICT (flight_number, seat) DO NOTHING",
+            [(flight_number, seat, seat_map.position(seat)) for seat in seat_map]
+        )
+
+    def _schedule_changed(self):
+        self.conn.execute("INSERT INTO storage_meta (key, value) VALUES ('schedule_version', 1) "
+                          "ON CONFLICT (key) DO UPDATE SET value = value + 1")
+
+    def _schedule(self) -> FlightStore:
+        """This worker's copy of the flights table (without seats), reloaded when its version moves."""
+        conn = self.conn
+        row = conn.execute("SELECT value FROM storage_meta WHERE key = 'schedule_version'").fetchone()
+        version = row[0] if row else 0
+        if version == self.schedule_version:
+            return self.schedule
+        with self.schedule_lock:  # one thread reloads; the others find it done
+            if version != self.schedule_version:
+                rows = conn.execute(f"SELECT {', '.join(FLIGHT_FIELDS)} FROM flights ORDER BY seq")
+                self.schedule = FlightStore({row[0]: dict(zip(FLIGHT_FIELDS, row)) for row in rows})
+                self.schedule_version = version
+                self.count("schedule_reloads")
+            return self.schedule
 
-bookings_db = {}
-sessions_db = {}
+    def _with_seats(self, flights: list[dict]) -> list[dict]:
+        """Copies of schedule entries with their free seats as a SeatMap, as the memory backend has them."""
+        if not flights:
+            return []
+        free = {flight["flight_number"]: [] for flight in flights}
+        numbers = list(free)
+        for start in range(0, len(numbers), 500):  # bounded IN lists, each answered from the free-seat index
+            batch = numbers[start:start + 500]
+            rows = self.conn.execute(f"SELECT flight_number, seat FROM flight_seats WHERE booking_id IS NULL AND flight_number IN "
+                                     f"({', '.join('?' * len(batch))}) ORDER BY position", batch)
+            for flight_number, seat in rows:
+                free[flight_number].append(seat)
+        return [{**flight, "available_seats": SeatMap(free[flight["flight_number"]])} for flight in flights]
+
+    @staticmethod
+    def _booking(row: tuple) -> dict:
+        booking_id, flight_number, passenger_name, seat, status, booking_time, cancellation_time, price = row
+        booking = {"booking_id": booking_id, "flight_number": flight_number, "passenger_name": passenger_name, "seat": seat,
+                   "status": status, "booking_time": booking_time, "price": price}
+        if cancellation_time:
+            booking["cancellation_time"] = cancellation_time
+        return booking
+
+    def _search_flights(self, departure: str, arrival: str) -> list[dict]:
+        return self._with_seats(self._schedule().search(departure, arrival))
+
+    def _all_flights(self) -> list[dict]:
+        return self._with_seats(list(self._schedule().values()))
+
+    def _get_flight(self, flight_number: str) -> dict | None:
+        flight = self._schedule().get(flight_number)
+        return self._with_seats([flight])[0] if flight else None
+
+    def _get_flights(self, flight_numbers) -> dict[str, dict]:
+        schedule = self._schedule()
+        flights = self._with_seats([schedule[number] for number in dict.fromkeys(flight_numbers) if number in schedule])
+        return {flight["flight_number"]: flight for flight in flights}
+
+    def _add_flight(self, flight: dict) -> bool:
+        with self.transaction():
+            return self._insert_flight(flight)
+
+    def _update_flight(self, flight_number: str, field: str, value):
+        with self.transaction():
+            if field == "available_seats":
+                # Booked seats stay with their bookings; the new list replaces the free ones
+                self.conn.execute("DELETE FROM flight_seats WHERE flight_number = ? AND booking_id IS NULL", (flight_number,))
+                self._add_seats(flight_number, value)
+            elif field in FLIGHT_FIELDS[1:]:
+                self.conn.execute(f"UPDATE flights SET {field} = ? WHERE flight_number = ?", (value, flight_number))
+                self._schedule_changed()
+
+    def _book(self, flight_number: str, passenger_name: str, preferred_seat: str) -> tuple[dict | None, dict | None]:
+        flight = self._schedule().get(flight_number)
+        if flight is None:
+            return None, None
+        booking_id = booking_ids.next_id()
+        with self.transaction():
+            row = None
+            if preferred_seat:
+                row = self.conn.execute(
+                    "UPDATE flight_seats SET booking_id = ? WHERE flight_number = ? AND seat = ? AND booking_id IS NULL RETURNING seat",
+                    (booking_id, flight_number, preferred_seat.strip().upper())
+                ).fetchone()
+            if row is None:
+                row = self.conn.execute(
+                    "UPDATE flight_seats SET booking_id = ? WHERE rowid = (SELECT rowid FROM flight_seats "
+                    "WHERE flight_number = ? AND booking_id IS NULL ORDER BY position LIMIT 1) AND booking_id IS NULL RETURNING seat",
+                    (booking_id, flight_number)
+                ).fetchone()
+            if row is None:
+                self.count("sold_out")
+                return flight, None
+            booking = {
+                "booking_id": booking_id,
+                "flight_number": flight_number,
+                "passenger_name": passenger_name,
+                "seat": row[0],
+                "status": "confirmed",
+                "booking_time": datetime.now().isoformat(),
+                "price": flight["price"]
+            }
+            self.conn.execute(
+                "INSERT INTO bookings (booking_id, flight_number, passenger_name, seat, status, booking_time, price) VALUES (?, ?, ?, ?, ?, ?, ?)",
+                (booking_id, flight_number, passenger_name, booking["seat"], booking["status"], booking["booking_time"], booking["price"])
+            )
+        self.count("bookings")
+        return flight, booking
+
+    def _get_booking(self, booking_id: str) -> dict | None:
+        row = self.conn.execute("SELECT * FROM bookings WHERE booking_id = ?", (booking_id,)).fetchone()
+        return self._booking(row) if row else None
+
+    def _cancel(self, booking_id: str) -> tuple[str, dict | None]:
+        with self.transaction():
+            row = self.conn.execute(
+                "UPDATE bookings SET status = 'cancelled', cancellation_time = ? WHERE booking_id = ? AND status != 'cancelled' RETURNING *",
+                (datetime.now().isoformat(), booking_id)
+            ).fetchone()
+            if row is not None:
+                booking = self._booking(row)
+                self.conn.execute("UPDATE flight_seats SET booking_id = NULL WHERE flight_number = ? AND seat = ? AND booking_id = ?",
+                                  (booking["flight_number"], booking["seat"], booking_id))
+        if row is None:
+            row = self.conn.execute("SELECT * FROM bookings WHERE booking_id = ?", (booking_id,)).fetchone()
+            return ("already_cancelled", self._booking(row)) if row else ("not_found", None)
+        self.count("cancellations")
+        return "cancelled", booking
+
+    def _bookings(self, flight_number: str = None) -> list[dict]:
+        if flight_number:
+            rows = self.conn.execute("SELECT * FROM bookings WHERE flight_number = ? ORDER BY rowid", (flight_number,)).fetchall()
+        else:
+            rows = self.conn.execute("SELECT * FROM bookings ORDER BY rowid").fetchall()
+        return [self._booking(row) for row in rows]
+
+    def _booking_counts(self) -> tuple[dict[str, int], int]:
+        conn = self.conn
+        confirmed = dict(conn.execute("SELECT flight_number, COUNT(*) FROM bookings WHERE status = 'confirmed' GROUP BY flight_number"))
+        total = conn.execute("SELECT COUNT(*) FROM bookings").fetchone()[0]
+        return confirmed, total
+
+    async def search_flights(self, departure: str = None, arrival: str = None) -> list[dict]:
+        return await asyncio.to_thread(self._search_flights, departure, arrival)
+
+    async def all_flights(self) -> list[dict]:
+        return await asyncio.to_thread(self._all_flights)
+
+    async def get_flight(self, flight_number: str) -> dict | None:
+        return await asyncio.to_thread(self._get_flight, flight_number)
+
+    async def get_flights(self, flight_numbers) -> dict[str, dict]:
+        return await asyncio.to_thread(self._get_flights, list(flight_numbers))
+
+    async def add_flight(self, flight: dict) -> bool:
+        return await asyncio.to_thread(self._add_flight, flight)
+
+    async def update_flight(self, flight_number: str, field: str, value):
+        await asyncio.to_thread(self._update_flight, flight_number, field, value)
+
+    async def book(self, flight_number: str, passenger_name: str, preferred_seat: str = None) -> tuple[dict | None, dict | None]:
+        return await asyncio.to_thread(self._book, flight_number, passenger_name, preferred_seat)
+
+    async def get_booking(self, booking_id: str) -> dict | None:
+        return await asyncio.to_thread(self._get_booking, booking_id)
+
+    async def cancel(self, booking_id: str) -> tuple[str, dict | None]:
+        return await asyncio.to_thread(self._cancel, booking_id)
+
+    async def bookings(self, flight_number: str = None) -> list[dict]:
+        return await asyncio.to_thread(self._bookings, flight_number)
+
+    async def booking_counts(self) -> tuple[dict[str, int], int]:
+        return await asyncio.to_thread(self._booking_counts)
+
+storage = (SQLiteStorage(STORAGE_SQLITE_PATH, flights_db) if STORAGE_BACKEND == "sqlite"
+           else InMemoryStorage(flights_db, bookings_db))
+
+# ================================================================== Sessions
+
+SESSION_BACKEND = os.getenv("SESSION_BACKEND", "sqlite" if STORAGE_BACKEND == "sqlite" else "memory")  # "sqlite" keeps sessions across restarts and workers
+SESSION_SQLITE_PATH = os.getenv("SESSION_SQLITE_PATH", "sessions.db")
+SESSION_TTL_SECONDS = int(os.getenv("SESSION_TTL_SECONDS", "1800"))
+SESSION_MAX_ENTRIES = int(os.getenv("SESSION_MAX_ENTRIES", "10000"))
+SESSION_MAX_BYTES = int(os.getenv("SESSION_MAX_BYTES", str(64 * 1024 * 1024)))
+SESSION_SWEEP_SECONDS = float(os.getenv("SESSION_SWEEP_SECONDS", "60"))
+SESSION_HISTORY_TOKENS = int(os.getenv("SESSION_HISTORY_TOKENS", "1500"))
+SESSION_SUMMARY_MAX_CHARS = int(os.getenv("SESSION_SUMMARY_MAX_CHARS", "1200"))
+
+class InMemorySessionBackend:
+    """Per-process sessions capped at max_entries and max_bytes, evicting the least recently
+    used first, and expiring ttl seconds after their last use. Expired sessions are never
+    returned; the background sweeper frees them even if nobody asks for them again."""
+    ENTRY_OVERHEAD = 200  # approximate bytes per entry beyond its JSON: key, tuple and dict slot
+
+    def __init__(self, max_entries: int, max_bytes: int):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.entries: OrderedDict[str, tuple[float, int, str]] = OrderedDict()  # expires_at, ttl, data
+        self.bytes = 0
+        self.stats = {"hits": 0, "misses": 0, "expired": 0, "evicted_entries": 0, "evicted_bytes": 0, "rejected_oversized": 0}
+
+    def entry_size(self, session_id: str, data: str) -> int:
+        return len(session_id) + len(data) + self.ENTRY_OVERHEAD  # json.dumps output is ASCII
+
+    def remove(self, session_id: str):
+        _, _, data = self.entries.pop(session_id)
+        self.bytes -= self.entry_size(session_id, data)
+
+    async def get(self, session_id: str) -> dict | None:
+        entry = self.entries.get(session_id)
+        if entry is None:
+            self.stats["misses"] += 1
+            return None
+        expires_at, ttl, data = entry
+        now = time.monotonic()
+        if expires_at < now:
+            self.remove(session_id)
+            self.stats["expired"] += 1
+            self.stats["misses"] += 1
+            return None
+        # A read is a use: slide the expiry along with the LRU position so sweep() can rely on the order
+        self.entries[session_id] = (now + ttl, ttl, data)
+        self.entries.move_to_end(session_id)
+        self.stats["hits"] += 1
+        return json.loads(data)
+
+    async def set(self, session_id: str, session: dict, ttl: int):
+        data = json.dumps(session)
+        if session_id in self.entries:
+            self.remove(session_id)
+        size = self.entry_size(session_id, data)
+        if size > self.max_bytes:
+            self.stats["rejected_oversized"] += 1
+            return
+        self.entries[session_id] = (time.monotonic() + ttl, ttl, data)
+        self.bytes += size
+        while len(self.entries) > self.max_entries:
+            self.remove(next(iter(self.entries)))
+            self.stats["evicted_entries"] += 1
+        while self.bytes > self.max_bytes:
+            self.remove(next(iter(self.entries)))
+            self.stats["evicted_bytes"] += 1
+
+    async def sweep(self) -> int:
+        """Drop expired sessions from the least recently used end. get() and set() both move an
+        entry to the end and push its expiry out by the same TTL, so LRU order is expiry order
+        and the sweep stops at the first live one."""
+        now, swept = time.monotonic(), 0
+        while self.entries:
+            session_id, (expires_at, _, _) = next(iter(self.entries.items()))
+            if expires_at >= now:
+                break
+            self.remove(session_id)
+            swept += 1
+        self.stats["expired"] += swept
+        return swept
+
+    async def usage(self) -> dict:
+        return {"entries": len(self.entries), "bytes": self.bytes}
+
+class SQLiteSessionBackend:
+    """Sessions in a local SQLite file: they survive restarts and are shared by workers on one host.
+    Same limits as InMemorySessionBackend: a read or write pushes expiry out by the session's TTL,
+    and the sweep enforces max_entries and max_bytes, soonest-expiring first.
+    Queries run in a worker thread so the event loop never waits on disk."""
+
+    def __init__(self, path: str, max_entries: int, max_bytes: int):
+        self.conn = sqlite3.connect(path, timeout=10, check_same_thread=False)
+        self.lock = threading.Lock()
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.stats = {"hits": 0, "misses": 0, "expired": 0, "evicted_entries": 0, "evicted_bytes": 0}
+        with self.lock, self.conn:
+            self.conn.execute("PRAGMA journal_mode=WAL")
+            self.conn.execute("CREATE TABLE IF NOT EXISTS chat_sessions (session_id TEXT PRIMARY KEY, data TEXT NOT NULL, expires_at REAL NOT NULL, ttl REAL)")
+            self.conn.execute("CREATE INDEX IF NOT EXISTS ix_chat_sessions_expires_at ON chat_sessions (expires_at)")
+            if "ttl" not in {column[1] for column in self.conn.execute("PRAGMA table_info(chat_sessions)")}:
+                self.conn.execute("ALTER TABLE chat_sessions ADD COLUMN ttl REAL")  # files from before sliding expiry
+
+    def _get(self, session_id: str) -> dict | None:
+        now = time.time()
+        with self.lock, self.conn:
+            row = self.conn.execute(
+                "UPDATE chat_sessions SET expires_at = COALESCE(? + ttl, expires_at) WHERE session_id = ? AND expires_at > ? RETURNING data",
+                (now, session_id, now)
+            ).fetchone()
+        self.stats["hits" if row else "misses"] += 1
+        return json.loads(row[0]) if row else None
+
+    def _set(self, session_id: str, session: dict, ttl: int):
+        with self.lock, self.conn:
+            self.conn.execute(
+                "INSERT INTO chat_sessions (session_id, data, expires_at, ttl) VALUES (?, ?, ?, ?) "
+                "ON CONFLICT (session_id) DO UPDATE SET data = excluded.data, expires_at = excluded.expires_at, ttl = excluded.ttl",
+                (session_id, json.dumps(session), time.time() + ttl, ttl)
+            )
+
+    def _sweep(self) -> int:
+        """Delete expired rows, then the soonest-expiring rows beyond max_entries, then the
+        soonest-expiring rows until SUM(LENGTH(data)) fits in max_bytes."""
+        with self.lock, self.conn:
+            expired = self.conn.execute("DELETE FROM chat_sessions WHERE expires_at <= ?", (time.time(),)).rowcount
+            evicted = self.conn.execute(
+                "DELETE FROM chat_sessions WHERE session_id IN (SELECT session_id FROM chat_sessions ORDER BY expires_at "
+                "LIMIT max(0, (SELECT COUNT(*) FROM chat_sessions) - ?))", (self.max_entries,)
+            ).rowcount
+            # Running total from the latest-expiring end: rows past the budget are the oldest
+            evicted_bytes = self.conn.execute(
+                "DELETE FROM chat_sessions WHERE session_id IN (SELECT session_id FROM (SELECT session_id, "
+                "SUM(LENGTH(data)) OVER (ORDER BY expires_at DESC, session_id) AS kept FROM chat_sessions) WHERE kept > ?)",
+                (self.max_bytes,)
+            ).rowcount
+        self.stats["expired"] += expired
+        self.stats["evicted_entries"] += evicted
+        self.stats["evicted_bytes"] += evicted_bytes
+        return expired
+
+    def _usage(self) -> dict:
+        with self.lock:
+            entries, size = self.conn.execute("SELECT COUNT(*), COALESCE(SUM(LENGTH(data)), 0) FROM chat_sessions").fetchone()
+        return {"entries": entries, "bytes": size}
+
+    async def get(self, session_id: str) -> dict | None:
+        return await asyncio.to_thread(self._get, session_id)
+
+    async def set(self, session_id: str, session: dict, ttl: int):
+        await asyncio.to_thread(self._set, session_id, session, ttl)
+
+    async def sweep(self) -> int:
+        return await asyncio.to_thread(self._sweep)
+
+    async def usage(self) -> dict:
+        return await asyncio.to_thread(self._usage)
+
+session_store = (SQLiteSessionBackend(SESSION_SQLITE_PATH, SESSION_MAX_ENTRIES, SESSION_MAX_BYTES) if SESSION_BACKEND == "sqlite"
+                 else InMemorySessionBackend(SESSION_MAX_ENTRIES, SESSION_MAX_BYTES))
+
+async def sweep_sessions_forever():
+    while True:
+        await asyncio.sleep(SESSION_SWEEP_SECONDS)
+        try:
+            await session_store.sweep()
+        except Exception as e:
+            print(f"⚠️ Session sweep failed: {str(e)}")
+
+@app.on_event("startup")
+async def start_session_sweeper():
+    asyncio.create_task(sweep_sessions_forever())
+
+def estimate_tokens(text: str) -> int:
+    return len(text) // 4 + 4  # ~4 characters per token, plus per-message overhead
+
+async def load_session(chat_message: ChatMessage) -> tuple[str, dict]:
+    """The caller's session, or a new one if it is unknown, expired or belongs to another user type."""
+    if chat_message.session_id:
+        session = await session_store.get(chat_message.session_id)
+        if session is not None and session["context"]["user_type"] == chat_message.user_type:
+            return chat_message.session_id, session
+    context = AirlineAgentContext(user_type=chat_message.user_type)
+    return str(uuid.uuid4()), {"context": context.model_dump(), "summary": "", "turns": []}
+
+def session_agent_input(session: dict, message: str) -> str | list[dict]:
+    """The new message preceded by the remembered conversation: a summary of older turns and
+    known booking details, then the recent turns that fit in SESSION_HISTORY_TOKENS."""
+    if not session["turns"] and not session["summary"]:
+        return message
+    context = session["context"]
+    details = ", ".join(f"{field.replace('_', ' ')} {context[field]}" for field in
+                        ("passenger_name", "confirmation_number", "flight_number", "seat_number") if context.get(field))
+    notes = [note for note in (
+        f"Earlier in this conversation:\n{session['summary']}" if session["summary"] else "",
+        f"Known details: {details}." if details else "",
+    ) if note]
+    items = [{"role": "system", "content": "\n".join(notes)}] if notes else []
+    return items + session["turns"] + [{"role": "user", "content": message}]
+
+async def save_turn(session_id: str, session: dict, message: str, reply: str, context: AirlineAgentContext):
+    """Append the exchange, fold turns that no longer fit the token budget into the summary, and store."""
+    session["context"] = context.model_dump()
+    session["turns"] += [
+        {"role": "user", "content": message},
+        {"role": "assistant", "content": reply[:SESSION_HISTORY_TOKENS * 4]},
+    ]
+    while len(session["turns"]) > 2 and sum(estimate_tokens(turn["content"]) for turn in session["turns"]) > SESSION_HISTORY_TOKENS:
+        asked, answered = session["turns"][:2]
+        del session["turns"][:2]
+        line = f"- User: {textwrap.shorten(asked['content'], 120)} | Assistant: {textwrap.shorten(answered['content'], 160)}"
+        lines = (session["summary"].splitlines() if session["summary"] else []) + [line]
+        while len(lines) > 1 and sum(len(item) + 1 for item in lines) > SESSION_SUMMARY_MAX_CHARS:
+            lines.pop(0)
+        session["summary"] = "\n".join(lines)
+    await session_store.set(session_id, session, SESSION_TTL_SECONDS)
 
 # ================================================================== FAQ Agent Tools
 
+# Canned answers for basic_info_tool and the /chat FAQ fast path: topic -> (keywords, answer)
+FAQ_TOPICS = {
+    "baggage": (["bag", "baggage", "luggage"], "📦 Baggage Policy: One free carry-on bag under 22x14x9 inches and 50 lbs. Checked baggage starts at $25 for first bag. No liquids over 3.4oz in carry-on."),
+    "wifi": (["wifi", "internet", "connection"], "📶 Free Wi-Fi available on all ReadyFlight aircraft! Connect to 'ReadyFlight-WiFi' network. Streaming and video calls supported at cruising altitude."),
+    "meals": (["meal", "food", "drink", "beverage"], "🍽️ Complimentary snacks and beverages on all flights. Premium meal service available for purchase on flights over 3 hours. Vegetarian, vegan, and special dietary options available with advance notice."),
+    "airport": (["airport", "terminal", "location"], "🏢 ReadyFlight Hub: Skyport International Airport, Terminal 4. We also operate from major airports nationwide. Check-in counters open 3 hours before departure."),
+    "check_in": (["check", "checkin", "boarding"], "✅ Online check-in opens 24 hours before departure. Mobile boarding passes available. Arrive 2 hours early for domestic, 3 hours for international flights."),
+    "cancellation": (["cancel", "refund", "change"], "🔄 Free cancellation up to 24 hours before departure. Flight changes allowed with fare difference. Refunds processed within 5-7 business days."),
+}
+FAQ_FALLBACK = "I don't have specific information about that topic. For more detailed assistance, I can connect you with our customer service team or you can visit our website."
+
 @function_tool()
 async def basic_info_tool(question: str) -> str:
     """Provides airport & airline info, baggage policies, WiFi, and general information.
@@ -112,25 +1282,11 @@ async def basic_info_tool(question: str) -> str:
     """
     q = question.lower()
     
-    if any(word in q for word in ["bag", "baggage", "luggage"]):
-        return "📦 Baggage Policy: One free carry-on bag under 22x14x9 inches and 50 lbs. Checked baggage starts at $25 for first bag. No liquids over 3.4oz in carry-on."
-    
-    if any(word in q for word in ["wifi", "internet", "connection"]):
-        return "📶 Free Wi-Fi available on all ReadyFlight aircraft! Connect to 'ReadyFlight-WiFi' network. Streaming and video calls supported at cruising altitude."
-    
-    if any(word in q for word in ["meal", "food", "drink", "beverage"]):
-        return "🍽️ Complimentary snacks and beverages on all flights. Premium meal service available for purchase on flights over 3 hours. Vegetarian, vegan, and special dietary options available with advance notice."
-    
-    if any(word in q for word in ["airport", "terminal", "location"]):
-        return "🏢 ReadyFlight Hub: Skyport International Airport, Terminal 4. We also operate from major airports nationwide. Check-in counters open 3 hours before departure."
-    
-    if any(word in q for word in ["check", "checkin", "boarding"]):
-        return "✅ Online check-in opens 24 hours before departure. Mobile boarding passes available. Arrive 2 hours early for domestic, 3 hours for international flights."
-    
-    if any(word in q for word in ["cancel", "refund", "change"]):
-        return "🔄 Free cancellation up to 24 hours before departure. Flight changes allowed with fare difference. Refunds processed within 5-7 business days."
+    for keywords, answer in FAQ_TOPICS.values():
+        if any(word in q for word in keywords):
+            return answer
     
-    return "I don't have specific information about that topic. For more detailed assistance, I can connect you with our customer service team or you can visit our website."
+    return FAQ_FALLBACK
 
 @function_tool()
 async def flight_schedule_tool(departure: str = None, arrival: str = None) -> str:
@@ -143,14 +1299,7 @@ async def flight_schedule_tool(departure: str = None, arrival: str = None) -> st
     Returns:
         str: Flight schedule information
     """
-    results = []
-    
-    for flight in flights_db.values():
-        if departure and departure.lower() not in flight["departure"].lower():
-            continue
-        if arrival and arrival.lower() not in flight["arrival"].lower():
-            continue
-        results.append(flight)
+    results = await storage.search_flights(departure, arrival)
     
     if not results:
         return "No flights found matching your criteria. Please check our website for the most up-to-date schedule."
@@ -201,14 +1350,7 @@ async def search_flights_tool(context: RunContextWrapper[AirlineAgentContext], d
     Returns:
         str: List of available flights
     """
-    results = []
-    
-    for flight in flights_db.values():
-        if departure and departure.lower() not in flight["departure"].lower():
-            continue
-        if arrival and arrival.lower() not in flight["arrival"].lower():
-            continue
-        results.append(flight)
+    results = await storage.search_flights(departure, arrival)
     
     if not results:
         return "😔 No flights found matching your search. Try different cities or check our website for more options."
@@ -238,37 +1380,17 @@ async def book_flight_tool(context: RunContextWrapper[AirlineAgentContext], flig
     Returns:
         str: Booking confirmation or error message
     """
-    if flight_number not in flights_db:
+    # Claims the preferred seat if it is free, else the front-most free seat, and saves the booking
+    flight, booking = await storage.book(flight_number, passenger_name, preferred_seat)
+    if flight is None:
         return f"❌ Sorry, flight {flight_number} was not found. Please check the flight number and try again."
-    
-    flight = flights_db[flight_number]
-    available_seats = flight["available_seats"]
-    
-    if not available_seats:
+    if booking is None:
         return f"😔 Sorry, flight {flight_number} is fully booked. Would you like me to check other flights?"
     
-    # Select seat
-    if preferred_seat and preferred_seat in available_seats:
-        selected_seat = preferred_seat
-    else:
-        selected_seat = available_seats[0]  # Assign first available seat
-    
-    # Generate booking
-    booking_id = f"RF{random.randint(10000, 99999)}"
-    booking = {
-        "booking_id": booking_id,
-        "flight_number": flight_number,
-        "passenger_name": passenger_name,
-        "seat": selected_seat,
-        "status": "confirmed",
-        "booking_time": datetime.now().isoformat(),
-        "price": flight["price"]
-    }
-    
-    # Save booking and update context
-    bookings_db[booking_id] = booking
-    flight["available_seats"].remove(selected_seat)
+    booking_id = booking["booking_id"]
+    selected_seat = booking["seat"]
     
+    # Update context
     context.context.passenger_name = passenger_name
     context.context.confirmation_number = booking_id
     context.context.seat_number = selected_seat
@@ -297,11 +1419,11 @@ async def check_booking_tool(context: RunContextWrapper[AirlineAgentContext], bo
     Returns:
         str: Booking details
     """
-    if booking_id not in bookings_db:
+    booking = await storage.get_booking(booking_id)
+    if booking is None:
         return f"❌ Booking {booking_id} not found. Please check your confirmation number and try again."
     
-    booking = bookings_db[booking_id]
-    flight = flights_db[booking["flight_number"]]
+    flight = await storage.get_flight(booking["flight_number"])
     
     context.context.confirmation_number = booking_id
     context.context.passenger_name = booking["passenger_name"]
@@ -332,20 +1454,21 @@ async def cancel_booking_tool(context: RunContextWrapper[AirlineAgentContext], b
     Returns:
         str: Cancellation confirmation
     """
-    if booking_id not in bookings_db:
+    # Marks the booking cancelled and returns its seat to the available pool, once
+    outcome, booking = await storage.cancel(booking_id)
+    if outcome == "not_found":
         return f"❌ Booking {booking_id} not found. Please check your confirmation number."
     
-    booking = bookings_db[booking_id]
     flight_number = booking["flight_number"]
     seat = booking["seat"]
     
-    # Return seat to available pool
-    if flight_number in flights_db:
-        flights_db[flight_number]["available_seats"].append(seat)
-    
-    # Update booking status
-    booking["status"] = "cancelled"
-    booking["cancellation_time"] = datetime.now().isoformat()
+    if outcome == "already_cancelled":
+        return f"""ℹ️ **Booking Already Cancelled**
+
+❌ Booking {booking_id} on flight {flight_number} was cancelled earlier
+💰 Any refund is already on its way (5-7 business days)
+
+Is there anything else I can help you with? 😊"""
     
     return f"""✅ **Booking Cancelled Successfully**
 
@@ -402,11 +1525,8 @@ async def add_flight_tool(context: RunContextWrapper[AirlineAgentContext], fligh
     Returns:
         str: Success or error message
     """
-    if flight_number in flights_db:
-        return f"❌ Flight {flight_number} already exists in the system."
-    
     # Parse seats
-    seats_list = [seat.strip() for seat in available_seats.split(',')]
+    seat_map = SeatMap(available_seats.split(','))
     
     flight_data = {
         "flight_number": flight_number,
@@ -414,12 +1534,13 @@ async def add_flight_tool(context: RunContextWrapper[AirlineAgentContext], fligh
         "arrival": arrival,
         "departure_time": departure_time,
         "arrival_time": arrival_time,
-        "available_seats": seats_list,
+        "available_seats": seat_map,
         "price": price,
         "status": "scheduled"
     }
     
-    flights_db[flight_number] = flight_data
+    if not await storage.add_flight(flight_data):
+        return f"❌ Flight {flight_number} already exists in the system."
     
     return f"""✅ **Flight Added Successfully!**
 
@@ -428,11 +1549,13 @@ async def add_flight_tool(context: RunContextWrapper[AirlineAgentContext], fligh
 ⏰ Departure: {departure_time}
 ⏰ Arrival: {arrival_time}
 💰 Price: ${price}
-💺 Seats: {len(seats_list)} available
+💺 Seats: {len(seat_map)} available
 📊 Status: Scheduled
 
 Flight is now live in the system! 🎉"""
 
+EDITABLE_FLIGHT_FIELDS = ("departure", "arrival", "departure_time", "arrival_time", "price", "status", "available_seats")
+
 @function_tool  
 async def update_flight_tool(context: RunContextWrapper[AirlineAgentContext], flight_number: str, field: str, new_value: str) -> str:
     """Update flight information (Staff only).
@@ -440,29 +1563,36 @@ async def update_flight_tool(context: RunContextWrapper[AirlineAgentContext], fl
     Args:
         context: The conversation context
         flight_number (str): Flight number to update
-        field (str): Field to update (departure_time, arrival_time, price, status, etc.)
-        new_value (str): New value for the field
+        field (str): Field to update: departure, arrival, departure_time, arrival_time, price, status or available_seats
+        new_value (str): New value for the field (available_seats: comma-separated free seats)
         
     Returns:
         str: Update confirmation
     """
-    if flight_number not in flights_db:
+    if field not in EDITABLE_FLIGHT_FIELDS:
+        return f"❌ Field '{field}' cannot be updated. Available fields: {', '.join(EDITABLE_FLIGHT_FIELDS)}"
+
+    flight = await storage.get_flight(flight_number)
+    if flight is None:
         return f"❌ Flight {flight_number} not found in system."
     
-    flight = flights_db[flight_number]
-    
     # Handle different field types
     if field == "price":
         try:
             new_value = float(new_value)
         except:
             return "❌ Price must be a valid number."
+    elif field == "available_seats":
+        new_value = SeatMap(new_value.split(','))
+        booked = {booking["seat"] for booking in await storage.bookings(flight_number) if booking["status"] == "confirmed"}
+        taken = [seat for seat in new_value if seat in booked]
+        if taken:
+            return f"❌ Seat(s) {', '.join(taken)} already booked on flight {flight_number}. List only seats that are free to sell."
     
-    if field in flight:
-        old_value = flight[field]
-        flight[field] = new_value
-        
-        return f"""✅ **Flight Updated Successfully!**
+    old_value = flight[field]
+    await storage.update_flight(flight_number, field, new_value)
+    
+    return f"""✅ **Flight Updated Successfully!**
 
 ✈️ **Flight {flight_number}**
 🔄 **{field.replace('_', ' ').title()}** updated
@@ -470,26 +1600,28 @@ async def update_flight_tool(context: RunContextWrapper[AirlineAgentContext], fl
 ✨ New value: {new_value}
 
 Update is now live in the system! 🎉"""
-    else:
-        return f"❌ Field '{field}' not found. Available fields: departure, arrival, departure_time, arrival_time, price, status"
 
 @function_tool
-async def view_all_bookings_tool(context: RunContextWrapper[AirlineAgentContext]) -> str:
+async def view_all_bookings_tool(context: RunContextWrapper[AirlineAgentContext], flight_number: str = None) -> str:
     """View all current bookings in the system (Staff only).
     
     Args:
         context: The conversation context
+        flight_number (str, optional): Only show bookings on this flight
         
     Returns:
         str: List of all bookings
     """
-    if not bookings_db:
-        return "📋 No bookings found in the system."
+    bookings = await storage.bookings(flight_number)
+    if not bookings:
+        return "📋 No bookings found in the system." if not flight_number else f"📋 No bookings found for flight {flight_number}."
     
-    response = "📊 **All Current Bookings:**\n\n"
+    response = "📊 **All Current Bookings:**\n\n" if not flight_number else f"📊 **Bookings on Flight {flight_number}:**\n\n"
     
-    for booking_id, booking in bookings_db.items():
-        flight_info = flights_db.get(booking["flight_number"], {})
+    flights = await storage.get_flights({booking["flight_number"] for booking in bookings})
+    for booking in bookings:
+        booking_id = booking["booking_id"]
+        flight_info = flights.get(booking["flight_number"], {})
         response += f"🎫 **{booking_id}**\n"
         response += f"   👤 Passenger: {booking['passenger_name']}\n"
         response += f"   ✈️ Flight: {booking['flight_number']}\n"
@@ -498,7 +1630,7 @@ async def view_all_bookings_tool(context: RunContextWrapper[AirlineAgentContext]
         response += f"   📊 Status: {booking['status'].title()}\n"
         response += f"   💰 Price: ${booking.get('price', 'N/A')}\n\n"
     
-    response += f"**Total Bookings:** {len(bookings_db)}"
+    response += f"**Total Bookings:** {len(bookings)}"
     return response
 
 @function_tool
@@ -511,20 +1643,22 @@ async def flight_status_overview_tool(context: RunContextWrapper[AirlineAgentCon
     Returns:
         str: Flight status overview
     """
-    if not flights_db:
+    flights = await storage.all_flights()
+    if not flights:
         return "✈️ No flights in the system."
     
     response = "✈️ **Flight Status Overview:**\n\n"
     
-    total_flights = len(flights_db)
+    total_flights = len(flights)
     total_seats = 0
     booked_seats = 0
+    # Confirmed bookings of every flight in one call, rather than a count per flight
+    confirmed_counts, total_bookings = await storage.booking_counts()
     
-    for flight_num, flight in flights_db.items():
+    for flight in flights:
+        flight_num = flight["flight_number"]
         available_count = len(flight["available_seats"])
-        # Calculate booked seats for this flight
-        flight_bookings = sum(1 for b in bookings_db.values() 
-                            if b["flight_number"] == flight_num and b["status"] == "confirmed")
+        flight_bookings = confirmed_counts.get(flight_num, 0)
         
         total_seats += available_count + flight_bookings
         booked_seats += flight_bookings
@@ -537,7 +1671,7 @@ async def flight_status_overview_tool(context: RunContextWrapper[AirlineAgentCon
     
     response += f"""📊 **System Summary:**
 ✈️ Total Flights: {total_flights}
-🎫 Total Bookings: {len(bookings_db)}
+🎫 Total Bookings: {total_bookings}
 💺 Seat Utilization: {booked_seats}/{total_seats} ({(booked_seats/total_seats*100) if total_seats > 0 else 0:.1f}%)"""
     
     return response
@@ -612,48 +1746,107 @@ frontline_agent = Agent[AirlineAgentContext](
     ]
 )
 
+for agent, agent_name in ((faq_agent, "faq_agent"), (customer_agent, "customer_agent"),
+                          (staff_agent, "staff_agent"), (frontline_agent, "frontline_agent")):
+    instrument_agent(agent, agent_name)
+
+# ================================================================== FAQ Fast Path
+
+FAQ_FAST_PATH_ENABLED = os.getenv("FAQ_FAST_PATH_ENABLED", "true").lower() == "true"
+FAQ_FAST_PATH_THRESHOLD = float(os.getenv("FAQ_FAST_PATH_THRESHOLD", "0.75"))
+# Words that mean the user wants something looked up or done, which only the agents can do
+FAQ_ACTION_WORDS = {"book", "booking", "reserve", "reservation", "my", "seat", "ticket", "flights", "schedule", "timing"}
+# Verbs that ask for something to be done to a booking; they only count as FAQ questions next to a policy cue
+FAQ_ACTION_VERBS = re.compile(r"\b(?:cancel|refund|change|upgrade)\w*\b|\bcheck[\s-]?in\b")
+FAQ_POLICY_CUES = {"policy", "policies", "rule", "rules", "fee", "fees", "allowed", "allow", "how", "when"}
+# Flight numbers (rf001) and confirmation codes in BookingIdGenerator's format (rf0e4t1m7q2k0g5), lowercased
+FAQ_IDENTIFIER = re.compile(rf"\b(?:[a-z]{{2}}\d{{3,}}|{booking_ids.prefix.lower()}[{BookingIdGenerator.ALPHABET.lower()}]{{13}})\b")
+
+faq_fast_path_stats = {"checked": 0, "hits": 0, "misses": 0, "skipped": 0}
+
+def match_faq(message: str) -> tuple[str, float] | None:
+    """Best canned FAQ answer for a message and the confidence of the match (0-1), or None.
+    Confidence drops when other topics or action words appear in the message. Messages naming
+    a flight or booking, or asking for a cancellation, refund, change, upgrade or check-in
+    rather than about its policy, get no match: only the agents can act on them."""
+    text = (message or "").lower()
+    words = re.findall(r"[a-z0-9]+", text)
+    if FAQ_IDENTIFIER.search(text) or (FAQ_ACTION_VERBS.search(text) and not FAQ_POLICY_CUES.intersection(words)):
+        return None
+    hits = {
+        topic: sum(1 for word in words if any(word in (keyword, keyword + "s", keyword + "es") for keyword in keywords))
+        for topic, (keywords, _) in FAQ_TOPICS.items()
+    }
+    topic = max(hits, key=hits.get)
+    if not hits[topic]:
+        return None
+    noise = (sum(hits.values()) - hits[topic]
+             + sum(1 for word in words if word in FAQ_ACTION_WORDS))
+    return FAQ_TOPICS[topic][1], hits[topic] / (hits[topic] + noise)
+
+def faq_fast_path(chat_message: ChatMessage) -> str | None:
+    """Canned answer when the message confidently matches a basic_info_tool topic, so /chat can skip the LLM."""
+    if not FAQ_FAST_PATH_ENABLED or not chat_message.fast_path or chat_message.user_type == "staff":
+        faq_fast_path_stats["skipped"] += 1
+        return None
+    faq_fast_path_stats["checked"] += 1
+    match = match_faq(chat_message.message)
+    if match and match[1] >= FAQ_FAST_PATH_THRESHOLD:
+        faq_fast_path_stats["hits"] += 1
+        return match[0]
+    faq_fast_path_stats["misses"] += 1
+    return None
+
 # ================================================================== API Endpoints
 
+def pick_initial_agent(chat_message: ChatMessage):
+    """Determine initial agent based on user type and message content"""
+    message_lower = chat_message.message.lower()
+    if chat_message.user_type == "staff":
+        return staff_agent, "Staff Control"
+    if any(word in message_lower for word in ["policy", "baggage", "wifi", "meal", "airport", "schedule", "timing"]):
+        return faq_agent, "FAQ Agent"
+    return customer_agent, "Sky Assistant"
+
 @app.post("/chat", response_model=ChatResponse)
 async def chat_endpoint(chat_message: ChatMessage):
+    # One trace per request; the SDK nests agent, model, handoff and tool spans under it
+    with trace("ReadyFlight chat", metadata={"user_type": chat_message.user_type}):
+        with custom_span("chat", {"user_type": chat_message.user_type, "message_chars": len(chat_message.message)}) as span:
+            response = await answer_chat(chat_message)
+            span.span_data.data["agent_type"] = response.agent_type
+            return response
+
+async def answer_chat(chat_message: ChatMessage) -> ChatResponse:
     try:
-        # Create context based on user type
-        context = AirlineAgentContext(user_type=chat_message.user_type)
-        
-        # Determine initial agent based on user type and message content
-        message_lower = chat_message.message.lower()
-        
-        if chat_message.user_type == "staff":
-            initial_agent = staff_agent
-            agent_name = "Staff Control"
-        elif any(word in message_lower for word in ["policy", "baggage", "wifi", "meal", "airport", "schedule", "timing"]):
-            initial_agent = faq_agent  
-            agent_name = "FAQ Agent"
-        else:
-            initial_agent = customer_agent
-            agent_name = "Sky Assistant"
+        # Continue the caller's conversation (context and recent turns), or start a new one
+        session_id, session = await load_session(chat_message)
+        context = AirlineAgentContext(**session["context"])
+
+        # Answer common FAQ questions directly, without an LLM round-trip
+        faq_answer = faq_fast_path(chat_message)
+        if faq_answer:
+            await save_turn(session_id, session, chat_message.message, faq_answer, context)
+            return ChatResponse(
+                response=faq_answer,
+                agent_type="FAQ Agent",
+                session_id=session_id
+            )
+
+        initial_agent, agent_name = pick_initial_agent(chat_message)
         
         # Run the agent with the message
-        result = await Runner.run_async(
+        result = await Runner.run(
             initial_agent,
-            input=chat_message.message,
+            input=session_agent_input(session, chat_message.message),
             context=context
         )
         
         # Extract the final response
         response_text = result.final_output or "I'm sorry, I couldn't process your request right now."
         
-        # Generate session ID
-        session_id = str(uuid.uuid4())
-        
-        # Store session
-        sessions_db[session_id] = {
-            "user_type": chat_message.user_type,
-            "last_message": chat_message.message,
-            "last_response": response_text,
-            "context": context.dict(),
-            "timestamp": datetime.now().isoformat()
-        }
+        # Remember this exchange for the next message in the session
+        await save_turn(session_id, session, chat_message.message, response_text, context)
         
         return ChatResponse(
             response=response_text,
@@ -668,18 +1861,162 @@ async def chat_endpoint(chat_message: ChatMessage):
         return ChatResponse(
             response=error_response,
             agent_type="System",
-            session_id=str(uuid.uuid4())
+            session_id=chat_message.session_id or str(uuid.uuid4())
         )
 
+def sse_event(event: str, data: dict) -> str:
+    return f"event: {event}\ndata: {json.dumps(data, default=str)}\n\n"
+
+def raw_item_field(raw_item, field: str):
+    return raw_item.get(field) if isinstance(raw_item, dict) else getattr(raw_item, field, None)
+
+async def chat_stream_events(chat_message: ChatMessage):
+    """Events for /chat/stream: agent, handoff, tool_call, tool_output and delta as the run
+    progresses, then done (or error) with the same fields /chat returns."""
+    with trace("ReadyFlight chat", metadata={"user_type": chat_message.user_type}):
+        with custom_span("chat", {"user_type": chat_message.user_type, "message_chars": len(chat_message.message), "stream": True}) as span:
+            try:
+                session_id, session = await load_session(chat_message)
+                context = AirlineAgentContext(**session["context"])
+
+                faq_answer = faq_fast_path(chat_message)
+                if faq_answer:
+                    await save_turn(session_id, session, chat_message.message, faq_answer, context)
+                    yield sse_event("agent", {"agent": "FAQ Agent"})
+                    yield sse_event("delta", {"text": faq_answer})
+                    yield sse_event("done", {"response": faq_answer, "agent_type": "FAQ Agent", "session_id": session_id})
+                    return
+
+                initial_agent, agent_name = pick_initial_agent(chat_message)
+                yield sse_event("agent", {"agent": agent_name})
+
+                tool_names = {}
+                result = Runner.run_streamed(initial_agent, input=session_agent_input(session, chat_message.message), context=context)
+                try:
+                    async for event in result.stream_events():
+                        if event.type == "raw_response_event" and isinstance(event.data, ResponseTextDeltaEvent):
+                            yield sse_event("delta", {"text": event.data.delta})
+                        elif event.type == "agent_updated_stream_event" and event.new_agent.name != agent_name:
+                            yield sse_event("handoff", {"from": agent_name, "to": event.new_agent.name})
+                            agent_name = event.new_agent.name
+                        elif event.type == "run_item_stream_event" and event.name == "tool_called":
+                            call_id = raw_item_field(event.item.raw_item, "call_id")
+                            tool_names[call_id] = raw_item_field(event.item.raw_item, "name")
+                            yield sse_event("tool_call", {"tool": tool_names[call_id]})
+                        elif event.type == "run_item_stream_event" and event.name == "tool_output":
+                            call_id = raw_item_field(event.item.raw_item, "call_id")
+                            yield sse_event("tool_output", {"tool": tool_names.get(call_id)})
+                finally:
+                    # The client went away mid-run: stop the agents instead of finishing unseen work
+                    if not result.is_complete:
+                        result.cancel()
+
+                response_text = result.final_output or "I'm sorry, I couldn't process your request right now."
+                await save_turn(session_id, session, chat_message.message, response_text, context)
+                span.span_data.data["agent_type"] = agent_name
+                yield sse_event("done", {"response": response_text, "agent_type": agent_name, "session_id": session_id})
+
+            except Exception as e:
+                yield sse_event("error", {"message": f"I apologize, but I'm experiencing some technical difficulties right now. Please try again in a moment. Error: {str(e)}",
+                                          "agent_type": "System", "session_id": chat_message.session_id or str(uuid.uuid4())})
+
+@app.post("/chat/stream")
+async def chat_stream_endpoint(chat_message: ChatMessage):
+    """Same as /chat, but streamed as server-sent events so text shows up while the agents work"""
+    return StreamingResponse(
+        chat_stream_events(chat_message),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
 @app.get("/flights")
 async def get_flights():
     """Get all available flights"""
-    return {"flights": list(flights_db.values())}
+    return {"flights": [{**flight, "available_seats": list(flight["available_seats"])} for flight in await storage.all_flights()]}
 
 @app.get("/bookings") 
 async def get_bookings():
     """Get all bookings (staff only)"""
-    return {"bookings": bookings_db}
+    return {"bookings": {booking["booking_id"]: booking for booking in await storage.bookings()}}
+
+@app.get("/faq/fast-path/stats")
+async def faq_fast_path_stats_endpoint():
+    """Hit rate of the /chat FAQ fast path"""
+    checked = faq_fast_path_stats["checked"]
+    return {
+        **faq_fast_path_stats,
+        "hit_rate": faq_fast_path_stats["hits"] / checked if checked else 0.0,
+        "enabled": FAQ_FAST_PATH_ENABLED,
+        "threshold": FAQ_FAST_PATH_THRESHOLD
+    }
+
+@app.get("/sessions/stats")
+async def session_store_stats_endpoint():
+    """Size, hit rate, expiries and evictions of the chat session store"""
+    lookups = session_store.stats["hits"] + session_store.stats["misses"]
+    return {
+        **session_store.stats,
+        **await session_store.usage(),
+        "hit_rate": session_store.stats["hits"] / lookups if lookups else 0.0,
+        "max_entries": SESSION_MAX_ENTRIES,
+        "max_bytes": SESSION_MAX_BYTES if SESSION_BACKEND != "sqlite" else None,
+        "ttl_seconds": SESSION_TTL_SECONDS,
+        "backend": type(session_store).__name__
+    }
+
+@app.get("/storage/stats")
+async def storage_stats_endpoint():
+    """Bookings, sell-outs and cancellations handled by this worker, and flight lock waits"""
+    return {**storage.stats, "backend": type(storage).__name__}
+
+@app.get("/debug/traces")
+async def recent_traces(limit: int = 20):
+    """Most recent /chat traces, newest first, without their spans"""
+    limit = max(1, min(limit, TRACE_BUFFER_SIZE))
+    return {"traces": [
+        {key: value for key, value in record.items() if key != "spans"} | {"span_count": len(record["spans"])}
+        for record in trace_exporter.recent(limit)
+    ]}
+
+@app.get("/debug/traces/{trace_id}")
+async def trace_detail(trace_id: str):
+    """Every span of one trace: agent turns, model calls, handoffs and tool calls"""
+    record = trace_exporter.get(trace_id)
+    if not record:
+        raise HTTPException(status_code=404, detail="Trace not found")
+    return record
+
+@app.middleware("http")
+async def record_request_metrics(request: Request, call_next):
+    start, status_code = time.perf_counter(), 500
+    try:
+        response = await call_next(request)
+        status_code = response.status_code
+        return response
+    finally:
+        # Label by route template, not raw path, so IDs in URLs don't create new series
+        route = getattr(request.scope.get("route"), "path", "unmatched")
+        metrics.observe("readyflight_http_request_duration_seconds", time.perf_counter() - start,
+                        method=request.method, route=route)
+        metrics.inc("readyflight_http_requests_total", method=request.method, route=route, status=str(status_code))
+
+@app.get("/metrics")
+async def metrics_endpoint():
+    """Prometheus metrics: tool and model latency, counts, errors and token usage per agent"""
+    # The fast path keeps its own stats; export them alongside the live registry
+    existing = MetricsRegistry()
+    existing.counter("readyflight_faq_fast_path_total", "FAQ fast path checks by result")
+    for result, count in faq_fast_path_stats.items():
+        existing.inc("readyflight_faq_fast_path_total", count, result=result)
+    existing.counter("readyflight_session_store_total", "Session lookups, expiries and evictions by result")
+    for result, count in session_store.stats.items():
+        existing.inc("readyflight_session_store_total", count, result=result)
+    usage = await session_store.usage()
+    existing.gauge("readyflight_session_store_entries", "Sessions currently stored")
+    existing.set("readyflight_session_store_entries", usage["entries"])
+    existing.gauge("readyflight_session_store_bytes", "Approximate bytes held by stored sessions")
+    existing.set("readyflight_session_store_bytes", usage["bytes"])
+    return PlainTextResponse(metrics.render() + existing.render(), media_type="text/plain; version=0.0.4")
 
 @app.get("/health")
 async def health_check():
@@ -0,0 +1,328 @@
+"""Offline /chat benchmark for both airline backends, driven by a scripted stand-in model.
+
+Every agent's model is replaced with ScriptedModel, which replays canned tool-calling
+conversations (SCENARIOS) after --latency seconds per model turn, so the real agents,
+tools, database/in-memory stores, metrics and tracing all run without any Gemini call.
+The app is served by an in-process uvicorn on a local port. Requests cycle through the scenarios at each concurrency level; p50/p95/p99 latency and
+throughput are printed and saved as JSON so runs can be compared across commits. With
+--stream, requests go to /chat/stream and the time to the first text delta is reported too.
+
+    python benchmarks/chat_replay.py --app readyflight airline --concurrency 1 8 32 --requests 200
+    python benchmarks/chat_replay.py --baseline chat_replay_abc1234.json
+"""
+import argparse
+import asyncio
+import contextlib
+import datetime
+import importlib.util
+import json
+import math
+import os
+import platform
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+APPS = {
+    "readyflight": os.path.join(ROOT, "ReadyFligh", "backend", "main.py"),
+    "airline": os.path.join(ROOT, "airline_agentic_app", "main.py"),
+}
+BENCH_FLIGHT = "BN900"
+
+# Canned conversations: the user message, who sends it, the tool calls the model makes
+# (one per model turn) and the final reply. Tool names and arguments are the same in both apps.
+SCENARIOS = {
+    "faq": {
+        "message": "What is the baggage policy?",
+        "user_type": "customer",
+        "calls": [("basic_info_tool", {"question": "baggage policy"})],
+        "reply": "Economy includes one 23 kg checked bag.",
+    },
+    "schedule": {
+        "message": "What is the schedule from Bench City to Load Town?",
+        "user_type": "customer",
+        "calls": [("flight_schedule_tool", {"departure": "Bench City", "arrival": "Load Town"})],
+        "reply": f"{BENCH_FLIGHT} departs at 10:00.",
+    },
+    "book": {
+        "message": f"Please book flight {BENCH_FLIGHT} for Bench Passenger",
+        "user_type": "customer",
+        "calls": [("book_flight_tool", {"flight_number": BENCH_FLIGHT, "passenger_name": "Bench Passenger"})],
+        "reply": "You're booked! ✈️",
+    },
+    "check": {
+        "message": "Can you check booking RFNOTAREALID?",
+        "user_type": "customer",
+        "calls": [("check_booking_tool", {"booking_id": "RFNOTAREALID"})],
+        "reply": "I couldn't find that booking.",
+    },
+    "staff_overview": {
+        "message": "Give me the flight status overview",
+        "user_type": "staff",
+        "calls": [("flight_status_overview_tool", {})],
+        "reply": "Here is today's overview.",
+    },
+}
+
+
+def setup_scenario(seats: int) -> dict:
+    """A staff conversation that adds the benchmark flight through the app's own add_flight_tool."""
+    seat_numbers = [f"{row}{letter}" for row in range(1, seats // 6 + 2) for letter in "ABCDEF"][:seats]
+    return {
+        "message": f"Add flight {BENCH_FLIGHT} for the benchmark",
+        "user_type": "staff",
+        "calls": [("add_flight_tool", {
+            "flight_number": BENCH_FLIGHT, "departure": "Bench City", "arrival": "Load Town",
+            "departure_time": "2025-06-08 10:00:00", "arrival_time": "2025-06-08 12:00:00",
+            "price": 100.0, "available_seats": ",".join(seat_numbers),
+        })],
+        "reply": "Flight added.",
+    }
+
+
+def scripted_model_class():
+    from agents import Model, ModelResponse, Usage
+    from openai.types.responses import (
+        Response, ResponseCompletedEvent, ResponseFunctionToolCall, ResponseOutputMessage, ResponseOutputText,
+        ResponseTextDeltaEvent, ResponseUsage,
+    )
+
+    class ScriptedModel(Model):
+        """Plays back the scenario whose message opened the conversation, one step per model turn.
+        Streamed replies arrive word by word, spread over the same --latency."""
+
+        def __init__(self, scripts: dict, latency: float):
+            self.scripts = scripts
+            self.latency = latency
+
+        def next_turn(self, input) -> tuple[str | None, list, int]:
+            items = input if isinstance(input, list) else [{"role": "user", "content": input}]
+            opening = next((item.get("content") for item in items if isinstance(item, dict) and item.get("role") == "user"), "")
+            step = sum(1 for item in items if isinstance(item, dict) and item.get("type") == "function_call_output")
+            script = self.scripts.get(opening, {"calls": [], "reply": "Scripted answer."})
+            input_tokens = len(json.dumps(items, default=str)) // 4
+            if step < len(script["calls"]):
+                name, arguments = script["calls"][step]
+                return None, [ResponseFunctionToolCall(id=f"fc_{step}", call_id=f"call_{step}", type="function_call",
+                                                       name=name, arguments=json.dumps(arguments))], input_tokens
+            message = ResponseOutputMessage(
+                id="msg_scripted", type="message", role="assistant", status="completed",
+                content=[ResponseOutputText(type="output_text", text=script["reply"], annotations=[])],
+            )
+            return script["reply"], [message], input_tokens
+
+        async def get_response(self, system_instructions, input, model_settings, tools, output_schema,
+                               handoffs, tracing, *, previous_response_id=None, conversation_id=None, prompt=None):
+            await asyncio.sleep(self.latency)
+            _, output, input_tokens = self.next_turn(input)
+            usage = Usage(requests=1, input_tokens=input_tokens, output_tokens=20, total_tokens=input_tokens + 20)
+            return ModelResponse(output=output, usage=usage, response_id=None)
+
+        async def stream_response(self, system_instructions, input, model_settings, tools, output_schema,
+                                  handoffs, tracing, *, previous_response_id=None, conversation_id=None, prompt=None):
+            reply, output, input_tokens = self.next_turn(input)
+            words = reply.split(" ") if reply else []
+            sequence = 0
+            if not words:
+                await asyncio.sleep(self.latency)
+            for index, word in enumerate(words):
+                await asyncio.sleep(self.latency / len(words))
+                yield ResponseTextDeltaEvent(type="response.output_text.delta", item_id="msg_scripted", output_index=0,
+                                             content_index=0, delta=word if index == 0 else " " + word,
+                                             logprobs=[], sequence_number=sequence)
+                sequence += 1
+            usage = ResponseUsage(input_tokens=input_tokens, output_tokens=20, total_tokens=input_tokens + 20,
+                                  input_tokens_details={"cached_tokens": 0, "cache_write_tokens": 0}, output_tokens_details={"reasoning_tokens": 0})
+            response = Response(id="resp_scripted", created_at=time.time(), model="scripted", object="response",
+                                output=output, parallel_tool_calls=False, tool_choice="auto", tools=[], usage=usage)
+            yield ResponseCompletedEvent(type="response.completed", response=response, sequence_number=sequence)
+
+    return ScriptedModel
+
+
+def load_app(name: str):
+    path = APPS[name]
+    sys.path.insert(0, os.path.dirname(path))
+    spec = importlib.util.spec_from_file_location(f"{name}_main", path)
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+
+def percentile(sorted_values: list[float], pct: float) -> float:
+    if not sorted_values:
+        return 0.0
+    return sorted_values[max(0, math.ceil(pct / 100 * len(sorted_values)) - 1)]
+
+
+async def post_chat(client, scenario: dict, fast_path: bool, stream: bool = False) -> tuple[float, float, bool]:
+    """Returns (total seconds, seconds to the first text delta, ok). Without --stream the first
+    text arrives with the whole response."""
+    body = {"message": scenario["message"], "user_type": scenario["user_type"], "fast_path": fast_path}
+    start = time.perf_counter()
+    if not stream:
+        response = await client.post("/chat", json=body)
+        elapsed = time.perf_counter() - start
+        return elapsed, elapsed, response.status_code == 200 and response.json().get("agent_type") != "System"
+
+    first_delta, event_type, ok = None, None, False
+    async with client.stream("POST", "/chat/stream", json=body) as response:
+        async for line in response.aiter_lines():
+            if line.startswith("event: "):
+                event_type = line[len("event: "):]
+            if event_type == "delta" and first_delta is None:
+                first_delta = time.perf_counter() - start
+            ok = ok or (event_type == "done" and response.status_code == 200)
+    elapsed = time.perf_counter() - start
+    return elapsed, first_delta if first_delta is not None else elapsed, ok
+
+
+async def run_level(client, scenarios: list[dict], concurrency: int, total: int, fast_path: bool, stream: bool) -> dict:
+    gate = asyncio.Semaphore(concurrency)
+
+    async def one(i: int):
+        async with gate:
+            return await post_chat(client, scenarios[i % len(scenarios)], fast_path, stream)
+
+    start = time.perf_counter()
+    results = await asyncio.gather(*(one(i) for i in range(total)))
+    wall = time.perf_counter() - start
+    latencies = sorted(elapsed for elapsed, _, _ in results)
+    first_text = sorted(ttft for _, ttft, _ in results)
+    return {
+        "concurrency": concurrency,
+        "requests": total,
+        "errors": sum(1 for _, _, ok in results if not ok),
+        "throughput_rps": round(total / wall, 2),
+        "p50_ms": round(percentile(latencies, 50) * 1000, 2),
+        "p95_ms": round(percentile(latencies, 95) * 1000, 2),
+        "p99_ms": round(percentile(latencies, 99) * 1000, 2),
+        "max_ms": round(latencies[-1] * 1000, 2),
+        "ttft_p50_ms": round(percentile(first_text, 50) * 1000, 2),
+        "ttft_p95_ms": round(percentile(first_text, 95) * 1000, 2),
+    }
+
+
+@contextlib.asynccontextmanager
+async def serve(app):
+    """Run the app under uvicorn on a free local port. httpx's ASGITransport buffers whole
+    responses, which would hide streaming, so requests go over a real socket."""
+    import uvicorn
+
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        port = sock.getsockname()[1]
+    server = uvicorn.Server(uvicorn.Config(app, host="127.0.0.1", port=port, log_level="warning", lifespan="off"))
+    task = asyncio.create_task(server.serve())
+    while not server.started:
+        if task.done():
+            task.result()
+        await asyncio.sleep(0.01)
+    try:
+        yield f"http://127.0.0.1:{port}"
+    finally:
+        server.should_exit = True
+        await task
+
+
+async def bench_app(name: str, args) -> list[dict]:
+    import httpx
+
+    main = load_app(name)
+    booking_requests = args.requests * len(args.concurrency) // len(args.scenarios) + 1
+    setup = setup_scenario(booking_requests + 6)
+    scripts = {scenario["message"]: scenario for scenario in [setup] + [SCENARIOS[key] for key in args.scenarios]}
+    ScriptedModel = scripted_model_class()
+    for agent in (main.faq_agent, main.customer_agent, main.staff_agent, main.frontline_agent):
+        # Swap the model behind the metrics wrapper so instrumentation stays in the measured path
+        agent.model.model = ScriptedModel(scripts, args.latency)
+    if hasattr(main, "startup_event"):
+        await main.startup_event()
+
+    limits = httpx.Limits(max_connections=max(args.concurrency), max_keepalive_connections=max(args.concurrency))
+    async with serve(main.app) as base_url, httpx.AsyncClient(base_url=base_url, timeout=None, limits=limits) as client:
+        _, _, ok = await post_chat(client, setup, fast_path=False)
+        if not ok:
+            raise RuntimeError(f"{name}: could not add the benchmark flight")
+        scenarios = [SCENARIOS[key] for key in args.scenarios]
+        await run_level(client, scenarios, 1, len(scenarios), args.fast_path, args.stream)  # warm-up
+        levels = []
+        for concurrency in args.concurrency:
+            level = await run_level(client, scenarios, concurrency, args.requests, args.fast_path, args.stream)
+            levels.append(level)
+            print(f"{name:>12} c={concurrency:<4} {level['throughput_rps']:8.1f} req/s  p50 {level['p50_ms']:8.1f} ms  "
+                  f"p95 {level['p95_ms']:8.1f} ms  p99 {level['p99_ms']:8.1f} ms  first text p50 {level['ttft_p50_ms']:8.1f} ms  "
+                  f"errors {level['errors']}")
+    return levels
+
+
+def git_commit() -> str:
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=ROOT, capture_output=True,
+                              text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return "unknown"
+
+
+def compare(report: dict, baseline_path: str):
+    with open(baseline_path, encoding="utf-8") as f:
+        baseline = json.load(f)
+    print(f"\nvs {baseline.get('commit', '?')} ({baseline_path})")
+    for name, levels in report["apps"].items():
+        before = {level["concurrency"]: level for level in baseline.get("apps", {}).get(name, [])}
+        for level in levels:
+            old = before.get(level["concurrency"])
+            if not old:
+                continue
+            change = lambda key: (level[key] - old[key]) / old[key] * 100 if old[key] else 0.0
+            print(f"{name:>12} c={level['concurrency']:<4} throughput {change('throughput_rps'):+6.1f}%  "
+                  f"p50 {change('p50_ms'):+6.1f}%  p95 {change('p95_ms'):+6.1f}%  p99 {change('p99_ms'):+6.1f}%")
+
+
+async def main_bench():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--app", nargs="+", choices=sorted(APPS), default=sorted(APPS))
+    parser.add_argument("--scenarios", nargs="+", choices=list(SCENARIOS), default=list(SCENARIOS))
+    parser.add_argument("--latency", type=float, default=0.05, help="scripted model latency per turn, in seconds")
+    parser.add_argument("--requests", type=int, default=200, help="requests per concurrency level")
+    parser.add_argument("--concurrency", type=int, nargs="+", default=[1, 8, 32, 64])
+    parser.add_argument("--fast-path", action="store_true", help="let FAQ questions take the no-LLM fast path")
+    parser.add_argument("--stream", action="store_true", help="use /chat/stream and time the first text delta")
+    parser.add_argument("--cache", action="store_true", help="keep the FAQ response cache enabled")
+    parser.add_argument("--no-tracing", action="store_true", help="disable the per-request trace spans")
+    parser.add_argument("--output", help="where to save the JSON results (default: chat_replay_<commit>.json)")
+    parser.add_argument("--baseline", help="earlier results file to compare against")
+    args = parser.parse_args()
+
+    os.environ.setdefault("NEON_DB_URI", f"sqlite:///{tempfile.mkdtemp()}/bench.db")
+    os.environ.setdefault("GEMINI_API_KEY", "bench")
+    os.environ.setdefault("OPENAI_API_KEY", "bench")
+    if not args.cache:
+        os.environ["RESPONSE_CACHE_ENABLED"] = "false"
+    if args.no_tracing:
+        from agents import set_tracing_disabled
+        set_tracing_disabled(True)
+
+    report = {
+        "commit": git_commit(),
+        "timestamp": datetime.datetime.now(datetime.timezone.utc).isoformat(),
+        "python": platform.python_version(),
+        "config": {key: value for key, value in vars(args).items() if key not in ("output", "baseline")},
+        "apps": {},
+    }
+    for name in args.app:
+        report["apps"][name] = await bench_app(name, args)
+
+    output = args.output or f"chat_replay_{report['commit']}.json"
+    with open(output, "w", encoding="utf-8") as f:
+        json.dump(report, f, indent=2)
+    print(f"\nsaved {output}")
+    if args.baseline:
+        compare(report, args.baseline)
+
+
+if __name__ == "__main__":
+    asyncio.run(main_bench())